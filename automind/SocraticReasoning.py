@@ -1,19 +1,53 @@
 # SocraticReasoning.py (c) 2024 Gregory L. Magnusson MIT license
 ################ memory/logs/ for socratic #####################
 # self.socraticlogs_file = './memory/logs/socraticlogs.txt'
-# self.premises_file = './memory/logs/premises.json'
-# self.not_premises_file = './memory/logs/notpremise.json'
+# self.premises_file = './memory/logs/premises.jsonl'
+# self.not_premises_file = './memory/logs/notpremise.jsonl'
 # self.conclusions_file = './memory/logs/conclusions.txt'
 # self.truth_tables_file = './memory/logs/truth.json'
 import logging
 import os
-import pathlib
-import ujson
+import asyncio
+import time
+import inspect
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from webmind.chatter import GPT4o, GroqModel, OllamaModel
+from webmind.chatter import GPT4o, GroqModel, OllamaModel, ChatSession
 from automind.logic import LogicTables
-from memory.memory import create_memory_folders, store_in_stm, DialogEntry
+from automind.convergence import ConvergenceDetector, SIMILARITY_THRESHOLD, PATIENCE
+from memory.memory import create_memory_folders, store_in_stm, DialogEntry, recall_memory
+from memory.persistence import get_persistence
+from memory.jsonlog import append_jsonl, migrate_logs, PREMISES_LOG, NOT_PREMISE_LOG
+from memory.logsink import get_logger, LEVEL_NAMES
 from webmind.api import APIManager
+from webmind.cache import cached_chatter
+from webmind.resilience import ChatterError
+
+REASONING_CONCURRENCY = int(os.environ.get("REASONING_CONCURRENCY", "4"))  # LLM calls in flight per draw_conclusion
+# blocking chatters run here instead of the default executor, which is sized by cpu count rather than network waits
+CHATTER_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="chatter")
+REASONING_DEADLINE = float(os.environ.get("REASONING_DEADLINE", "120"))  # seconds one draw_conclusion may take
+REASONING_RETRIES = int(os.environ.get("REASONING_RETRIES", "3"))  # failed or empty LLM calls retried per draw_conclusion
+
+def accepts(function, name):
+    """
+    True if function takes the keyword name, used to pass the remaining deadline and cache=False only to chatters that take them.
+    """
+    try:
+        return name in inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+
+class Conclusion(str):
+    """
+    Conclusion text returned by draw_conclusion, carrying the outcome of its own request in result and status.
+    """
+    def __new__(cls, text, result):
+        conclusion = super().__new__(cls, text)
+        conclusion.result = result
+        conclusion.status = result["status"]
+        return conclusion
 
 class SocraticReasoning:
     def __init__(self, chatter):
@@ -24,71 +58,57 @@ class SocraticReasoning:
             chatter: An instance of the model used for generating responses.
         """
         self.premises = []  # List to hold premises
-        self.logger = logging.getLogger('SocraticReasoning')
-        self.logger.setLevel(logging.DEBUG)  # Set to DEBUG to capture all SocraticReasoning logs
 
         # Ensure the logs directory exists
         logs_dir = './memory/logs'
         os.makedirs(logs_dir, exist_ok=True)
 
-        # File handler for saving Socratic Reasoning logs
+        # Socratic Reasoning logs go through the shared logsink, one handler per file however many instances exist
         self.socraticlogs_file = './memory/logs/socraticlogs.txt'
-        file_handler = logging.FileHandler(self.socraticlogs_file)
-        file_handler.setLevel(logging.DEBUG)
-        file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(file_formatter)
-
-        # Stream handler to suppress lower-level logs in the terminal
-        stream_handler = logging.StreamHandler()
-        stream_handler.setLevel(logging.CRITICAL)  # Show only critical logs in the terminal
-        stream_formatter = logging.Formatter('%(message)s')
-        stream_handler.setFormatter(stream_formatter)
-
-        # Adding handlers to the logger
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(stream_handler)
+        self.logger = get_logger('SocraticReasoning', [self.socraticlogs_file, './memory/logs/errorlogs.txt'])
 
         # File paths for saving premises, non-premises, conclusions, and truth tables
         self.socraticlogs_file = './memory/logs/socraticlogs.txt'
-        self.premises_file = './memory/logs/premises.json'
-        self.not_premises_file = './memory/logs/notpremise.json'
+        self.premises_file = PREMISES_LOG
+        self.not_premises_file = NOT_PREMISE_LOG
         self.conclusions_file = './memory/logs/conclusions.txt'
         self.truth_tables_file = './memory/logs/truth.json'
 
         self.max_tokens = 100  # Default max tokens for Socratic premise from add_premise(statement)
-        self.chatter = chatter  # Chatter model for generating responses
+        self.recall_k = 3  # Number of relevant memories recalled as context for a new premise, 0 disables recall
+        self.max_rounds = 5  # Premise expansions and conclusion drafts per draw_conclusion
+        self.concurrency = REASONING_CONCURRENCY  # LLM calls draw_conclusion runs at the same time
+        self.deadline = REASONING_DEADLINE  # Seconds before draw_conclusion returns the best conclusion so far
+        self.retry_budget = REASONING_RETRIES  # Failed or empty LLM calls retried per draw_conclusion
+        self.convergence_threshold = SIMILARITY_THRESHOLD  # Similarity at which a premise or draft counts as a near duplicate
+        self.convergence_patience = PATIENCE  # Repeated or near duplicate outputs that stop premise expansion
+        self.last_result = None  # Status and counters of the most recently finished draw_conclusion, each conclusion carries its own
+        self.chatter = cached_chatter(chatter)  # Chatter model for generating responses, repeated prompts are answered from the response cache
         self.logic_tables = LogicTables()  # Logic tables for reasoning
         self.dialogue_history = []  # List to hold the history of dialogues
         self.logical_conclusion = ""  # Variable to store the conclusion
 
         create_memory_folders()  # Ensure memory folders are created
 
-    def socraticlogs(self, message, level='info'):
+    def set_chatter(self, chatter):
         """
-        Logs a message with a specified level.
+        Replaces the model used for generating responses, everything else is kept.
 
         Args:
-            message: The message to be logged.
-            level: The level of logging ('info' or 'error').
+            chatter: An instance of the model used for generating responses.
         """
-        if level == 'info':
-            self.logger.info(message)
-        elif level == 'error':
-            self.logger.error(message)
-        self.log_errors(message, level)  # Save Socratic reasoning to ./memory/logs/errorlogs.txt
+        self.chatter = cached_chatter(chatter)
+        self.socraticlogs(f"Chatter set to: {type(chatter).__name__}")
 
-    def log_errors(self, message, level):
+    def socraticlogs(self, message, level='info'):
         """
-        Stores error logs in ./memory/logs/errorlogs.txt.
+        Logs a message with a specified level.
 
         Args:
-            message: The error message to be logged.
-            level: The level of the error.
+            message: The message to be logged.
+            level: The level of logging ('info' or 'error').
         """
-        error_logs_path = './memory/logs/errorlogs.txt'
-        pathlib.Path(error_logs_path).parent.mkdir(parents=True, exist_ok=True)
-        with open(error_logs_path, 'a') as file:
-            file.write(f"{level.upper()}: {message}\n")
+        self.logger.log(LEVEL_NAMES.get(level, logging.INFO), message)  # Written to socraticlogs.txt and errorlogs.txt
 
     def log_not_premise(self, message, level='info'):
         """
@@ -98,26 +118,16 @@ class SocraticReasoning:
             message: The message to be logged.
             level: The level of logging.
         """
-        not_premises_path = self.not_premises_file
-        pathlib.Path(not_premises_path).parent.mkdir(parents=True, exist_ok=True)
-        entry = {"level": level.upper(), "message": message}
-        try:
-            with open(not_premises_path, 'r') as file:
-                logs = ujson.load(file)
-        except (FileNotFoundError, ValueError):
-            logs = []
+        append_jsonl(self.not_premises_file, {"level": level.upper(), "message": message})
 
-        logs.append(entry)
-        with open(not_premises_path, 'w') as file:
-            ujson.dump(logs, file, indent=2)
-
-    def save_premises(self):
+    def save_premises(self, premises=None):
         """
-        Saves the current list of premises to a JSON file.
+        Appends a list of premises as one line of the premises JSONL log.
+
+        Args:
+            premises: The premises to save, defaults to the pending premises.
         """
-        pathlib.Path(self.premises_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(self.premises_file, 'w') as file:
-            ujson.dump(self.premises, file, indent=2)
+        append_jsonl(self.premises_file, {"premises": list(self.premises if premises is None else premises)})
 
     def add_premise(self, premise):
         """
@@ -144,9 +154,40 @@ class SocraticReasoning:
         """
         return isinstance(statement, str) and len(statement) > 0  # Check if the statement is a non-empty string
 
+    def recall_context(self, premise):
+        """
+        Recalls stored dialog entries and conclusions relevant to a premise.
+
+        Args:
+            premise: The premise to find context for.
+
+        Returns:
+            list: Text snippets from memory, most relevant first.
+        """
+        if self.recall_k <= 0:
+            return []
+        try:
+            return [memory['text'] for memory in recall_memory(premise, k=self.recall_k) if memory['text'] != premise]
+        except Exception as e:
+            self.socraticlogs(f'Memory recall failed: {e}', level='error')
+            return []
+
+    def premise_prompt(self, premise):
+        """
+        Builds the prompt for a new premise from the current premise and relevant recalled memory.
+
+        Args:
+            premise: The current premise.
+
+        Returns:
+            str: The prompt sent to the chatter.
+        """
+        context = self.recall_context(premise)
+        return "".join(f"context: {snippet}\n" for snippet in context) + f"- {premise}"
+
     def generate_new_premise(self, premise):
         """
-        Generates a new premise based on the current premise.
+        Generates a new premise based on the current premise and relevant recalled memory.
 
         Args:
             premise: The current premise.
@@ -154,8 +195,93 @@ class SocraticReasoning:
         Returns:
             str: A new premise generated from the current premise.
         """
-        premise_text = f"- {premise}"
-        new_premise = self.chatter.generate_response(premise_text)
+        new_premise = self.chatter.generate_response(self.premise_prompt(premise))
+        return new_premise.strip()
+
+    async def generate_response_async(self, prompt, semaphore, deadline=None, cache=True, session=None):
+        """
+        Calls the chatter without blocking the event loop, at most semaphore's limit at a time.
+
+        Args:
+            prompt: The prompt for the chatter.
+            semaphore: asyncio.Semaphore bounding the calls of one request.
+            deadline: Optional time.monotonic() value after which the call is cancelled.
+            cache: False makes a fresh provider call even if the response cache holds the prompt.
+            session: Optional ChatSession of the chain the call belongs to.
+
+        Returns:
+            str: The chatter response.
+
+        Raises:
+            asyncio.TimeoutError: If the deadline passes first.
+        """
+        async with semaphore:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            generate_async = getattr(self.chatter, 'generate_response_async', None)
+            if generate_async is not None:
+                if timeout is not None and accepts(generate_async, 'timeout'):
+                    generate_async = functools.partial(generate_async, timeout=timeout)
+                if not cache and accepts(generate_async, 'cache'):
+                    generate_async = functools.partial(generate_async, cache=False)
+                if session is not None and accepts(generate_async, 'session'):
+                    generate_async = functools.partial(generate_async, session=session)
+                # Chatter providers are awaited directly, no worker thread is held for the call
+                return await asyncio.wait_for(generate_async(prompt), timeout)
+            generate = self.chatter.generate_response
+            if timeout is not None and accepts(generate, 'timeout'):
+                # the provider gives up at the deadline too, so the worker thread is released
+                generate = functools.partial(generate, timeout=timeout)
+            if not cache and accepts(generate, 'cache'):
+                generate = functools.partial(generate, cache=False)
+            if session is not None and accepts(generate, 'session'):
+                generate = functools.partial(generate, session=session)
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(loop.run_in_executor(CHATTER_EXECUTOR, generate, prompt), timeout)
+
+    async def stream_response_async(self, prompt, semaphore, on_token, deadline=None, cache=True, session=None):
+        """
+        Streams the chatter response, passing each token to on_token as it arrives.
+
+        Args:
+            prompt: The prompt for the chatter.
+            semaphore: asyncio.Semaphore bounding the calls of one request.
+            on_token: Called with every token of the response.
+            deadline: Optional time.monotonic() value after which the call is cancelled.
+            cache: False makes a fresh provider call even if the response cache holds the prompt.
+            session: Optional ChatSession of the chain the call belongs to.
+
+        Returns:
+            str: The whole chatter response.
+
+        Raises:
+            asyncio.TimeoutError: If the deadline passes first.
+        """
+        async with semaphore:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            parts = []
+            stream_response = self.chatter.stream_response
+            if not cache and accepts(stream_response, 'cache'):
+                stream_response = functools.partial(stream_response, cache=False)
+            if session is not None and accepts(stream_response, 'session'):
+                stream_response = functools.partial(stream_response, session=session)
+
+            async def consume():
+                async for token in stream_response(prompt, timeout=timeout):
+                    parts.append(token)
+                    on_token(token)
+
+            await asyncio.wait_for(consume(), timeout)
+            return "".join(parts)
+
+    async def generate_new_premise_async(self, premise, semaphore, deadline=None, cache=True):
+        """
+        Asynchronous generate_new_premise, memory recall runs in a worker thread.
+
+        Returns:
+            str: A new premise generated from the current premise.
+        """
+        prompt = await asyncio.to_thread(self.premise_prompt, premise)
+        new_premise = await self.generate_response_async(prompt, semaphore, deadline, cache)
         return new_premise.strip()
 
     def challenge_premise(self, premise):
@@ -186,68 +312,261 @@ class SocraticReasoning:
             self.log_not_premise(f'Removed equivalent premise: {p}')  # Log removal of equivalent premise
         self.save_premises()  # Save the updated list of premises
 
-    def draw_conclusion(self):
+    def draw_conclusion(self, premises=None):
         """
         Draws a conclusion based on the current list of premises.
 
+        Args:
+            premises: Premises of this request, defaults to the premises added with add_premise.
+
         Returns:
-            str: The conclusion derived from the premises.
+            Conclusion: The conclusion derived from the premises. Its status tells whether it was validated.
+
+        Raises:
+            RuntimeError: When called from a thread running an event loop, which waiting here would block.
         """
-        if not self.premises:  # Check if there are no premises
-            return "No premises available for logic as conclusion."
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.draw_conclusion_async(premises=premises))
+        raise RuntimeError("draw_conclusion would block the running event loop, await draw_conclusion_async instead")
+
+    async def draw_conclusion_async(self, concurrency=None, deadline=None, retry_budget=None, on_token=None, premises=None):
+        """
+        Draws a conclusion by chaining premise expansions while conclusion drafts run alongside them.
+        Each new premise is expanded again, and each one also starts a draft over the premises gathered so far,
+        so every round asks a different question. The first draft that validates wins and pending calls are cancelled.
+        Failed or empty calls are retried while the retry budget lasts. When the deadline passes,
+        pending calls are cancelled and the best conclusion so far is returned.
+        Expansion also stops once new premises and drafts only repeat or closely resemble earlier ones.
+        A permanent provider error or an open circuit ends the request at once.
+        With on_token, conclusion drafts are streamed from chatters that offer stream_response and every token
+        is passed on as on_token(draft, token), where draft numbers the conclusion drafts of this request.
+        All state of the request is local, so concurrent requests on one instance do not see each other's premises.
 
-        current_premise = self.premises[0]  # Start with the first premise
-        additional_premises_count = 0  # Counter for additional premises
+        Args:
+            concurrency: LLM calls in flight at once, defaults to self.concurrency.
+            deadline: Seconds the request may take, defaults to self.deadline.
+            retry_budget: Failed or empty calls to retry, defaults to self.retry_budget.
+            on_token: Optional callback receiving the streamed tokens of the conclusion drafts.
+            premises: Premises of this request, defaults to the premises added with add_premise, which the request takes over.
 
-        # Generate new premises until a valid conclusion is drawn or the maximum limit is reached
-        while additional_premises_count < 5:
-            new_premise = self.generate_new_premise(current_premise)
-            if not self.parse_statement(new_premise):
-                continue
-            self.premises.append(new_premise)
-            self.save_premises()
-            additional_premises_count += 1
+        Returns:
+            Conclusion: The conclusion text. Its result holds {"conclusion", "status", "premises", "calls", "retries",
+            "calls_saved", "repeats", "similar", "elapsed", "first_token", "error"}, first_token being the seconds
+            until the first streamed token. The status is one of valid, converged, complete, deadline,
+            budget_exhausted, provider_error or no_premises.
+        """
+        started = time.monotonic()
+        if premises is None:
+            # premises added while this request runs belong to the next one
+            premises, self.premises = self.premises, []
+        else:
+            for premise in premises:
+                if not self.parse_statement(premise):
+                    self.log_not_premise(f'Invalid premise: {premise}', level='error')  # Log invalid premise
+            premises = [premise for premise in premises if self.parse_statement(premise)]
+            if premises:
+                self.save_premises(premises)
+        result = {"conclusion": None, "status": None, "premises": premises, "calls": 0, "retries": 0,
+                  "calls_saved": 0, "repeats": 0, "similar": 0, "elapsed": 0.0, "first_token": None, "error": None}
+        if not premises:  # Check if there are no premises
+            result["status"] = "no_premises"
+            self.last_result = result
+            return Conclusion("No premises available for logic as conclusion.", result)
+
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+        deadline_at = started + (self.deadline if deadline is None else deadline)
+        retries_left = self.retry_budget if retry_budget is None else retry_budget
+        counters = {"calls": 0, "retries": 0, "expansions": 0, "drafts": 0, "drafted": 0}
+        conclusion = ""
+        status = None
+        exhausted = False
+        error = None
+        detector = ConvergenceDetector(self.convergence_threshold, self.convergence_patience)
+        for premise in premises:
+            detector.observe(premise)
+        stream = on_token is not None and hasattr(self.chatter, 'stream_response')
+        first_token = None
+
+        def token_callback(draft):
+            def forward(token):
+                nonlocal first_token
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                on_token(draft, token)
+            return forward
+
+        sent = set()
+
+        def shareable(prompt, cache):
+            # a prompt sent before in this request must not share a response with its earlier copy,
+            # through the cache or an upstream call in flight, or the detector would count the copy as agreement
+            first = prompt not in sent
+            sent.add(prompt)
+            return cache and first
+
+        # expansions follow one another and continue one chat session, each draft branches off it
+        chain = ChatSession()
+
+        async def expand(premise, cache):
+            prompt = await asyncio.to_thread(self.premise_prompt, premise)
+            cache = shareable(prompt, cache)
+            return (await self.generate_response_async(prompt, semaphore, deadline_at, cache, chain)).strip()
+
+        async def draft(known, number, session, cache):
+            prompt = self.conclusion_prompt(known)
+            cache = shareable(prompt, cache)
+            if stream:
+                return (await self.stream_response_async(prompt, semaphore, token_callback(number), deadline_at, cache, session)).strip()
+            return (await self.generate_response_async(prompt, semaphore, deadline_at, cache, session)).strip()
+
+        tasks = []
+        pending = {}
+
+        def start(kind, *args, cache=True):
+            # a retry follows a failed or empty answer and always asks the provider, shareable keeps repeats apart
+            task = asyncio.create_task(expand(*args, cache) if kind == 'premise' else draft(*args, cache), name=kind)
+            tasks.append(task)
+            pending[task] = args
+
+        def next_round(premise):
+            # a draft over every premise known now, and the expansion of the newest premise
+            if counters["drafts"] < self.max_rounds and counters["drafted"] < len(premises):
+                start('conclusion', list(premises), counters["drafts"], chain.fork())
+                counters["drafts"] += 1
+                counters["drafted"] = len(premises)  # a repeated premise adds nothing new to draft from
+            if counters["expansions"] < self.max_rounds:
+                start('premise', premise)
+                counters["expansions"] += 1
+
+        next_round(premises[0])  # Start with the first premise
+        try:
+            while pending and status is None:
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    status = 'deadline'
+                    break
+                done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    kind = task.get_name()
+                    args = pending.pop(task)
+                    counters["calls"] += 1
+                    try:
+                        text = task.result()
+                    except asyncio.TimeoutError:
+                        continue  # the deadline check above ends the request
+                    except ChatterError as e:
+                        self.socraticlogs(f'Reasoning call failed: {e}', level='error')
+                        if not e.transient:
+                            # the provider is tripped or refused the request, more calls would fail the same way
+                            error = e
+                            status = 'provider_error'
+                            break
+                        text = ""
+                    except Exception as e:
+                        self.socraticlogs(f'Reasoning call failed: {e}', level='error')
+                        text = ""
+                    if kind == 'premise' and self.parse_statement(text):
+                        if not detector.is_known(text):  # Repeated premises are not added again
+                            premises.append(text)
+                            self.save_premises(premises)
+                        if detector.observe(text):
+                            status = 'converged'
+                            break
+                        next_round(text)  # the next round continues from the new premise
+                    elif kind == 'conclusion' and text:
+                        conclusion = text  # Store the conclusion
+                        converged = detector.observe(text)
+                        if self.validate_conclusion(conclusion):  # Validate the conclusion
+                            status = 'valid'
+                            break
+                        if converged:
+                            status = 'converged'
+                            break
+                        self.log_not_premise('Invalid conclusion. Generating more premises.', level='error')
+                    elif retries_left > 0:
+                        retries_left -= 1
+                        counters["retries"] += 1
+                        start(kind, *args, cache=False)
+                    else:
+                        exhausted = True
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in tasks:
+                if task.done() and not task.cancelled():
+                    task.exception()  # calls finished in the same batch as the one that ended the request
+        if status is None:
+            status = 'budget_exhausted' if exhausted else 'complete'
+        if status != 'valid':
+            self.socraticlogs(f'Conclusion not validated, status: {status}')
+        result.update({
+            "conclusion": conclusion or None,
+            "status": status,
+            "calls": counters["calls"],
+            "retries": counters["retries"],
+            # calls of a full run of max_rounds expansions and drafts that were never started
+            "calls_saved": max(0, 2 * self.max_rounds - len(tasks)),
+            "repeats": detector.repeats,
+            "similar": detector.similar,
+            "elapsed": time.monotonic() - started,
+            "first_token": first_token,
+            "error": str(error) if error else None,
+        })
+        self.last_result = result
+        if not conclusion:
+            # nothing was drafted, keep the truth tables clean
+            self.logical_conclusion = f"No conclusion reached ({status})."
+            return Conclusion(self.logical_conclusion, result)
+        self.logical_conclusion = conclusion
+        return Conclusion(self.record_conclusion(premises, conclusion), result)
+
+    def conclusion_prompt(self, premises):
+        """
+        Builds the prompt for a conclusion draft from the premises gathered so far.
 
-            # Use the current premise as the input (knowledge) for generating a response
-            raw_response = self.chatter.generate_response(current_premise)
+        Args:
+            premises: The premises of the request, the original ones first.
 
-            # Process the response to get the conclusion
-            conclusion = raw_response.strip()
+        Returns:
+            str: The prompt sent to the chatter.
+        """
+        return "\n".join(premises)
 
-            self.logical_conclusion = conclusion  # Store the conclusion
+    def record_conclusion(self, premises, conclusion):
+        """
+        Saves the conclusion with its premises and records it as a truth.
 
-            if self.validate_conclusion():  # Validate the conclusion
-                break
-            else:
-                self.log_not_premise('Invalid conclusion. Generating more premises.', level='error')
+        Args:
+            premises: The premises the conclusion was drawn from.
+            conclusion: The conclusion.
 
+        Returns:
+            str: The conclusion.
+        """
         # Save the conclusion along with premises
-        conclusion_entry = {"premises": self.premises, "conclusion": self.logical_conclusion}
-        pathlib.Path(self.premises_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(self.premises_file, 'w') as file:
-            ujson.dump(conclusion_entry, file, indent=2)
+        append_jsonl(self.premises_file, {"premises": list(premises), "conclusion": conclusion})
 
         # Log the conclusion to conclusions.txt
-        pathlib.Path(self.conclusions_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(self.conclusions_file, 'a') as file:
-            file.write(f"Premises: {self.premises}\nConclusion: {self.logical_conclusion}\n")
+        get_persistence().append_text(self.conclusions_file, f"Premises: {premises}\nConclusion: {conclusion}\n")
 
         # Save the valid conclusion as a truth
-        self.save_truth(self.logical_conclusion)
-
-        # Clear the premises list for the next round
-        self.premises = []
+        self.save_truth(conclusion)
 
-        return self.logical_conclusion  # Return the conclusion
+        return conclusion  # Return the conclusion
 
-    def validate_conclusion(self):
+    def validate_conclusion(self, conclusion=None):
         """
-        Validates the logical conclusion.
+        Validates a conclusion.
+
+        Args:
+            conclusion: The conclusion to validate, defaults to the last conclusion drawn.
 
         Returns:
             bool: True if the conclusion is valid, False otherwise.
         """
-        return self.logic_tables.tautology(self.logical_conclusion)  # Validate using logic tables
+        return self.logic_tables.tautology(self.logical_conclusion if conclusion is None else conclusion)  # Validate using logic tables
 
     def save_truth(self, truth):
         """
@@ -260,10 +579,7 @@ class SocraticReasoning:
             "truth": truth,
             "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-        pathlib.Path(self.truth_tables_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(self.truth_tables_file, 'a') as file:
-            ujson.dump(truth_tables_entry, file, indent=2)
-            file.write("\n")
+        get_persistence().append_json(self.truth_tables_file, truth_tables_entry, indent=2)
 
     def update_logic_tables(self, variables, expressions, valid_truths):
         """
@@ -284,16 +600,13 @@ class SocraticReasoning:
             "expressions": expressions,
             "valid_truths": valid_truths
         }
-        pathlib.Path(self.truth_tables_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(self.truth_tables_file, 'w') as file:
-            ujson.dump(truth_tables_entry, file, indent=2)
+        persistence = get_persistence()
+        persistence.write_json(self.truth_tables_file, truth_tables_entry, indent=2)
 
         # Save a timestamped file in ./memory/truth
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         belief_timestamp_file = f'./memory/truth/belief_{timestamp}.json'
-        pathlib.Path(belief_timestamp_file).parent.mkdir(parents=True, exist_ok=True)
-        with open(belief_timestamp_file, 'w') as file:
-            ujson.dump(truth_tables_entry, file, indent=2)
+        persistence.write_json(belief_timestamp_file, truth_tables_entry, indent=2)
 
         # Prepare and save the structured truth log for training
         structured_truth = {
@@ -304,10 +617,7 @@ class SocraticReasoning:
             "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         truth_log_path = './memory/truth/truth_log.json'
-        pathlib.Path(truth_log_path).parent.mkdir(parents=True, exist_ok=True)
-        with open(truth_log_path, 'a') as file:
-            ujson.dump(structured_truth, file, indent=2)
-            file.write("\n")
+        persistence.append_json(truth_log_path, structured_truth, indent=2)
 
         # Add a log entry to confirm the update
         self.logger.info("Updated logic tables: %s", truth_tables_entry)
@@ -365,6 +675,8 @@ if __name__ == "__main__":
     else:
         raise ValueError("No suitable API key found. Please add an API key.")
 
+    create_memory_folders()
+    migrate_logs()  # convert the JSON array logs of earlier versions before anything appends to them
     socratic_reasoning = SocraticReasoning(chatter)  # Initialize SocraticReasoning with the selected model
 
     # Example usage
@@ -5,7 +5,7 @@ import logging
 from automind.SocraticReasoning import SocraticReasoning
 from automind.logic import LogicTables
 from memory.memory import store_in_stm, DialogEntry
-from webmind.chatter import GPT4o, Groq
+from webmind.chatter import GPT4o
 from webmind.api import APIManager  # ensure this import statement is added
 
 class AGI:
@@ -14,6 +14,11 @@ class AGI:
         self.chatter = chatter
         self.reasoning = SocraticReasoning(self.chatter)
 
+    def set_chatter(self, chatter):
+        # Swap the model, SocraticReasoning keeps its premises, logic tables and logs
+        self.chatter = chatter
+        self.reasoning.set_chatter(chatter)
+
     def learn_from_data(self, data):
         # Learn from input data
         proposition_p = data  # For simplicity, treat the entire input as one proposition
@@ -24,8 +29,7 @@ class AGI:
         # Make decisions based on propositions
         self.reasoning.add_premise(proposition_p)
         self.reasoning.add_premise(proposition_q)
-        self.reasoning.draw_conclusion()
-        return self.reasoning.logical_conclusion
+        return self.reasoning.draw_conclusion()
 
 class EasyAGI:
     def __init__(self):
@@ -2,6 +2,7 @@
 # draw_conclusion from perceive_environment(self)
 import logging
 from memory.memory import create_memory_folders, store_in_stm, DialogEntry
+from memory.jsonlog import migrate_logs
 from automind.agi import AGI
 from webmind.chatter import GPT4o, GroqModel
 
@@ -21,6 +22,12 @@ class FundamentalAGI:
     def initialize_agi(self, chatter):
         return AGI(chatter)
 
+    def set_chatter(self, chatter):
+        """
+        swap the model used for reasoning without rebuilding the AGI
+        """
+        self.agi.set_chatter(chatter)
+
     def main_loop(self):
         """
         interact with environment for decision
@@ -30,8 +37,7 @@ class FundamentalAGI:
             if environment_data.lower() == 'exit':
                 break
 
-            self.agi.reasoning.add_premise(environment_data)
-            conclusion = self.agi.reasoning.draw_conclusion()
+            conclusion = self.agi.reasoning.draw_conclusion(premises=[environment_data])
             self.communicate_response(conclusion)
 
             entry = DialogEntry(environment_data, conclusion)
@@ -53,10 +59,17 @@ class FundamentalAGI:
         print(conclusion)
 
     def get_conclusion_from_agi(self, prompt):
-        self.agi.reasoning.add_premise(prompt)
-        conclusion = self.agi.reasoning.draw_conclusion()
+        conclusion = self.agi.reasoning.draw_conclusion(premises=[prompt])
         return conclusion
 
+    async def get_conclusion_from_agi_async(self, prompt, on_token=None):
+        """
+        draw the conclusion on the calling event loop with concurrent chatter calls
+        on_token(draft, token) receives the streamed tokens of the conclusion drafts
+        the prompt is passed as the premise of its own request so concurrent requests stay apart
+        """
+        return await self.agi.reasoning.draw_conclusion_async(on_token=on_token, premises=[prompt])
+
 def main():
     openai_key = input("Enter OpenAI API Key: ").strip()
     groq_key = input("Enter Groq API Key: ").strip()
@@ -69,6 +82,8 @@ def main():
         print("No suitable API key found. Exiting.")
         return
     
+    create_memory_folders()
+    migrate_logs()  # one time conversion of the JSON array logs in ./memory/logs to JSONL, before anything appends to them
     fundamental_agi = FundamentalAGI(chatter)
     fundamental_agi.main_loop()
 
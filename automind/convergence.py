@@ -0,0 +1,103 @@
+# convergence.py (c) 2024 Gregory L. Magnusson MIT license
+# convergence detection for SocraticReasoning premise expansion
+# every premise and conclusion draft is normalized, kept as is for exact repeats and
+# reduced to a MinHash signature over 64-bit hashed word shingles for cheap near duplicate detection
+# once the last few outputs only repeat or closely resemble earlier ones the expansion has converged
+import re
+import hashlib
+import random
+
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 32
+SIMILARITY_THRESHOLD = 0.8
+PATIENCE = 2
+
+MERSENNE_PRIME = (1 << 61) - 1
+NORMALIZE_PATTERN = re.compile(r"[^\w\s]")
+
+# fixed seed so signatures are comparable across requests and processes
+_random = random.Random(1729)
+PERMUTATIONS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+def normalize(text):
+    """
+    Lowercase text, drop punctuation and collapse whitespace.
+    """
+    return " ".join(NORMALIZE_PATTERN.sub(" ", text.lower()).split())
+
+def shingle_hash(text):
+    """
+    64-bit hash of a shingle, stable across processes unlike hash().
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+def shingles(text, size=SHINGLE_WORDS):
+    """
+    Hashed word shingles of normalized text, short texts give a single shingle.
+    """
+    words = text.split()
+    if len(words) <= size:
+        return {shingle_hash(text)}
+    return {shingle_hash(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+def minhash(values):
+    return tuple(min((a * value + b) % MERSENNE_PRIME for value in values) for a, b in PERMUTATIONS)
+
+def similarity(first, second):
+    """
+    Estimated Jaccard similarity of two MinHash signatures.
+    """
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+class ConvergenceDetector:
+    """
+    Tracks the outputs of one reasoning request and reports when they stop changing.
+
+    Args:
+        threshold: Estimated Jaccard similarity at which an output counts as a near duplicate.
+        patience: Consecutive repeated or near duplicate outputs that mean convergence.
+    """
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, patience=PATIENCE):
+        self.threshold = threshold
+        self.patience = patience
+        self.seen = set()  # normalized outputs, compared as strings so distinct outputs never collide
+        self.signatures = []
+        self.stale = 0
+        self.observed = 0
+        self.repeats = 0
+        self.similar = 0
+
+    def is_known(self, text):
+        """
+        True if text repeats an observed output after normalization.
+        """
+        return normalize(text) in self.seen
+
+    def observe(self, text):
+        """
+        Record one premise or conclusion draft.
+
+        Returns:
+            bool: True once the last patience outputs were all repeats or near duplicates.
+        """
+        self.observed += 1
+        normalized = normalize(text)
+        if normalized in self.seen:
+            self.repeats += 1
+            self.stale += 1
+        else:
+            self.seen.add(normalized)
+            signature = minhash(shingles(normalized))
+            if any(similarity(signature, seen) >= self.threshold for seen in self.signatures):
+                self.similar += 1
+                self.stale += 1
+            else:
+                self.stale = 0
+            self.signatures.append(signature)
+        return self.converged()
+
+    def converged(self):
+        return self.stale >= self.patience
+
+    def counters(self):
+        return {"observed": self.observed, "repeats": self.repeats, "similar": self.similar}
@@ -0,0 +1,345 @@
+# decision.py (c) 2024 Gregory L. Magnusson MIT license
+# decision procedures for tautology, validity, equivalence and satisfiability of LogicTables expressions
+# small expressions are decided by enumerating a packed truth table from truthtable.py
+# larger expressions are built into a reduced ordered binary decision diagram (BDD)
+# the BDD keeps a unique table so equal functions share one node and memoizes every if-then-else
+# a BDD that grows past BDD_NODE_LIMIT nodes is abandoned for a DPLL search over a Tseitin encoding
+# every procedure returns a counterexample or satisfying assignment instead of only True or False
+from automind.expression import compile_expression
+from automind.truthtable import TruthTable
+
+# expressions over at most this many variables are decided by enumerating the truth table
+ENUMERATION_VARIABLES = 12
+BDD_NODE_LIMIT = 500000
+
+FALSE = 0
+TRUE = 1
+
+class NodeLimitExceeded(Exception):
+    """
+    Raised when a BDD grows past its node limit.
+    """
+
+class BDD:
+    """
+    Reduced ordered binary decision diagram manager.
+    Nodes are integers, 0 and 1 are the constants and every other node is (level, low, high) in self.nodes.
+    Variables are ordered by the order they were declared in.
+    """
+    def __init__(self, variables=(), node_limit=BDD_NODE_LIMIT):
+        self.node_limit = node_limit
+        self.variables = []
+        self.levels = {}
+        self.clear()
+        for variable in variables:
+            self.declare(variable)
+
+    def clear(self):
+        """
+        Drop every node and cached result, keeping the declared variables.
+        """
+        # terminals sit below every variable level
+        self.nodes = [(float("inf"), FALSE, FALSE), (float("inf"), TRUE, TRUE)]
+        self.unique = {}
+        self.computed = {}
+        self.built = {}
+
+    def declare(self, variable):
+        """
+        Add variable at the bottom of the order, existing nodes keep their meaning.
+        """
+        if variable not in self.levels:
+            self.levels[variable] = len(self.variables)
+            self.variables.append(variable)
+
+    def make(self, level, low, high):
+        if low == high:
+            return low
+        key = (level, low, high)
+        node = self.unique.get(key)
+        if node is None:
+            if len(self.nodes) >= self.node_limit:
+                raise NodeLimitExceeded(f"BDD exceeded {self.node_limit} nodes")
+            node = len(self.nodes)
+            self.nodes.append(key)
+            self.unique[key] = node
+        return node
+
+    def variable(self, name):
+        """
+        Node of a declared variable. Raises KeyError for undeclared names.
+        """
+        return self.make(self.levels[name], FALSE, TRUE)
+
+    def ite(self, f, g, h):
+        """
+        If f then g else h, the single operation every connective is built from.
+        """
+        if f == TRUE:
+            return g
+        if f == FALSE:
+            return h
+        if g == h:
+            return g
+        if g == TRUE and h == FALSE:
+            return f
+        key = (f, g, h)
+        node = self.computed.get(key)
+        if node is not None:
+            return node
+        level = min(self.nodes[f][0], self.nodes[g][0], self.nodes[h][0])
+        f0, f1 = self._cofactors(f, level)
+        g0, g1 = self._cofactors(g, level)
+        h0, h1 = self._cofactors(h, level)
+        node = self.make(level, self.ite(f0, g0, h0), self.ite(f1, g1, h1))
+        self.computed[key] = node
+        return node
+
+    def _cofactors(self, node, level):
+        node_level, low, high = self.nodes[node]
+        if node_level == level:
+            return low, high
+        return node, node
+
+    def negate(self, f):
+        return self.ite(f, FALSE, TRUE)
+
+    def apply(self, operator, f, g):
+        if operator == "and":
+            return self.ite(f, g, FALSE)
+        if operator == "or":
+            return self.ite(f, TRUE, g)
+        if operator == "xor":
+            return self.ite(f, self.negate(g), g)
+        if operator == "nand":
+            return self.negate(self.ite(f, g, FALSE))
+        if operator == "nor":
+            return self.negate(self.ite(f, TRUE, g))
+        if operator == "implication":
+            return self.ite(f, g, TRUE)
+        raise ValueError(f"Unknown operator: {operator}")
+
+    def build(self, tree):
+        """
+        Node of a parsed expression tree. Raises KeyError for undeclared variables.
+        """
+        kind = tree[0]
+        if kind == "var":
+            return self.variable(tree[1])
+        if kind == "const":
+            return TRUE if tree[1] else FALSE
+        if kind == "not":
+            return self.negate(self.build(tree[1]))
+        return self.apply(kind, self.build(tree[1]), self.build(tree[2]))
+
+    def expression(self, expression):
+        """
+        Node of an expression string, built once per manager.
+        """
+        node = self.built.get(expression)
+        if node is None:
+            node = self.build(compile_expression(expression).tree)
+            self.built[expression] = node
+        return node
+
+    def find(self, f, value):
+        """
+        Return an assignment of the declared variables making f equal value, or None if there is none.
+        Variables not on the path are set to True.
+        """
+        target = TRUE if value else FALSE
+        if f == target:
+            return {variable: True for variable in self.variables}
+        if f in (TRUE, FALSE):
+            return None
+        assignment = {}
+        node = f
+        while node not in (TRUE, FALSE):
+            level, low, high = self.nodes[node]
+            # in a reduced diagram every non-terminal node reaches both terminals
+            if high == target or (high not in (TRUE, FALSE) and low != target):
+                assignment[self.variables[level]] = True
+                node = high
+            else:
+                assignment[self.variables[level]] = False
+                node = low
+        return {variable: assignment.get(variable, True) for variable in self.variables}
+
+def tseitin(tree, numbers, clauses):
+    """
+    Add CNF clauses defining a fresh literal equal to tree and return that literal.
+    Variables are numbered through numbers, a dict shared across calls that also holds the next free number.
+    """
+    kind = tree[0]
+    if kind == "var":
+        if tree[1] not in numbers:
+            numbers[tree[1]] = numbers["#next"]
+            numbers["#next"] += 1
+        return numbers[tree[1]]
+    if kind == "const":
+        if "#true" not in numbers:
+            numbers["#true"] = numbers["#next"]
+            numbers["#next"] += 1
+            clauses.append([numbers["#true"]])
+        return numbers["#true"] if tree[1] else -numbers["#true"]
+    if kind == "not":
+        return -tseitin(tree[1], numbers, clauses)
+    a = tseitin(tree[1], numbers, clauses)
+    b = tseitin(tree[2], numbers, clauses)
+    negated = kind in ("nand", "nor")
+    if kind == "implication":
+        kind, a = "or", -a
+    elif negated:
+        kind = "and" if kind == "nand" else "or"
+    x = numbers["#next"]
+    numbers["#next"] += 1
+    if kind == "and":
+        clauses.extend([[-x, a], [-x, b], [x, -a, -b]])
+    elif kind == "or":
+        clauses.extend([[x, -a], [x, -b], [-x, a, b]])
+    else:
+        clauses.extend([[-x, a, b], [-x, -a, -b], [x, -a, b], [x, a, -b]])
+    return -x if negated else x
+
+def dpll(clauses, order):
+    """
+    Decide a CNF formula with unit propagation and chronological backtracking.
+
+    Args:
+        clauses: List of clauses, each a list of non-zero integer literals.
+        order: Variable numbers to branch on first.
+
+    Returns:
+        dict: Satisfying values by variable number, or None if the formula is unsatisfiable.
+    """
+    values = {}
+    trail = []
+    decisions = []
+    branch_order = list(order) + sorted({abs(literal) for clause in clauses for literal in clause} - set(order))
+
+    def assign(literal):
+        values[abs(literal)] = literal > 0
+        trail.append(literal)
+
+    def propagate():
+        changed = True
+        while changed:
+            changed = False
+            for clause in clauses:
+                unassigned = None
+                open_literals = 0
+                for literal in clause:
+                    value = values.get(abs(literal))
+                    if value is None:
+                        unassigned = literal
+                        open_literals += 1
+                    elif value == (literal > 0):
+                        break
+                else:
+                    if open_literals == 0:
+                        return False
+                    if open_literals == 1:
+                        assign(unassigned)
+                        changed = True
+        return True
+
+    while True:
+        if not propagate():
+            while decisions:
+                position, literal, flipped = decisions.pop()
+                for undone in trail[position:]:
+                    del values[abs(undone)]
+                del trail[position:]
+                if not flipped:
+                    decisions.append((position, -literal, True))
+                    assign(-literal)
+                    break
+            else:
+                return None
+            continue
+        variable = next((number for number in branch_order if number not in values), None)
+        if variable is None:
+            return values
+        decisions.append((len(trail), variable, False))
+        assign(variable)
+
+def _variables(expression, variables):
+    """
+    Return the variable order for expression. Raises KeyError when it uses a name outside variables.
+    """
+    used = compile_expression(expression).variables
+    if variables is None:
+        return list(used)
+    variables = list(variables)
+    for name in used:
+        if name not in variables:
+            raise KeyError(name)
+    return variables
+
+def find_assignment(expression, value=True, variables=None, bdd=None, table=None):
+    """
+    Return an assignment under which expression evaluates to value, or None if there is none.
+
+    Args:
+        expression: Expression string.
+        value: The result the assignment should produce.
+        variables: Variables the assignment ranges over, defaults to those used by expression.
+        bdd: Optional BDD manager to reuse, its variables must already include the expression's variables.
+        table: Optional TruthTable over exactly variables to enumerate on instead of building one.
+
+    Returns:
+        dict: Variable name to boolean, or None.
+    """
+    variables = _variables(expression, variables)
+    if len(variables) <= ENUMERATION_VARIABLES:
+        if table is None:
+            table = TruthTable(variables)
+        column = table.evaluate(expression)
+        found = column if value else table.mask ^ column
+        if not found:
+            return None
+        bit = (found & -found).bit_length() - 1
+        return {name: bool((table.columns[name] >> bit) & 1) for name in variables}
+    if bdd is None:
+        bdd = BDD(variables)
+    try:
+        return bdd.find(bdd.expression(expression), value)
+    except NodeLimitExceeded:
+        bdd.clear()
+    numbers = {"#next": 1}
+    clauses = []
+    for name in variables:
+        tseitin(("var", name), numbers, clauses)
+    root = tseitin(compile_expression(expression).tree, numbers, clauses)
+    clauses.append([root if value else -root])
+    model = dpll(clauses, [numbers[name] for name in variables])
+    if model is None:
+        return None
+    return {name: model.get(numbers[name], True) for name in variables}
+
+def counterexample(expression, variables=None, bdd=None, table=None):
+    """
+    Return an assignment falsifying expression, or None if expression is a tautology.
+    """
+    return find_assignment(expression, False, variables, bdd, table)
+
+def is_tautology(expression, variables=None, bdd=None, table=None):
+    return counterexample(expression, variables, bdd, table) is None
+
+def satisfying_assignment(expression, variables=None, bdd=None, table=None):
+    """
+    Return an assignment satisfying expression, or None if expression is unsatisfiable.
+    """
+    return find_assignment(expression, True, variables, bdd, table)
+
+def is_satisfiable(expression, variables=None, bdd=None, table=None):
+    return satisfying_assignment(expression, variables, bdd, table) is not None
+
+def difference(first, second, variables=None, bdd=None, table=None):
+    """
+    Return an assignment on which first and second differ, or None if they are equivalent.
+    """
+    return find_assignment(f"xor(({first}), ({second}))", True, variables, bdd, table)
+
+def equivalent(first, second, variables=None, bdd=None, table=None):
+    return difference(first, second, variables, bdd, table) is None
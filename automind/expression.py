@@ -0,0 +1,215 @@
+# expression.py (c) 2024 Gregory L. Magnusson MIT license
+# safe parser and compiler for the boolean expressions used by LogicTables
+# operators: not, and, nand, xor, or, nor, implication as infix keywords or as calls like xor(A, B)
+# precedence from tightest to loosest: not, and/nand, xor, or/nor, implication (right associative)
+# an expression is parsed once into a tree of tuples and compiled into a python function
+# compiled expressions are cached per expression string so evaluation never parses or calls eval() on input
+# column_function compiles the same tree to bitwise operations over whole truth table columns packed in ints
+import re
+import functools
+
+BINARY_OPERATORS = ("and", "nand", "xor", "or", "nor", "implication")
+CONSTANTS = {"True": True, "False": False, "true": True, "false": False}
+TOKEN_PATTERN = re.compile(r"\s*(?:(\()|(\))|(,)|([A-Za-z_][A-Za-z0-9_]*)|(\S))")
+
+# infix binding power of each binary operator, higher binds tighter
+BINDING_POWER = {
+    "implication": 1,
+    "or": 2,
+    "nor": 2,
+    "xor": 3,
+    "and": 4,
+    "nand": 4,
+}
+
+# python source templates used to compile a parsed expression
+BOOLEAN_TEMPLATES = {
+    "not": "(not {0})",
+    "and": "({0} and {1})",
+    "or": "({0} or {1})",
+    "xor": "({0} != {1})",
+    "nand": "(not ({0} and {1}))",
+    "nor": "(not ({0} or {1}))",
+    "implication": "(not {0} or {1})",
+}
+
+# bitwise templates where each operand is a column of packed bits and mask has one bit set per row
+BITWISE_TEMPLATES = {
+    "not": "(mask ^ {0})",
+    "and": "({0} & {1})",
+    "or": "({0} | {1})",
+    "xor": "({0} ^ {1})",
+    "nand": "(mask ^ ({0} & {1}))",
+    "nor": "(mask ^ ({0} | {1}))",
+    "implication": "((mask ^ {0}) | {1})",
+}
+
+class ExpressionError(ValueError):
+    """
+    Raised when an expression cannot be parsed.
+    """
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None:
+            break
+        if match.group(5):
+            raise ExpressionError(f"Unexpected character '{match.group(5)}' in '{expression}'")
+        tokens.append(match.group(match.lastindex))
+        position = match.end()
+    return tokens
+
+class Parser:
+    """
+    Pratt parser producing ('var', name), ('const', value), ('not', operand) or (operator, left, right).
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def advance(self):
+        token = self.peek()
+        if token is None:
+            raise ExpressionError(f"Unexpected end of '{self.expression}'")
+        self.position += 1
+        return token
+
+    def expect(self, token):
+        if self.advance() != token:
+            raise ExpressionError(f"Expected '{token}' in '{self.expression}'")
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("Empty expression")
+        tree = self.parse_expression(0)
+        if self.peek() is not None:
+            raise ExpressionError(f"Unexpected '{self.peek()}' in '{self.expression}'")
+        return tree
+
+    def parse_expression(self, minimum_power):
+        left = self.parse_prefix()
+        while True:
+            operator = self.peek()
+            power = BINDING_POWER.get(operator)
+            if power is None or power <= minimum_power:
+                return left
+            self.advance()
+            # implication is right associative so its right side may hold another implication
+            right = self.parse_expression(power - 1 if operator == "implication" else power)
+            left = (operator, left, right)
+
+    def parse_prefix(self):
+        token = self.advance()
+        if token == "(":
+            tree = self.parse_expression(0)
+            self.expect(")")
+            return tree
+        if token == "not":
+            if self.peek() == "(":
+                self.advance()
+                operand = self.parse_expression(0)
+                self.expect(")")
+                return ("not", operand)
+            return ("not", self.parse_expression(len(BINDING_POWER)))
+        if token in BINARY_OPERATORS:
+            # call form such as xor(A, B)
+            self.expect("(")
+            left = self.parse_expression(0)
+            self.expect(",")
+            right = self.parse_expression(0)
+            self.expect(")")
+            return (token, left, right)
+        if token in CONSTANTS:
+            return ("const", CONSTANTS[token])
+        if token in (")", ","):
+            raise ExpressionError(f"Unexpected '{token}' in '{self.expression}'")
+        return ("var", token)
+
+def parse(expression):
+    return Parser(expression).parse()
+
+def tree_variables(tree, found=None):
+    """
+    Return the variable names of a parsed expression in order of first appearance.
+    """
+    if found is None:
+        found = []
+    if tree[0] == "var":
+        if tree[1] not in found:
+            found.append(tree[1])
+    elif tree[0] != "const":
+        for operand in tree[1:]:
+            tree_variables(operand, found)
+    return found
+
+def to_source(tree, names, templates, constants):
+    """
+    Render a parsed expression as python source with variables renamed through names.
+    """
+    kind = tree[0]
+    if kind == "var":
+        return names[tree[1]]
+    if kind == "const":
+        return constants[tree[1]]
+    return templates[kind].format(*(to_source(operand, names, templates, constants) for operand in tree[1:]))
+
+class CompiledExpression:
+    """
+    A parsed expression with its variables and a compiled positional evaluator.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.tree = parse(expression)
+        self.variables = tuple(tree_variables(self.tree))
+        names = {name: f"v{index}" for index, name in enumerate(self.variables)}
+        source = to_source(self.tree, names, BOOLEAN_TEMPLATES, {True: "True", False: "False"})
+        self.function = eval(f"lambda {', '.join(names.values())}: {source}", {"__builtins__": {}})
+
+    def evaluate(self, values):
+        """
+        Evaluate with values mapping variable names to booleans.
+        Raises KeyError when a variable has no value.
+        """
+        return self.function(*[values[name] for name in self.variables])
+
+    @functools.lru_cache(maxsize=256)
+    def bind(self, variables):
+        """
+        Return a function evaluating this expression on a row tuple ordered like variables.
+        Raises KeyError when the expression uses a name missing from variables.
+        """
+        positions = {name: f"row[{variables.index(name)}]" for name in variables}
+        names = {name: positions[name] for name in self.variables}
+        source = to_source(self.tree, names, BOOLEAN_TEMPLATES, {True: "True", False: "False"})
+        return eval(f"lambda row: {source}", {"__builtins__": {}})
+
+    @functools.cached_property
+    def column_function(self):
+        """
+        Function of (mask, *columns) ordered like self.variables returning the packed result column.
+        """
+        names = {name: f"v{index}" for index, name in enumerate(self.variables)}
+        source = to_source(self.tree, names, BITWISE_TEMPLATES, {True: "mask", False: "0"})
+        return eval(f"lambda {', '.join(['mask'] + list(names.values()))}: {source}", {"__builtins__": {}})
+
+    def evaluate_columns(self, columns, mask):
+        """
+        Evaluate on every row at once with columns mapping variable names to packed bit columns.
+        Raises KeyError when a variable has no column.
+        """
+        return self.column_function(mask, *[columns[name] for name in self.variables])
+
+@functools.lru_cache(maxsize=4096)
+def compile_expression(expression):
+    """
+    Parse and compile an expression once, later calls return the cached CompiledExpression.
+    """
+    return CompiledExpression(expression)
@@ -0,0 +1,300 @@
+# inference.py (c) 2024 Gregory L. Magnusson MIT license
+# indexed forward chaining over facts and rules for LogicTables
+# a fact is a tuple (relation, argument, ...) and the {'type': 'fact', 'relation', 'arguments'} dicts of modus_ponens are accepted
+# a rule derives its conclusions when all of its conditions match, arguments starting with ? are variables
+# conditions are compiled into a discrimination network indexed by relation so a new fact only reaches the conditions it can match
+# each condition keeps the facts it matched with hash indexes on the argument positions that joins look up
+# evaluation is semi-naive: each new fact is joined once against the facts already known and nothing is rescanned
+# the truths saved in ./memory/truth can be loaded, queried and extended with derived facts
+import time
+import datetime
+from memory.memory import get_memory_store, save_valid_truth
+from memory.persistence import get_persistence
+
+def is_variable(argument):
+    return isinstance(argument, str) and argument.startswith("?")
+
+def to_fact(fact):
+    """
+    Normalize a fact dict or sequence into a hashable (relation, argument, ...) tuple.
+    """
+    if isinstance(fact, dict):
+        relation = fact["relation"]
+        # modus_ponens conclusions carry the remaining relations of the rule as a list
+        if isinstance(relation, (list, tuple)):
+            relation = relation[0]
+        fact = [relation] + list(fact.get("arguments", ()))
+    return tuple(tuple(part) if isinstance(part, list) else part for part in fact)
+
+def fact_to_dict(fact):
+    return {
+        "type": "fact",
+        "relation": fact[0],
+        "arguments": list(fact[1:]),
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+
+class Rule:
+    """
+    Conditions and conclusions are patterns (relation, argument, ...) where arguments starting with ? are variables.
+    """
+    def __init__(self, conditions, conclusions, name=None):
+        self.conditions = [to_fact(condition) for condition in conditions]
+        self.conclusions = [to_fact(conclusion) for conclusion in conclusions]
+        if not self.conditions:
+            raise ValueError("A rule needs at least one condition")
+        bound = {argument for condition in self.conditions for argument in condition[1:] if is_variable(argument)}
+        for conclusion in self.conclusions:
+            for argument in conclusion[1:]:
+                if is_variable(argument) and argument not in bound:
+                    raise ValueError(f"Variable {argument} in conclusion is not bound by any condition")
+        self.name = name or f"{self.conditions} -> {self.conclusions}"
+
+    @classmethod
+    def from_dict(cls, rule):
+        """
+        Build a rule from {'type': 'rule', 'conditions': [...], 'conclusions': [...]} or from the
+        {'type': 'rule', 'relation': [premise, conclusion, ...], 'arguments': [...]} form used by modus_ponens,
+        where premise(arguments) implies every later relation(arguments).
+        """
+        if "conditions" in rule:
+            return cls(rule["conditions"], rule.get("conclusions", ()), rule.get("name"))
+        relations = rule["relation"]
+        arguments = list(rule.get("arguments", ()))
+        return cls([[relations[0]] + arguments], [[relation] + arguments for relation in relations[1:]], rule.get("name"))
+
+    def to_dict(self):
+        return {
+            "type": "rule",
+            "name": self.name,
+            "conditions": [list(condition) for condition in self.conditions],
+            "conclusions": [list(conclusion) for conclusion in self.conclusions],
+            "timestamp": datetime.datetime.now().isoformat(),
+        }
+
+class Condition:
+    """
+    One condition of a compiled rule with the facts it matched and lazily built join indexes.
+    """
+    def __init__(self, rule, index, pattern):
+        self.rule = rule
+        self.index = index
+        self.pattern = pattern
+        self.relation = pattern[0]
+        self.length = len(pattern)
+        self.constants = [(position, argument) for position, argument in enumerate(pattern) if position and not is_variable(argument)]
+        self.positions = {}
+        for position, argument in enumerate(pattern):
+            if position and is_variable(argument) and argument not in self.positions:
+                self.positions[argument] = position
+        self.facts = []
+        self.indexes = {}
+
+    def match(self, fact, bindings=None):
+        """
+        Return bindings extended by matching fact, or None if fact does not match.
+        """
+        if len(fact) != self.length:
+            return None
+        for position, argument in self.constants:
+            if fact[position] != argument:
+                return None
+        extended = dict(bindings) if bindings else {}
+        for position in range(1, self.length):
+            argument = self.pattern[position]
+            if is_variable(argument):
+                if argument not in extended:
+                    extended[argument] = fact[position]
+                elif extended[argument] != fact[position]:
+                    return None
+        return extended
+
+    def add(self, fact):
+        self.facts.append(fact)
+        for variables, index in self.indexes.items():
+            key = tuple(fact[self.positions[variable]] for variable in variables)
+            index.setdefault(key, []).append(fact)
+
+    def lookup(self, bindings):
+        """
+        Facts that can join with bindings, found through the index on the variables bindings already holds.
+        """
+        variables = tuple(variable for variable in self.positions if variable in bindings)
+        if not variables:
+            return self.facts
+        index = self.indexes.get(variables)
+        if index is None:
+            index = {}
+            for fact in self.facts:
+                index.setdefault(tuple(fact[self.positions[variable]] for variable in variables), []).append(fact)
+            self.indexes[variables] = index
+        return index.get(tuple(bindings[variable] for variable in variables), ())
+
+class InferenceEngine:
+    """
+    Forward chaining engine keeping every fact derivable from its facts and rules.
+
+    Args:
+        rules: Rules or rule dicts to start with.
+        persist: Save new facts and rules to the truth memory as they are added.
+    """
+    def __init__(self, rules=(), persist=False):
+        self.persist = persist
+        self.facts = set()
+        # relation -> facts, and (relation, position, argument) -> facts for queries
+        self.relations = {}
+        self.arguments = {}
+        # relation -> conditions of every rule that mention it
+        self.conditions = {}
+        self.rules = []
+        self.networks = {}
+        self.derivations = 0
+        self.elapsed = 0.0
+        for rule in rules:
+            self.add_rule(rule)
+
+    def _add_fact(self, fact):
+        if fact in self.facts:
+            return False
+        self.facts.add(fact)
+        self.relations.setdefault(fact[0], []).append(fact)
+        for position in range(1, len(fact)):
+            self.arguments.setdefault((fact[0], position, fact[position]), []).append(fact)
+        return True
+
+    def add_rule(self, rule, persist=None):
+        """
+        Compile a rule into the network and fire it on the facts already known.
+
+        Returns:
+            list: Facts derived.
+        """
+        rule = rule if isinstance(rule, Rule) else Rule.from_dict(rule)
+        self.rules.append(rule)
+        network = [Condition(rule, index, pattern) for index, pattern in enumerate(rule.conditions)]
+        self.networks[rule] = network
+        for condition in network:
+            self.conditions.setdefault(condition.relation, []).append(condition)
+            for fact in self.relations.get(condition.relation, ()):
+                if condition.match(fact) is not None:
+                    condition.add(fact)
+        if self.persist if persist is None else persist:
+            save_valid_truth(rule.to_dict())
+        started = time.perf_counter()
+        agenda = []
+        derived = []
+        for condition in network:
+            for fact in list(condition.facts):
+                self._fire(condition, condition.match(fact), agenda, derived)
+        return self._run(agenda, derived, started, persist)
+
+    def assert_fact(self, fact, persist=None):
+        return self.assert_facts([fact], persist)
+
+    def assert_facts(self, facts, persist=None):
+        """
+        Add facts and derive everything that follows from them.
+
+        Returns:
+            list: Facts derived, not counting the asserted facts themselves.
+        """
+        started = time.perf_counter()
+        agenda = []
+        for fact in facts:
+            fact = to_fact(fact)
+            if self._add_fact(fact):
+                agenda.append(fact)
+                if self.persist if persist is None else persist:
+                    save_valid_truth(fact_to_dict(fact))
+        return self._run(agenda, [], started, persist)
+
+    def _run(self, agenda, derived, started, persist):
+        position = 0
+        while position < len(agenda):
+            fact = agenda[position]
+            position += 1
+            matched = []
+            for condition in self.conditions.get(fact[0], ()):
+                bindings = condition.match(fact)
+                if bindings is not None:
+                    condition.add(fact)
+                    matched.append((condition, bindings))
+            for condition, bindings in matched:
+                self._fire(condition, bindings, agenda, derived)
+        if derived and (self.persist if persist is None else persist):
+            for fact in derived:
+                save_valid_truth(fact_to_dict(fact))
+        self.elapsed += time.perf_counter() - started
+        return derived
+
+    def _fire(self, condition, bindings, agenda, derived):
+        """
+        Join a fact newly matched by condition with the other conditions of its rule and add the conclusions.
+        """
+        rule = condition.rule
+        others = [other for other in self.networks[rule] if other is not condition]
+        for complete in self._join(others, 0, bindings):
+            for conclusion in rule.conclusions:
+                fact = tuple(complete[part] if is_variable(part) else part for part in conclusion)
+                if self._add_fact(fact):
+                    self.derivations += 1
+                    derived.append(fact)
+                    agenda.append(fact)
+
+    def _join(self, conditions, index, bindings):
+        if index == len(conditions):
+            yield bindings
+            return
+        condition = conditions[index]
+        for fact in condition.lookup(bindings):
+            extended = condition.match(fact, bindings)
+            if extended is not None:
+                yield from self._join(conditions, index + 1, extended)
+
+    def query(self, relation, *arguments):
+        """
+        Return the facts of relation matching arguments, where None or a ?variable matches anything.
+        Without arguments every fact of relation is returned.
+        """
+        candidates = self.relations.get(relation, ())
+        if not arguments:
+            return list(candidates)
+        bound = [(position, argument) for position, argument in enumerate(arguments, 1) if argument is not None and not is_variable(argument)]
+        for position, argument in bound:
+            found = self.arguments.get((relation, position, argument), ())
+            if len(found) < len(candidates):
+                candidates = found
+        length = len(arguments) + 1
+        return [fact for fact in candidates if len(fact) == length and all(fact[position] == argument for position, argument in bound)]
+
+    def load_truths(self, store=None):
+        """
+        Load the facts and rules saved in the truth memory.
+        Valid truths saved by LogicTables as {"expression"} become facts ("valid", expression).
+
+        Returns:
+            list: Facts derived while loading.
+        """
+        get_persistence().flush(key="truth")
+        store = get_memory_store() if store is None else store
+        facts = []
+        for record in store.iter_records("truth"):
+            data = record["data"]
+            if not isinstance(data, dict):
+                continue
+            if data.get("type") == "rule":
+                self.add_rule(data, persist=False)
+            elif data.get("type") == "fact":
+                facts.append(data)
+            elif "expression" in data:
+                facts.append(("valid", data["expression"]))
+        return self.assert_facts(facts, persist=False)
+
+    def stats(self):
+        return {
+            "facts": len(self.facts),
+            "rules": len(self.rules),
+            "derivations": self.derivations,
+            "seconds": self.elapsed,
+            "derivations_per_second": self.derivations / self.elapsed if self.elapsed else 0.0,
+        }
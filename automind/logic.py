@@ -9,76 +9,77 @@
 # store modus ponens as fact in {fact_data['timestamp']}_fact.json
 # logic TRUTH
 # store truth as truth in {truth_data['timestamp']}_truth.json
-import itertools
 import logging
 import datetime
-import pathlib
-import json
 from memory.memory import create_memory_folders, save_valid_truth, store_in_stm, DialogEntry
+from memory.persistence import get_persistence
+from memory.logsink import get_logger, LEVEL_NAMES
+from automind.expression import compile_expression
+from automind.truthtable import TruthTable
+from automind import decision
+from automind.inference import InferenceEngine
 
 class LogicTables:
     def __init__(self):
-        self.variables = []
-        self.expressions = []
+        self._variables = []
+        self._expressions = []
         self.valid_truths = []
-        self.logger = logging.getLogger('LogicTables')
-        self.logger.setLevel(logging.DEBUG)  # Set to DEBUG to capture all logs
-
-        # Ensure directories exist
-        general_log_dir = './mindx/errors'
-        memory_log_dir = './memory/truth'
-        pathlib.Path(general_log_dir).mkdir(parents=True, exist_ok=True)
-        pathlib.Path(memory_log_dir).mkdir(parents=True, exist_ok=True)
-
-        # General log file for mindx
-        file_handler_mindx = logging.FileHandler(f'{general_log_dir}/log.txt')
-        file_handler_mindx.setLevel(logging.DEBUG)
-        file_formatter_mindx = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler_mindx.setFormatter(file_formatter_mindx)
-
-        # Log file for memory/truth
-        file_handler_memory = logging.FileHandler(f'{memory_log_dir}/logs.txt')
-        file_handler_memory.setLevel(logging.DEBUG)
-        file_formatter_memory = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler_memory.setFormatter(file_formatter_memory)
-
-        self.logger.addHandler(file_handler_mindx)
-        self.logger.addHandler(file_handler_memory)
-
-        # Remove any other handlers (like StreamHandler) if they exist
-        self.logger.propagate = False
+        # decision diagram shared by every check so repeated subexpressions are built once
+        self.bdd = decision.BDD()
+        # truth table built on first use and then extended column by column as variables and expressions are added
+        self.truth_table = None
+        # expressions whose column could not be evaluated yet, usually for a variable added later
+        self.unevaluated = set()
+        self.table_version = 0
+        self.output_version = None
+        # decision results for the current variables, cleared when a variable is added
+        self.decisions = {}
+        # forward chaining engine over ./memory/truth, loaded on first use
+        self.inference = None
+        # one shared handler per log file, written in batches by the logsink listener thread
+        self.logger = get_logger('LogicTables', ['./mindx/errors/log.txt', './memory/truth/logs.txt'], propagate=False)
+
+    @property
+    def variables(self):
+        return self._variables
+
+    @variables.setter
+    def variables(self, variables):
+        self._variables = list(variables)
+        self.reset()
+
+    @property
+    def expressions(self):
+        return self._expressions
+
+    @expressions.setter
+    def expressions(self, expressions):
+        self._expressions = list(expressions)
+        self.reset()
+
+    def reset(self):
+        """
+        Drop the truth table, BDD and decision results after variables or expressions were replaced wholesale.
+        """
+        self.bdd = decision.BDD(self._variables)
+        self.truth_table = None
+        self.unevaluated.clear()
+        self.decisions.clear()
+        self.table_version += 1
 
     def log(self, message, level='info'):
-        if level == 'info':
-            self.logger.info(message)
-        elif level == 'error':
-            self.logger.error(message)
-        elif level == 'warning':
-            self.logger.warning(message)
-        self.store_log_in_mindx(message, level)
-        self.store_log_in_memory(message, level)
-
-    def store_log_in_mindx(self, message, level):
-        general_log_path = './mindx/errors/log.txt'
-
-        # Ensure the directory exists
-        pathlib.Path(general_log_path).parent.mkdir(parents=True, exist_ok=True)
-
-        with open(general_log_path, 'a') as file:
-            file.write(f"{level.upper()}: {message}\n")
-
-    def store_log_in_memory(self, message, level):
-        memory_log_path = './memory/truth/logs.txt'
-
-        # Ensure the directory exists
-        pathlib.Path(memory_log_path).parent.mkdir(parents=True, exist_ok=True)
-
-        with open(memory_log_path, 'a') as file:
-            file.write(f"{level.upper()}: {message}\n")
+        self.logger.log(LEVEL_NAMES.get(level, logging.INFO), message)
 
     def add_variable(self, var):
         if var not in self.variables:
             self.variables.append(var)
+            self.bdd.declare(var)
+            if self.truth_table is not None:
+                self.truth_table.add_variable(var)
+                for expr in [expr for expr in self.expressions if expr in self.unevaluated]:
+                    self.add_column(expr)  # the new variable may be the one the expression was missing
+            self.table_version += 1
+            self.decisions.clear()
             self.log(f"Added variable: {var}")
             self.output_belief(f"Added variable: {var}")
         else:
@@ -87,6 +88,9 @@ class LogicTables:
     def add_expression(self, expr):
         if expr not in self.expressions:
             self.expressions.append(expr)
+            if self.truth_table is not None:
+                self.add_column(expr)
+            self.table_version += 1
             self.log(f"Added expression: {expr}")
             self.output_belief(f"Added expression: {expr}")
         else:
@@ -94,69 +98,92 @@ class LogicTables:
 
     def output_belief(self, belief):
         belief_path = './memory/truth'
-
-        # Ensure the directory exists
-        pathlib.Path(belief_path).mkdir(parents=True, exist_ok=True)
-
         belief_file = f"{belief_path}/{datetime.datetime.now().isoformat()}_belief.json"
-        with open(belief_file, 'w') as file:
-            json.dump({"belief": belief, "timestamp": datetime.datetime.now().isoformat()}, file)
+        get_persistence().write_json(belief_file, {"belief": belief, "timestamp": datetime.datetime.now().isoformat()})
 
     def output_truth(self, variables, expressions, truth_table):
         truth_path = './memory/truth'
-
-        # Ensure the directory exists
-        pathlib.Path(truth_path).mkdir(parents=True, exist_ok=True)
-
+        if isinstance(truth_table, TruthTable):
+            truth_table = truth_table.to_json()
         truth_data = {
             "belief": {
-                "variables": variables,
-                "expressions": expressions,
+                "variables": list(variables),
+                "expressions": list(expressions),
                 "truth_table": truth_table
             },
             "timestamp": datetime.datetime.now().isoformat()
         }
 
         truth_file = f"{truth_path}/{truth_data['timestamp']}_truth.json"
-        with open(truth_file, 'w') as file:
-            json.dump(truth_data, file)
+        get_persistence().write_json(truth_file, truth_data)
 
     def evaluate_expression(self, expr, values):
-        allowed_operators = {
-            'and': lambda x, y: x and y,
-            'or': lambda x, y: x or y,
-            'not': lambda x: not x,
-            'xor': lambda x, y: x ^ y,
-            'nand': lambda x, y: not (x and y),
-            'nor': lambda x, y: not (x or y),
-            'implication': lambda x, y: not x or y
-        }
-
         try:
-            result = eval(expr, {"__builtins__": None}, {**allowed_operators, **values})
-            self.log(f"Evaluated expression '{expr}' with values {values}: {result}")
-            return result
+            return compile_expression(expr).evaluate(values)
         except Exception as e:
             self.log(f"Error evaluating expression '{expr}': {e}", level='error')
             return False
 
-    def generate_truth_table(self):
-        n = len(self.variables)
-        combinations = list(itertools.product([True, False], repeat=n))
-        truth_table = []
+    def bind_expression(self, expr):
+        """
+        Compile expr into a function over rows ordered like self.variables, or None if it cannot be evaluated.
+        """
+        try:
+            return compile_expression(expr).bind(tuple(self.variables))
+        except Exception as e:
+            self.log(f"Error evaluating expression '{expr}': {e}", level='error')
+            return None
 
-        for combo in combinations:
-            values = {self.variables[i]: combo[i] for i in range(n)}
-            result = values.copy()
-            for expr in self.expressions:
-                result[expr] = self.evaluate_expression(expr, values)
-            truth_table.append(result)
+    def evaluate_column(self, truth_table, expr):
+        """
+        Evaluate expr on every row of truth_table at once, or None if it cannot be evaluated.
+        """
+        try:
+            return truth_table.evaluate(expr)
+        except Exception as e:
+            self.log(f"Error evaluating expression '{expr}': {e}", level='error')
+            return None
+
+    def add_column(self, expr):
+        column = self.evaluate_column(self.truth_table, expr)
+        # expressions that cannot be evaluated are False on every row until a variable is added
+        if column is None:
+            self.unevaluated.add(expr)
+            column = 0
+        else:
+            self.unevaluated.discard(expr)
+        self.truth_table.columns[expr] = column
 
-        self.log(f"Generated truth table with {len(truth_table)} rows")
-        self.output_belief(f"Generated truth table with {len(truth_table)} rows")
-        self.output_truth(self.variables, self.expressions, truth_table)
+    def generate_truth_table(self):
+        """
+        Return the maintained TruthTable, building it on first use.
+        The belief and truth files are written only when the table changed since they were last written.
+        """
+        if self.truth_table is None:
+            self.truth_table = TruthTable(self.variables)
+            for expr in self.expressions:
+                self.add_column(expr)
+        truth_table = self.truth_table
+        if self.output_version != self.table_version:
+            self.output_version = self.table_version
+            self.log(f"Generated truth table with {len(truth_table)} rows")
+            self.output_belief(f"Generated truth table with {len(truth_table)} rows")
+            self.output_truth(self.variables, self.expressions, truth_table)
         return truth_table
 
+    def decide(self, function, *expressions):
+        """
+        Run a decision.py procedure over the current variables, cached until a variable is added.
+        Raises ExpressionError or KeyError when an expression cannot be evaluated.
+        """
+        key = (function.__name__,) + expressions
+        if key not in self.decisions:
+            table = None
+            if self.truth_table is not None and len(self.variables) <= decision.ENUMERATION_VARIABLES:
+                table = self.truth_table
+            self.decisions[key] = function(*expressions, variables=self.variables, bdd=self.bdd, table=table)
+        return self.decisions[key]
+
     def display_truth_table(self):
         truth_table = self.generate_truth_table()
         headers = self.variables + self.expressions
@@ -169,11 +196,14 @@ class LogicTables:
             self.log(f"Expression '{expression}' is not in the list of expressions.", level='warning')
             return False
 
-        truth_table = self.generate_truth_table()
-        for row in truth_table:
-            if not row[expression]:
-                self.log(f"Expression '{expression}' is not valid.")
-                return False
+        try:
+            counterexample = self.decide(decision.counterexample, expression)
+        except Exception as e:
+            self.log(f"Error evaluating expression '{expression}': {e}", level='error')
+            return False
+        if counterexample is not None:
+            self.log(f"Expression '{expression}' is not valid, counterexample: {counterexample}")
+            return False
 
         self.log(f"Expression '{expression}' is valid.")
         self.save_valid_truth(expression)
@@ -184,6 +214,8 @@ class LogicTables:
         valid_truth = {"expression": expression, "timestamp": timestamp}
         self.valid_truths.append(valid_truth)
         save_valid_truth(valid_truth)
+        if self.inference is not None:
+            self.inference.assert_fact(("valid", expression), persist=False)
         self.log(f"Saved valid truth: '{expression}' at {timestamp}")
 
     def get_valid_truths(self):
@@ -191,14 +223,73 @@ class LogicTables:
         return self.valid_truths
 
     def tautology(self, expression):
-        truth_table = self.generate_truth_table()
-        for row in truth_table:
-            if not self.evaluate_expression(expression, row):
-                self.log(f"Expression '{expression}' is not a tautology.", level='info')
-                return False
+        try:
+            counterexample = self.decide(decision.counterexample, expression)
+        except Exception as e:
+            self.log(f"Error evaluating expression '{expression}': {e}", level='error')
+            counterexample = {}
+        if counterexample is not None:
+            self.log(f"Expression '{expression}' is not a tautology.", level='info')
+            return False
         self.log(f"Expression '{expression}' is a tautology.", level='info')
         return True
 
+    def counterexample(self, expression):
+        """
+        Return an assignment of the variables falsifying expression, or None if it is a tautology or cannot be evaluated.
+        Small inputs are enumerated, larger ones are decided with the BDD or DPLL from decision.py.
+        """
+        try:
+            counterexample = self.decide(decision.counterexample, expression)
+        except Exception as e:
+            self.log(f"Error evaluating expression '{expression}': {e}", level='error')
+            return None
+        return dict(counterexample) if counterexample is not None else None
+
+    def is_satisfiable(self, expression):
+        try:
+            return self.decide(decision.is_satisfiable, expression)
+        except Exception as e:
+            self.log(f"Error evaluating expression '{expression}': {e}", level='error')
+            return False
+
+    def equivalent(self, first, second):
+        """
+        True if first and second agree on every assignment of the variables.
+        """
+        try:
+            return self.decide(decision.equivalent, first, second)
+        except Exception as e:
+            self.log(f"Error comparing expressions '{first}' and '{second}': {e}", level='error')
+            return False
+
+    def knowledge_base(self):
+        """
+        Return the InferenceEngine holding the facts and rules saved in ./memory/truth, loading it on first use.
+        """
+        if self.inference is None:
+            self.inference = InferenceEngine(persist=True)
+            derived = self.inference.load_truths()
+            self.log(f"Loaded knowledge base with {len(self.inference.facts)} facts and {len(self.inference.rules)} rules, derived {len(derived)}")
+        return self.inference
+
+    def forward_chain(self, facts=(), rules=()):
+        """
+        Add facts and rules to the knowledge base and derive everything that follows.
+        Facts and rules use the dict form of modus_ponens or the tuple form of automind/inference.py.
+
+        Returns:
+            list: Newly derived facts as (relation, argument, ...) tuples.
+        """
+        engine = self.knowledge_base()
+        derived = []
+        for rule in rules:
+            derived.extend(engine.add_rule(rule))
+        derived.extend(engine.assert_facts(facts))
+        stats = engine.stats()
+        self.log(f"Forward chaining derived {len(derived)} facts, {stats['derivations_per_second']:.0f} derivations per second")
+        return derived
+
     def modus_ponens(self, fact1, fact2):
         if fact1['type'] == 'fact' and fact2['type'] == 'rule':
             if self.unify_variables(fact1, fact2):
@@ -4,18 +4,23 @@
 # openmind internal reasoning asynchronous task ensuring non-blocking execution and efficient concurrency
 # modular integration of automind reasoning with memory
 # webmind for API and llama3 handling of input response from various LLM
-# log internal reasoning conclusion     ./memory/logs/thoughts.json
-# log not premise                       ./memory/logs/notpremise.json
-# log short term memory input response  ./memory/stm/{timestamp}memory.json 
+# log internal reasoning conclusion     ./memory/logs/thoughts.jsonl
+# log not premise                       ./memory/logs/notpremise.jsonl
+# log short term memory input response  ./memory/stm as segmented log consolidated into ./memory/ltm
 
 import os
 import time
 from datetime import datetime
 from nicegui import ui  # importing ui for easyAGI
 from memory.memory import create_memory_folders, store_in_stm, save_conversation_memory, save_internal_reasoning, DialogEntry, save_valid_truth
+from memory.persistence import get_persistence
+from memory.jsonlog import append_jsonl, tail_jsonl, migrate_logs, NOT_PREMISE_LOG, THOUGHTS_LOG
+from memory.logsink import flush_logs
+from memory.consolidation import ConsolidationScheduler
 from webmind.ollama_handler import OllamaHandler  # Import OllamaHandler for modular Ollama interactions
 from automind.automind import FundamentalAGI
 from webmind.chatter import GPT4o, GroqModel, TogetherModel
+from webmind.router import ChatterRouter
 from webmind.api import APIManager
 import ujson as json
 import asyncio
@@ -25,10 +30,44 @@ import httpx
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 
+LOG_VIEW_ENTRIES = 500  # entries of a JSONL log shown by read_log_file
+LOG_FLUSH_TIMEOUT = 2.0  # seconds read_log_file waits for queued records before reading what is already on disk
+STREAM_UPDATE_INTERVAL = 0.05  # seconds between chat message updates while tokens stream in
+
+class TokenStream:
+    """
+    Shows the streamed tokens of a conclusion draft in a label, coalescing updates to one every STREAM_UPDATE_INTERVAL.
+    Drafts are streamed concurrently, the label follows the first draft to send a token.
+    """
+    def __init__(self, label):
+        self.label = label
+        self.draft = None
+        self.parts = []
+        self.dirty = False
+        self.task = asyncio.create_task(self._refresh())
+
+    def push(self, draft, token):
+        if self.draft is None:
+            self.draft = draft
+        if draft == self.draft:
+            self.parts.append(token)
+            self.dirty = True
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(STREAM_UPDATE_INTERVAL)
+            if self.dirty and self.label is not None:
+                self.dirty = False
+                self.label.set_text("".join(self.parts))
+
+    def close(self):
+        self.task.cancel()
+
 class OpenMind:
     def __init__(self):
         self.api_manager = APIManager()
         self.agi_instance = None
+        self.agi_core = None  # reasoning core kept across chatter switches
         self.initialize_memory()
         self.message_container = ui.column()
         self.ollama_handler = OllamaHandler()  # initialize OllamaHandler instance
@@ -40,6 +79,8 @@ class OpenMind:
 
     def initialize_memory(self):
         create_memory_folders()
+        migrate_logs()  # one time conversion of the JSON array logs in ./memory/logs to JSONL, before anything appends to them
+        self.consolidation = ConsolidationScheduler().start()  # merge stm into ltm and prune memory off the event loop
 
     def use_api_key(self, service, key):
         self.api_manager.api_keys[service] = key
@@ -108,17 +149,13 @@ class OpenMind:
                 logging.warning(message)
             notify_user(message, message_type)
 
-        # Clean up any existing AGI instance or chatter model
-        if hasattr(self, 'agi_instance') and self.agi_instance is not None:
-            self.agi_instance = None
-
         model_initialized = False
 
         if model_name == 'openai':
             openai_key = self.api_manager.get_api_key('openai')
             if openai_key:
                 chatter = GPT4o(openai_key)  # openai
-                self.agi_instance = FundamentalAGI(chatter)
+                self.set_chatter(chatter)
                 log_and_notify('Using OpenAI for AGI')
                 model_initialized = True
             else:
@@ -128,7 +165,7 @@ class OpenMind:
             groq_key = self.api_manager.get_api_key('groq')
             if groq_key:
                 chatter = GroqModel(groq_key)  # groq
-                self.agi_instance = FundamentalAGI(chatter)
+                self.set_chatter(chatter)
                 log_and_notify('Using Groq for AGI')
                 model_initialized = True
             else:
@@ -138,51 +175,81 @@ class OpenMind:
             together_key = self.api_manager.get_api_key('together')
             if together_key:
                 chatter = TogetherModel(together_key)  # together
-                self.agi_instance = FundamentalAGI(chatter)
+                self.set_chatter(chatter)
                 log_and_notify('Using Together AI for AGI')
                 model_initialized = True
             else:
                 log_and_notify('Together AI API key not found. Please add the key first.', 'warning', 'negative')
 
+        if model_name == 'ollama' and not model_initialized:
+            if self.check_llama_running():
+                self.set_chatter(self.ollama_handler.chatter())  # ollama
+                log_and_notify('Using Ollama for AGI')
+                model_initialized = True
+            else:
+                log_and_notify('Ollama is not running. Please start it first.', 'warning', 'negative')
+
         if not model_initialized:
             log_and_notify(f'Failed to initialize AGI with {model_name}', 'warning', 'negative')
 
+    def set_chatter(self, chatter):
+        """
+        Use chatter for reasoning, keeping the reasoning core, its logic tables, log handlers and caches.
+        The core is created on first use and only its model is swapped afterwards.
+        """
+        if self.agi_core is None:
+            self.agi_core = FundamentalAGI(chatter)
+        else:
+            self.agi_core.set_chatter(chatter)
+        self.agi_instance = self.agi_core
+
     def initialize_agi(self):
         openai_key = self.api_manager.get_api_key('openai')
         groq_key = self.api_manager.get_api_key('groq')
         together_key = self.api_manager.get_api_key('together')
         llama_running = self.check_llama_running()
+        chatters = [factory(key) for factory, key in ((GPT4o, openai_key), (GroqModel, groq_key), (TogetherModel, together_key)) if key]
 
-        if openai_key:
+        if len(chatters) > 1:
+            # route across every configured provider, hedging slow calls and failing over on errors
+            chatter = ChatterRouter(chatters)
+            self.set_chatter(chatter)
+            names = ", ".join(c.provider for c in chatters)
+            if self.message_container.client.connected:
+                with self.message_container:
+                    ui.notify(f'Using {names} for ezAGI')
+            logging.debug(f"AGI initialized with router over {names}")
+        elif openai_key:
             chatter = GPT4o(openai_key)
-            self.agi_instance = FundamentalAGI(chatter)
+            self.set_chatter(chatter)
             if self.message_container.client.connected:
                 with self.message_container:
                     ui.notify('Using OpenAI for ezAGI')
             logging.debug("AGI initialized with OpenAI")
         elif groq_key:
             chatter = GroqModel(groq_key)
-            self.agi_instance = FundamentalAGI(chatter)
+            self.set_chatter(chatter)
             if self.message_container.client.connected:
                 with self.message_container:
                     ui.notify('Using Groq for ezAGI')
             logging.debug("AGI initialized with Groq")
         elif together_key:
             chatter = TogetherModel(together_key)
-            self.agi_instance = FundamentalAGI(chatter)
+            self.set_chatter(chatter)
             if self.message_container.client.connected:
                 with self.message_container:
                     ui.notify('Using Together AI for ezAGI')
             logging.debug("AGI initialized with Together AI")
         elif llama_running:
             # Call ollama_handler to list models when LLaMA is found running
-            models = self.ollama_handler.list_models()
+            models = self.ollama_handler.model_names()
             if models:
-                model_list = ", ".join(models)
+                model = self.ollama_handler.selected_model if self.ollama_handler.selected_model in models else models[0]
+                self.set_chatter(self.ollama_handler.chatter(model))
                 if self.message_container.client.connected:
                     with self.message_container:
-                        ui.notify(f'LLaMA found running. Models available: {model_list}')
-                logging.debug(f"LLaMA running on localhost:11434. Models available: {model_list}")
+                        ui.notify(f'Using Ollama {model} for ezAGI')
+                logging.debug(f"AGI initialized with Ollama {model}. Models available: {', '.join(models)}")
             else:
                 if self.message_container.client.connected:
                     with self.message_container:
@@ -199,21 +266,22 @@ class OpenMind:
 
     def check_llama_running(self):
         try:
-            response = httpx.get('http://localhost:11434')
+            response = httpx.get(self.ollama_handler.api_url.rsplit('/api', 1)[0], timeout=2)
             if response.status_code == 200:
                 return True
         except httpx.RequestError as e:
             logging.debug(f"LLaMA connection failed: {e}")
         return False
 
-    async def get_conclusion_from_agi(self, prompt):
+    async def get_conclusion_from_agi(self, prompt, on_token=None):
         """
         Get a conclusion from the AGI based on the provided prompt
         This method is asynchronous to allow non-blocking operations
+        on_token(draft, token) receives the conclusion tokens as they stream in
         """
         if self.agi_instance is None:
             return "AGI not initialized. Please add an API key or start LLaMA"
-        conclusion = await asyncio.get_event_loop().run_in_executor(None, self.agi_instance.get_conclusion_from_agi, prompt)
+        conclusion = await self.agi_instance.get_conclusion_from_agi_async(prompt, on_token=on_token)
         return conclusion
 
     def communicate_response(self, conclusion):
@@ -227,7 +295,7 @@ class OpenMind:
         """
         Internal reasoning loop for continuous AGI reasoning without user interaction
         adding a prompt to AGI processesing its conclusion periodically
-        The conclusions are currently displayed in the response window and saved to ./memory/logs/thoughts.json including ./memory/logs/notpremise.json
+        The conclusions are currently displayed in the response window and saved to ./memory/logs/thoughts.jsonl including ./memory/logs/notpremise.jsonl
         """
         while True:
             if self.agi_instance is None:
@@ -259,7 +327,7 @@ class OpenMind:
 
     def display_internal_conclusion(self, conclusion):
         """
-        Display internal reasoning conclusion in the response window and log it to a JSON file
+        Display internal reasoning conclusion in the response window and log it to a JSONL file
         """
         if conclusion != "No premises available for logic as conclusion":
             if self.message_container.client.connected:
@@ -277,23 +345,14 @@ class OpenMind:
         }
         
         if conclusion == "No premises available for logic as conclusion.":
-            log_file_path = "./memory/logs/notpremise.json"
+            log_file_path = NOT_PREMISE_LOG
         else:
-            log_file_path = "./memory/logs/thoughts.json"
+            log_file_path = THOUGHTS_LOG
 
-        if not os.path.exists(log_file_path):
-            with open(log_file_path, 'w') as file:
-                json.dump([log_entry], file, indent=4)
-        else:
-            with open(log_file_path, 'r+') as file:
-                data = json.load(file)
-                data.append(log_entry)
-                file.seek(0)
-                json.dump(data, file, indent=4)
+        append_jsonl(log_file_path, log_entry)
 
         # Also log the conclusions to conclusions.txt
-        with open('./memory/logs/conclusions.txt', 'a') as file:
-            file.write(f"{datetime.now().isoformat()}: {conclusion}\n")
+        get_persistence().append_text('./memory/logs/conclusions.txt', f"{datetime.now().isoformat()}: {conclusion}\n")
 
     async def main_loop(self):
         """
@@ -313,14 +372,20 @@ class OpenMind:
             save_conversation_memory({"dialog": {"instruction": prompt, "response": conclusion}})
 
     async def send_message(self, question):
+        response_message = stream_label = None
         if self.message_container.client.connected:
             with self.message_container:
                 ui.chat_message(text=question, name='query', sent=True)
                 response_message = ui.chat_message(name='ezAGI', sent=False)
+                with response_message:
+                    stream_label = ui.label('')
                 spinner = ui.spinner(type='dots')
+        stream = TokenStream(stream_label)
 
         try:
-            conclusion = await self.get_conclusion_from_agi(question)
+            conclusion = await self.get_conclusion_from_agi(question, on_token=stream.push)
+            stream.close()
+            self.report_latency(conclusion)
             if response_message and self.message_container.client.connected:
                 response_message.clear()
                 with response_message:
@@ -338,12 +403,27 @@ class OpenMind:
             if self.log:
                 self.log.push(f"Error getting conclusion from easyAGI: {e}")
         finally:
+            stream.close()
             try:
                 if self.message_container.client.connected:
                     self.message_container.remove(spinner)  # Correctly remove the spinner
             except KeyError:
                 logging.warning("Spinner element not found in message_container")
 
+    def report_latency(self, conclusion):
+        """
+        Log the time to the first streamed token and the total latency of a conclusion.
+        """
+        result = getattr(conclusion, 'result', None)
+        if not result:
+            return
+        first_token = result.get('first_token')
+        first = f"{first_token:.2f}s" if first_token is not None else "n/a"
+        message = f"first token {first}, total {result['elapsed']:.2f}s ({result['status']})"
+        logging.info(message)
+        if self.log:
+            self.log.push(message)
+
     async def run_javascript_with_retry(self, script, retries=5, timeout=12.0):
         for attempt in range(retries):
             task = asyncio.create_task(ui.run_javascript(script, timeout=timeout))
@@ -366,8 +446,17 @@ class OpenMind:
     def read_log_file(self, file_path):
         """
         Read the content of a log file and return it.
+        JSONL logs are streamed and only their last LOG_VIEW_ENTRIES entries are returned.
+        Blocks on file I/O, the UI awaits read_log_file_async instead.
         """
+        # Write queued log records and JSONL entries before reading, a busy writer only delays the view by LOG_FLUSH_TIMEOUT
+        flush_logs(LOG_FLUSH_TIMEOUT)
+        get_persistence().flush(timeout=LOG_FLUSH_TIMEOUT)
         try:
+            if file_path.endswith('.jsonl'):
+                if not os.path.exists(file_path):
+                    raise FileNotFoundError(file_path)
+                return "\n\n".join(json.dumps(entry) for entry in tail_jsonl(file_path, LOG_VIEW_ENTRIES))
             with open(file_path, 'r') as file:
                 return file.read()
         except FileNotFoundError:
@@ -377,6 +466,12 @@ class OpenMind:
             logging.error(f"Error reading log file {file_path}: {e}")
             return f"Error reading log file {file_path}: {e}"
 
+    async def read_log_file_async(self, file_path):
+        """
+        read_log_file on a worker thread so the flushes and the read do not block the event loop.
+        """
+        return await asyncio.to_thread(self.read_log_file, file_path)
+
     def handle_javascript_response(self, msg):
         request_id = msg.get('request_id')
         result = msg.get('result', None)
@@ -0,0 +1,145 @@
+# truthtable.py (c) 2024 Gregory L. Magnusson MIT license
+# columnar truth table for LogicTables
+# every variable and expression column is one python int used as a bitset with one bit per row
+# expressions are evaluated as whole column bitwise operations from expression.py
+# bit i of a column belongs to internal row i where variable k is True when bit k of i is 0
+# rows are exposed lazily in the same order as itertools.product([True, False], repeat=n)
+# 24 variables take 2 MB per column instead of 16 million dicts
+from collections.abc import Mapping, Sequence
+from automind.expression import compile_expression
+
+# tables up to this many rows are written out row by row by LogicTables.output_truth
+MAX_SERIALIZED_ROWS = 1024
+
+def variable_column(position, row_count):
+    """
+    Packed column of the variable at position in a table of row_count rows.
+    """
+    half = 1 << position
+    column = (1 << half) - 1
+    length = half << 1
+    while length < row_count:
+        column |= column << length
+        length <<= 1
+    return column & ((1 << row_count) - 1)
+
+class TruthRow(Mapping):
+    """
+    Read-only view of one row mapping variable and expression names to booleans.
+    """
+    def __init__(self, table, bit):
+        self.table = table
+        self.bit = bit
+
+    def __getitem__(self, name):
+        return bool((self.table.columns[name] >> self.bit) & 1)
+
+    def __iter__(self):
+        return iter(self.table.columns)
+
+    def __len__(self):
+        return len(self.table.columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class TruthTable(Sequence):
+    """
+    Truth table over variables with expression columns stored as packed bits.
+    """
+    def __init__(self, variables=(), expressions=()):
+        self.variables = list(variables)
+        self.row_count = 1 << len(self.variables)
+        self.mask = (1 << self.row_count) - 1
+        self.columns = {}
+        for position, variable in enumerate(self.variables):
+            self.columns[variable] = variable_column(position, self.row_count)
+        for expression in expressions:
+            self.add_expression(expression)
+
+    def add_variable(self, variable):
+        """
+        Append a variable by doubling the table, existing columns are copied onto the new rows.
+        The new variable is True on the old rows and False on the copies.
+        """
+        if variable in self.columns:
+            raise ValueError(f"Column '{variable}' already exists")
+        rows = self.row_count
+        columns = {}
+        for name in self.variables:
+            columns[name] = self.columns[name] | (self.columns[name] << rows)
+        columns[variable] = self.mask
+        for name, column in self.columns.items():
+            if name not in columns:
+                columns[name] = column | (column << rows)
+        self.variables.append(variable)
+        self.row_count = rows << 1
+        self.mask = (1 << self.row_count) - 1
+        self.columns = columns
+
+    def evaluate(self, expression):
+        """
+        Return the packed result column of expression without storing it.
+        Raises ExpressionError or KeyError when expression cannot be evaluated over these variables.
+        """
+        return compile_expression(expression).evaluate_columns(self.columns, self.mask)
+
+    def add_expression(self, expression):
+        if expression not in self.columns:
+            self.columns[expression] = self.evaluate(expression)
+        return self.columns[expression]
+
+    def column(self, name):
+        return self.columns[name] if name in self.columns else self.evaluate(name)
+
+    def all(self, name):
+        """
+        True if the column or expression holds on every row.
+        """
+        return self.column(name) == self.mask
+
+    def any(self, name):
+        """
+        True if the column or expression holds on at least one row.
+        """
+        return self.column(name) != 0
+
+    def count(self, name):
+        return bin(self.column(name)).count("1")
+
+    def _row_bit(self, index):
+        # public row order has the first variable changing slowest, internal bits have it changing fastest
+        n = len(self.variables)
+        return int(format(index, f"0{n}b")[::-1], 2) if n else 0
+
+    def counterexample(self, name):
+        """
+        Return a row on which the column or expression is False, or None if it always holds.
+        """
+        missing = self.mask ^ self.column(name)
+        if not missing:
+            return None
+        return TruthRow(self, (missing & -missing).bit_length() - 1)
+
+    def __len__(self):
+        return self.row_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.row_count))]
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError("truth table row out of range")
+        return TruthRow(self, self._row_bit(index))
+
+    def to_rows(self):
+        return [dict(row) for row in self]
+
+    def to_json(self):
+        """
+        Rows as dicts for small tables, otherwise the number of True rows per column.
+        """
+        if self.row_count <= MAX_SERIALIZED_ROWS:
+            return self.to_rows()
+        return {"rows": self.row_count, "true_rows": {name: self.count(name) for name in self.columns}}
@@ -1,7 +1,7 @@
 # ezAGI.py multi-model LLM with automind reasoning from premise to draw_conclusion
 # ezAGI (c) Gregory L. Magnusson MIT license 2024
 # conversation from main_loop(self) is saved to ./memory/stm/timestampmemory.json from memory.py creating short term memory store of input response
-# reasoning_loop(self)conversation from internal_conclusions are saved in ./memory/logs/thoughts.json
+# reasoning_loop(self)conversation from internal_conclusions are saved in ./memory/logs/thoughts.jsonl
 # easy augmented generative intelligence UIUX
 
 from nicegui import ui, app  # handle UIUX
@@ -66,17 +66,17 @@ def main():
 
     # define log files and their paths
     log_files = {
-        "Premises Log": "./memory/logs/premises.json",
-        "Not Premise Log": "./memory/logs/notpremise.json",
+        "Premises Log": "./memory/logs/premises.jsonl",
+        "Not Premise Log": "./memory/logs/notpremise.jsonl",
         "Truth Tables Log": "./memory/truth/logs.txt",
-        "Thoughts Log": "./memory/logs/thoughts.json",
+        "Thoughts Log": "./memory/logs/thoughts.jsonl",
         "Conclusions Log": "./memory/logs/conclusions.txt",
         "Decisions Log": "./memory/logs/truth.json"
     }
 
     # function to view log files
-    def view_log(file_path):
-        log_content = openmind.read_log_file(file_path)  # Read log file content
+    async def view_log(file_path):
+        log_content = await openmind.read_log_file_async(file_path)  # Read log file content off the event loop
         log_container.clear()  # Clear the existing log content
         with log_container:
             ui.markdown(log_content).classes('w-full')  # Display log content
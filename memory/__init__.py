@@ -1 +1,4 @@
-from .memory import create_memory_folders, store_in_stm, DialogEntry
+from .memory import create_memory_folders, store_in_stm, DialogEntry, iter_conversation_memory
+from .memory import get_memory_store, set_memory_store, create_memory_store
+from .store import MemoryStore, FileMemoryStore, SQLiteMemoryStore
+from .memory import recall_memory
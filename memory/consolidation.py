@@ -0,0 +1,176 @@
+# consolidation.py (c) 2024 Gregory L. Magnusson MIT licence
+# background consolidation of short term memory into long term memory with retention budgets
+# stm records older than stm_max_age are merged into ltm, identical instruction response pairs are stored once
+# merged records are stamped with the time they reach ltm so ltm timestamps stay in id order for time range queries
+# each store remembers how far stm and ltm were read so a run only reads records added since the last one
+# sealed ltm segments are compressed and every kind is pruned by its retention rules
+# retention rules per kind as {"max_age": seconds, "max_bytes": bytes, "keep_last": records}
+# truth has no default rule, valid truths are never pruned unless a rule is passed for it
+# CONSOLIDATION_INTERVAL seconds between scheduled runs (default 3600)
+# the job runs on its own thread and only touches records older than the cutoff so writers are never blocked
+import os
+import time
+import hashlib
+import itertools
+import threading
+import weakref
+import ujson
+import logging
+from memory.memory import get_memory_store
+from memory.persistence import get_persistence
+
+CONSOLIDATION_INTERVAL = float(os.environ.get("CONSOLIDATION_INTERVAL", "3600"))
+STM_MAX_AGE = 24 * 60 * 60
+
+DEFAULT_RETENTION = {
+    "stm": {"max_age": 7 * 24 * 60 * 60, "max_bytes": 64 * 1024 * 1024},
+    "ltm": {"max_bytes": 512 * 1024 * 1024},
+    "episodic": {"max_bytes": 256 * 1024 * 1024},
+    "reasoning": {"max_age": 30 * 24 * 60 * 60, "max_bytes": 128 * 1024 * 1024},
+}
+
+def _dialog_key(data):
+    """
+    Hash the instruction response pair of a dialog entry or conversation memory record.
+    """
+    if isinstance(data, dict) and isinstance(data.get("dialog"), dict):
+        data = data["dialog"]
+    if isinstance(data, dict) and ("instruction" in data or "response" in data):
+        pair = [data.get("instruction"), data.get("response")]
+    else:
+        pair = data
+    return hashlib.sha256(ujson.dumps(pair, sort_keys=True).encode("utf-8")).digest()
+
+class _ConsolidationState:
+    """
+    What consolidation has already read from one store: the last stm and ltm ids and the keys of the ltm pairs.
+    """
+    def __init__(self):
+        self.stm_cursor = None
+        self.ltm_cursor = None
+        self.keys = set()
+
+_states = weakref.WeakKeyDictionary()
+_states_lock = threading.Lock()
+
+def _state(store):
+    with _states_lock:
+        state = _states.get(store)
+        if state is None:
+            state = _states[store] = _ConsolidationState()
+        return state
+
+def consolidate_stm(store, max_age=STM_MAX_AGE, now=None):
+    """
+    Move stm records older than max_age into ltm, skipping pairs already in ltm.
+    Only ltm records appended since the previous run are read, and stm records merged by an earlier run
+    but kept because they share a segment with newer ones are not counted again.
+
+    Returns:
+        dict: {"moved": records appended to ltm, "duplicates": records skipped, "bytes_reclaimed": stm bytes freed}
+    """
+    now = time.time() if now is None else now
+    cutoff = now - max_age
+    state = _state(store)
+    for record in store.iter_records("ltm", cursor=state.ltm_cursor):
+        state.keys.add(_dialog_key(record["data"]))
+        state.ltm_cursor = record["id"]
+    moved = 0
+    duplicates = 0
+    last_id = None
+    for record in store.iter_records("stm", until=cutoff, cursor=state.stm_cursor):
+        last_id = record["id"]
+        key = _dialog_key(record["data"])
+        if key in state.keys:
+            duplicates += 1
+            continue
+        state.keys.add(key)
+        # stamped now rather than with the stm time, ltm time range searches rely on timestamps following ids
+        store.append("ltm", record["data"], session=record["session"])
+        moved += 1
+    if last_id is None:
+        return {"moved": moved, "duplicates": duplicates, "bytes_reclaimed": 0}
+    state.stm_cursor = last_id
+    reclaimed = store.truncate("stm", last_id)
+    return {"moved": moved, "duplicates": duplicates, "bytes_reclaimed": reclaimed}
+
+def apply_retention(store, kind, max_age=None, max_bytes=None, keep_last=None, now=None):
+    """
+    Enforce the retention rules of one memory kind.
+
+    Returns:
+        int: Bytes reclaimed.
+    """
+    now = time.time() if now is None else now
+    reclaimed = 0
+    if max_age is not None:
+        expired = next(store.iter_records(kind, until=now - max_age, reverse=True), None)
+        if expired is not None:
+            reclaimed += store.truncate(kind, expired["id"])
+    if keep_last is not None:
+        beyond = next(itertools.islice(store.iter_records(kind, reverse=True), keep_last, None), None)
+        if beyond is not None:
+            reclaimed += store.truncate(kind, beyond["id"])
+    if max_bytes is not None:
+        reclaimed += store.trim_bytes(kind, max_bytes)
+    return reclaimed
+
+def consolidate(store=None, stm_max_age=STM_MAX_AGE, retention=None):
+    """
+    Run one consolidation pass: merge old stm into ltm, compress ltm and apply retention.
+
+    Args:
+        store: MemoryStore to consolidate, defaults to the shared store.
+        stm_max_age: Age in seconds after which stm records move to ltm.
+        retention: Retention rules per kind, defaults to DEFAULT_RETENTION.
+
+    Returns:
+        dict: Report with records moved, duplicates skipped and bytes reclaimed per kind.
+    """
+    started = time.time()
+    get_persistence().flush()
+    store = get_memory_store() if store is None else store
+    retention = DEFAULT_RETENTION if retention is None else retention
+    merged = consolidate_stm(store, max_age=stm_max_age, now=started)
+    reclaimed = {"stm": merged["bytes_reclaimed"]}
+    reclaimed["ltm"] = store.compress("ltm")
+    for kind, rules in retention.items():
+        reclaimed[kind] = reclaimed.get(kind, 0) + apply_retention(store, kind, now=started, **rules)
+    report = {
+        "moved": merged["moved"],
+        "duplicates": merged["duplicates"],
+        "bytes_reclaimed": reclaimed,
+        "total_bytes_reclaimed": sum(reclaimed.values()),
+        "duration": time.time() - started,
+    }
+    logging.info(f"Memory consolidation: {report}")
+    return report
+
+class ConsolidationScheduler:
+    """
+    Runs consolidate() every interval seconds on a daemon thread.
+    """
+    def __init__(self, interval=CONSOLIDATION_INTERVAL, **options):
+        self.interval = interval
+        self.options = options
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_report = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="MemoryConsolidation", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.last_report = consolidate(**self.options)
+            except Exception as e:
+                logging.error(f"Memory consolidation failed: {e}")
@@ -0,0 +1,120 @@
+# jsonlog.py (c) 2024 Gregory L. Magnusson MIT licence
+# append-only JSONL logs for premises, not premises and thoughts in ./memory/logs
+# every entry is one compact json line written in a single append through the write-behind queue
+# an append costs the same however long the log is, nothing is read back or rewritten
+# a line cut short by a crash is skipped by the readers instead of corrupting the log
+# the JSON array files written by earlier versions are migrated once to .jsonl and kept as .json.migrated
+import os
+import json
+import collections
+import ujson
+import logging
+import threading
+from datetime import datetime
+from memory.persistence import get_persistence
+
+LOGS_FOLDER = "./memory/logs/"
+PREMISES_LOG = LOGS_FOLDER + "premises.jsonl"
+NOT_PREMISE_LOG = LOGS_FOLDER + "notpremise.jsonl"
+THOUGHTS_LOG = LOGS_FOLDER + "thoughts.jsonl"
+
+# JSON array logs of earlier versions and the JSONL logs replacing them
+LEGACY_LOGS = {
+    LOGS_FOLDER + "premises.json": PREMISES_LOG,
+    LOGS_FOLDER + "notpremise.json": NOT_PREMISE_LOG,
+    LOGS_FOLDER + "thoughts.json": THOUGHTS_LOG,
+}
+
+_migrated = False
+_migration_lock = threading.Lock()
+
+def append_jsonl(path, entry):
+    """
+    Queue one entry as a line of the JSONL log at path.
+
+    Args:
+        path: Path of the .jsonl log.
+        entry: JSON serializable entry, a timestamp is added to dicts without one.
+    """
+    if isinstance(entry, dict) and "timestamp" not in entry:
+        entry = {"timestamp": datetime.now().isoformat(), **entry}
+    # one write per line so the line is appended whole
+    get_persistence().append_text(path, ujson.dumps(entry) + "\n")
+
+def iter_jsonl(path):
+    """
+    Stream the entries of a JSONL log one line at a time, skipping lines that do not parse.
+    """
+    try:
+        with open(path, "r") as file:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield ujson.loads(line)
+                except ValueError:
+                    logging.error(f"Skipping unreadable line {number} of {path}")
+    except FileNotFoundError:
+        return
+
+def tail_jsonl(path, count):
+    """
+    Return the last count entries of a JSONL log, reading the file once without loading it whole.
+    """
+    return list(collections.deque(iter_jsonl(path), maxlen=count))
+
+def _load_legacy(path):
+    """
+    Entries of a JSON array log. A file left with trailing garbage by the old
+    non-truncating rewrite still yields the complete array at its start.
+    """
+    with open(path, "r") as file:
+        text = file.read()
+    if not text.strip():
+        return []
+    data, _ = json.JSONDecoder().raw_decode(text.lstrip())
+    return data if isinstance(data, list) else [data]
+
+def migrate_json_array(json_path, jsonl_path):
+    """
+    Convert a JSON array log to JSONL, placing its entries before any already in jsonl_path.
+
+    Returns:
+        int: Entries migrated, 0 if there was nothing to migrate.
+    """
+    if not os.path.exists(json_path):
+        return 0
+    try:
+        entries = _load_legacy(json_path)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not migrate {json_path}: {e}")
+        return 0
+    temporary = jsonl_path + ".tmp"
+    with open(temporary, "w") as file:
+        for entry in entries:
+            file.write(ujson.dumps(entry) + "\n")
+        if os.path.exists(jsonl_path):
+            with open(jsonl_path, "r") as existing:
+                for line in existing:
+                    file.write(line)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, jsonl_path)
+    os.replace(json_path, json_path + ".migrated")
+    return len(entries)
+
+def migrate_logs():
+    """
+    Migrate the legacy JSON array logs once per process, before anything appends to their JSONL logs.
+    """
+    global _migrated
+    with _migration_lock:
+        if _migrated:
+            return
+        _migrated = True
+        get_persistence().flush()
+        for json_path, jsonl_path in LEGACY_LOGS.items():
+            count = migrate_json_array(json_path, jsonl_path)
+            if count:
+                logging.info(f"Migrated {count} entries from {json_path} to {jsonl_path}")
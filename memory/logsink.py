@@ -0,0 +1,304 @@
+# logsink.py (c) 2024 Gregory L. Magnusson MIT licence
+# shared non-blocking logging pipeline for LogicTables, SocraticReasoning and the rest of easyAGI
+# loggers only put records on one queue through a QueueHandler, a listener thread formats and writes them in batches
+# each log file has one handler and one open file however many loggers or instances write to it
+# files rotate to path.1 ... path.N when they pass LOG_MAX_BYTES
+# LOG_LEVELS="LogicTables=WARNING,SocraticReasoning=INFO"   per logger level gates, disabled levels cost one comparison
+# LOG_SAMPLING="LogicTables=0.01"                           keep this fraction of records below WARNING
+# LOG_MAX_BYTES      size in bytes at which a log file is rotated (default 10 MB)
+# LOG_BACKUP_COUNT   number of rotated files kept (default 3)
+# LOG_FLUSH_INTERVAL seconds the listener waits to gather a batch (default 0.2)
+# pending records are written at interpreter exit and by flush_logs()
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "3"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", "0.2"))
+LOG_BATCH_SIZE = 1024
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# level names accepted by the log(message, level) methods of LogicTables and SocraticReasoning
+LEVEL_NAMES = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
+def _parse_settings(value):
+    settings = {}
+    for item in value.split(","):
+        name, _, setting = item.partition("=")
+        if name.strip() and setting.strip():
+            settings[name.strip()] = setting.strip()
+    return settings
+
+LOG_LEVELS = _parse_settings(os.environ.get("LOG_LEVELS", ""))
+LOG_SAMPLING = {name: float(rate) for name, rate in _parse_settings(os.environ.get("LOG_SAMPLING", "")).items()}
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fixed fraction of records below WARNING, evenly spaced. Warnings and errors always pass.
+    """
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.credit = 0.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        self.credit += self.rate
+        if self.credit >= 1.0:
+            self.credit -= 1.0
+            return True
+        return False
+
+class BatchedRotatingFileHandler(logging.Handler):
+    """
+    File handler that buffers formatted records and writes them with one call per batch.
+    The file stays open between batches and is rotated when it passes max_bytes.
+    """
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer = []
+        self.stream = None
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            text = "".join(self.buffer)
+            self.buffer = []
+            try:
+                if self.stream is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self.stream = open(self.path, "a")
+                self.stream.write(text)
+                self.stream.flush()
+                if self.max_bytes and self.stream.tell() >= self.max_bytes:
+                    self.rotate()
+            except Exception as e:
+                logging.getLogger(__name__).debug(f"Writing {self.path} failed: {e}")
+
+    def rotate(self):
+        self.stream.close()
+        self.stream = None
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for number in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{number}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{number + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+        super().close()
+
+class LogListener:
+    """
+    Drains the shared log queue on one thread and writes each batch to the handlers routed for its loggers.
+    """
+    def __init__(self, flush_interval=LOG_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.routes = {}
+        self.condition = threading.Condition()
+        self.submitted = 0
+        self.completed = 0
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        with self.condition:
+            if self.thread is None and not self.stopped:
+                self.thread = threading.Thread(target=self._run, name="LogListener", daemon=True)
+                self.thread.start()
+
+    def enqueue(self, record):
+        with self.condition:
+            # checked and queued under the lock stop() takes, so every counted record lands before the stop marker
+            stopped = self.stopped
+            if not stopped:
+                self.submitted += 1
+                self.queue.put(record)
+        if stopped:
+            # after interpreter exit has stopped the listener records are written directly
+            self._write([record], count=False)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < LOG_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                try:
+                    record = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch, count=True):
+        handlers = set()
+        for record in batch:
+            for handler in self.routes.get(record.name, ()):
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    handlers.add(handler)
+        for handler in handlers:
+            handler.flush()
+        if count:
+            with self.condition:
+                self.completed += len(batch)
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Block until every record queued before this call has been written.
+        """
+        with self.condition:
+            target = self.submitted
+            return self.condition.wait_for(lambda: self.completed >= target, timeout=timeout)
+
+    def stop(self, timeout=None):
+        with self.condition:
+            thread, self.thread = self.thread, None
+            self.stopped = True
+            if thread is not None:
+                self.queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+        # anything queued after the stop marker is written on the calling thread
+        batch = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                batch.append(record)
+        if batch:
+            self._write(batch)
+
+class ListenerQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that counts records on the listener so flush_logs can wait for them.
+    """
+    def __init__(self, listener):
+        super().__init__(listener.queue)
+        self.listener = listener
+
+    def enqueue(self, record):
+        self.listener.enqueue(record)
+
+_listener = LogListener()
+_queue_handler = ListenerQueueHandler(_listener)
+_file_handlers = {}
+_registry_lock = threading.Lock()
+
+def get_file_handler(path):
+    """
+    Return the one handler writing path, creating it on first use.
+    """
+    path = os.path.normpath(path)
+    with _registry_lock:
+        handler = _file_handlers.get(path)
+        if handler is None:
+            handler = BatchedRotatingFileHandler(path)
+            _file_handlers[path] = handler
+        return handler
+
+def get_logger(name, files=(), level=logging.DEBUG, propagate=None):
+    """
+    Return the named logger wired to the shared queue and writing to files.
+    Calling it again with the same name and files adds nothing, so it is safe in __init__ methods.
+
+    Args:
+        name: Logger name.
+        files: Paths this logger writes to.
+        level: Level gate used unless LOG_LEVELS sets one for name.
+        propagate: Optional override of logger.propagate.
+
+    Returns:
+        logging.Logger: The configured logger.
+    """
+    logger = logging.getLogger(name)
+    with _registry_lock:
+        if _queue_handler not in logger.handlers:
+            logger.addHandler(_queue_handler)
+            logger.setLevel(LOG_LEVELS.get(name, level))
+            if name in LOG_SAMPLING:
+                logger.addFilter(SamplingFilter(LOG_SAMPLING[name]))
+        if propagate is not None:
+            logger.propagate = propagate
+    for path in files:
+        handler = get_file_handler(path)
+        with _registry_lock:
+            routes = _listener.routes.setdefault(name, [])
+            if handler not in routes:
+                routes.append(handler)
+    _listener.start()
+    return logger
+
+def set_log_level(name, level):
+    """
+    Change the level gate of a logger, for example set_log_level('LogicTables', logging.WARNING).
+    """
+    logging.getLogger(name).setLevel(level)
+
+def set_log_sampling(name, rate):
+    """
+    Keep only rate (0.0 to 1.0) of the records below WARNING from a logger, 1.0 keeps all.
+    """
+    logger = logging.getLogger(name)
+    for existing in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+        logger.removeFilter(existing)
+    if rate < 1.0:
+        logger.addFilter(SamplingFilter(rate))
+
+def flush_logs(timeout=None):
+    """
+    Wait until every queued log record has been written, use before reading a log file.
+    """
+    return _listener.flush(timeout)
+
+def close_logs():
+    _listener.stop()
+    with _registry_lock:
+        handlers = list(_file_handlers.values())
+    for handler in handlers:
+        handler.close()
+
+atexit.register(close_logs)
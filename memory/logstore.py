@@ -0,0 +1,407 @@
+# logstore.py (c) 2024 Gregory L. Magnusson MIT licence
+# append-only segmented record log used by memory.py for stm ltm episodic and truth
+# each memory kind is one folder of segments instead of one file per write
+# {first_id}.jsonl  one json record per line as {"id": id, "timestamp": timestamp, "data": data}
+# {first_id}.idx    fixed width offset index as (record id, byte offset) pairs
+# record ids increase monotonically and are contiguous inside a segment so a lookup is one seek
+# a segment is sealed and a new one started once it passes segment_bytes
+# fsync is batched every fsync_every records or fsync_interval seconds
+# sealed segments can be gzip compressed to {first_id}.jsonl.gz and dropped oldest first for retention
+import os
+import gzip
+import re
+import bisect
+import struct
+import threading
+import time
+import ujson
+import logging
+
+SEGMENT_BYTES = 4 * 1024 * 1024
+FSYNC_EVERY = 64
+FSYNC_INTERVAL = 1.0
+
+INDEX_ENTRY = struct.Struct("<QQ")
+READ_BATCH = 256
+SEGMENT_PATTERN = re.compile(r"^(\d{20})\.jsonl(\.gz)?$")
+SEGMENT_SUFFIXES = (".jsonl", ".jsonl.gz", ".idx")
+
+class SegmentedLog:
+    """
+    Append-only JSONL record log split into size bounded segments with an offset index.
+    """
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.RLock()
+        self._segment_ids = []
+        self._data_file = None
+        self._index_file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._cache_id = None
+        self._cache_data = None
+        self.next_id = 1
+        os.makedirs(self.directory, exist_ok=True)
+        self._open()
+
+    def _segment_path(self, first_id, suffix):
+        return os.path.join(self.directory, f"{first_id:020d}{suffix}")
+
+    def _scan_segments(self):
+        first_ids = set()
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                first_ids.add(int(match.group(1)))
+        return sorted(first_ids)
+
+    def _open(self):
+        self._segment_ids = self._scan_segments()
+        if not self._segment_ids:
+            return
+        first_id = self._segment_ids[-1]
+        if not os.path.exists(self._segment_path(first_id, ".jsonl")):
+            # the newest segment is already compressed, the next append starts a new one
+            self.next_id = first_id + os.path.getsize(self._segment_path(first_id, ".idx")) // INDEX_ENTRY.size
+            return
+        record_count, data_end = self._recover_segment(first_id)
+        self.next_id = first_id + record_count
+        self._data_file = open(self._segment_path(first_id, ".jsonl"), "ab")
+        self._index_file = open(self._segment_path(first_id, ".idx"), "ab")
+        if self._data_file.tell() != data_end:
+            self._data_file.truncate(data_end)
+            self._data_file.seek(data_end)
+
+    def _recover_segment(self, first_id):
+        """
+        Bring the active segment and its index back in step after an unclean shutdown.
+
+        Returns:
+            tuple: (number of complete records, byte length of the complete records)
+        """
+        data_path = self._segment_path(first_id, ".jsonl")
+        index_path = self._segment_path(first_id, ".idx")
+        offsets = []
+        with open(data_path, "rb") as data_file:
+            offset = 0
+            for line in data_file:
+                if not line.endswith(b"\n"):
+                    break
+                offsets.append(offset)
+                offset += len(line)
+        with open(index_path, "wb") as index_file:
+            for position, record_offset in enumerate(offsets):
+                index_file.write(INDEX_ENTRY.pack(first_id + position, record_offset))
+        if offsets:
+            logging.debug(f"Recovered {len(offsets)} records in {data_path}")
+        return len(offsets), offset
+
+    def _roll_segment(self):
+        if self._data_file is not None:
+            self._sync_files()
+            self._data_file.close()
+            self._index_file.close()
+        first_id = self.next_id
+        self._data_file = open(self._segment_path(first_id, ".jsonl"), "ab")
+        self._index_file = open(self._segment_path(first_id, ".idx"), "ab")
+        self._segment_ids.append(first_id)
+
+    def _sync_files(self):
+        self._data_file.flush()
+        self._index_file.flush()
+        os.fsync(self._data_file.fileno())
+        os.fsync(self._index_file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, data, timestamp=None, session=None):
+        """
+        Append one record and return its id.
+
+        Args:
+            data: JSON serialisable payload.
+            timestamp: Record time in seconds, defaults to now.
+            session: Optional session id stored with the record.
+
+        Returns:
+            int: The id assigned to the record.
+        """
+        with self.lock:
+            if self._data_file is None or self._data_file.tell() >= self.segment_bytes:
+                self._roll_segment()
+            record_id = self.next_id
+            record = {"id": record_id, "timestamp": time.time() if timestamp is None else timestamp, "data": data}
+            if session is not None:
+                record["session"] = session
+            line = (ujson.dumps(record) + "\n").encode("utf-8")
+            offset = self._data_file.tell()
+            self._data_file.write(line)
+            self._index_file.write(INDEX_ENTRY.pack(record_id, offset))
+            self._data_file.flush()
+            self._index_file.flush()
+            self.next_id += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_files()
+            return record_id
+
+    def sync(self):
+        """
+        Force any batched records to stable storage.
+        """
+        with self.lock:
+            if self._data_file is not None and self._unsynced:
+                self._sync_files()
+
+    def close(self):
+        with self.lock:
+            if self._data_file is not None:
+                self._sync_files()
+                self._data_file.close()
+                self._index_file.close()
+                self._data_file = None
+                self._index_file = None
+
+    def _segment_for(self, record_id):
+        with self.lock:
+            segment_ids = list(self._segment_ids)
+        position = bisect.bisect_right(segment_ids, record_id) - 1
+        return segment_ids[position] if position >= 0 else None
+
+    def read(self, record_id):
+        """
+        Read one record by id using the offset index.
+
+        Returns:
+            dict: The record, or None if the id is not in the log.
+        """
+        if record_id < 1 or record_id >= self.next_id:
+            return None
+        first_id = self._segment_for(record_id)
+        if first_id is None:
+            return None
+        records = self._read_block(first_id, record_id, record_id)
+        return records[0] if records else None
+
+    def latest(self):
+        """
+        Return the most recently appended record or None when the log is empty.
+        """
+        with self.lock:
+            last_id = self.next_id - 1
+        return self.read(last_id) if last_id >= 1 else None
+
+    def _decompressed(self, first_id):
+        """
+        Return the whole uncompressed data of a compressed segment, keeping the last one cached.
+        """
+        with self.lock:
+            if self._cache_id == first_id:
+                return self._cache_data
+        try:
+            with gzip.open(self._segment_path(first_id, ".jsonl.gz"), "rb") as data_file:
+                data = data_file.read()
+        except FileNotFoundError:
+            return b""
+        with self.lock:
+            self._cache_id, self._cache_data = first_id, data
+        return data
+
+    def _read_data(self, first_id, start, end):
+        """
+        Read bytes start..end (end None reads to the end) of a segment, compressed or not.
+        """
+        try:
+            with open(self._segment_path(first_id, ".jsonl"), "rb") as data_file:
+                data_file.seek(start)
+                return data_file.read() if end is None else data_file.read(end - start)
+        except FileNotFoundError:
+            data = self._decompressed(first_id)
+            return data[start:] if end is None else data[start:end]
+
+    def _read_block(self, first_id, low_id, high_id):
+        """
+        Read the contiguous records low_id..high_id of one segment with a single seek.
+        """
+        count = high_id - low_id + 1
+        try:
+            with open(self._segment_path(first_id, ".idx"), "rb") as index_file:
+                index_file.seek((low_id - first_id) * INDEX_ENTRY.size)
+                raw = index_file.read((count + 1) * INDEX_ENTRY.size)
+        except FileNotFoundError:
+            # the segment was dropped by retention while it was being read
+            return []
+        offsets = [offset for _, offset in INDEX_ENTRY.iter_unpack(raw[:len(raw) - len(raw) % INDEX_ENTRY.size])]
+        if not offsets:
+            return []
+        data = self._read_data(first_id, offsets[0], offsets[count] if len(offsets) > count else None)
+        return [ujson.loads(line) for line in data.split(b"\n")[:min(count, len(offsets))] if line]
+
+    def iter_records(self, start_id=None, reverse=False):
+        """
+        Stream records in id order, which is also the order they were written.
+
+        Args:
+            start_id: First id to yield, defaults to the oldest record (newest when reverse).
+            reverse: Yield newest first.
+
+        Yields:
+            dict: One record at a time, read in blocks of READ_BATCH through the offset index.
+        """
+        with self.lock:
+            segment_ids = list(self._segment_ids)
+            last_id = self.next_id - 1
+        if not segment_ids or last_id < segment_ids[0]:
+            return
+        if start_id is None:
+            start_id = last_id if reverse else segment_ids[0]
+        if reverse:
+            record_id = min(start_id, last_id)
+            position = bisect.bisect_right(segment_ids, record_id) - 1
+            while position >= 0:
+                first_id = segment_ids[position]
+                while record_id >= first_id:
+                    low_id = max(first_id, record_id - READ_BATCH + 1)
+                    yield from reversed(self._read_block(first_id, low_id, record_id))
+                    record_id = low_id - 1
+                position -= 1
+        else:
+            record_id = max(start_id, segment_ids[0])
+            position = bisect.bisect_right(segment_ids, record_id) - 1
+            while position < len(segment_ids) and record_id <= last_id:
+                first_id = segment_ids[position]
+                segment_last_id = segment_ids[position + 1] - 1 if position + 1 < len(segment_ids) else last_id
+                while record_id <= segment_last_id:
+                    high_id = min(segment_last_id, record_id + READ_BATCH - 1)
+                    yield from self._read_block(first_id, record_id, high_id)
+                    record_id = high_id + 1
+                position += 1
+
+    def search_timestamp(self, timestamp):
+        """
+        Binary search the offset index for the first record written at or after timestamp.
+
+        Returns:
+            int: The record id, or next_id when every record is older.
+        """
+        with self.lock:
+            low_id = self._segment_ids[0] if self._segment_ids else self.next_id
+            high_id = self.next_id
+        while low_id < high_id:
+            middle_id = (low_id + high_id) // 2
+            record = self.read(middle_id)
+            if record is not None and record["timestamp"] < timestamp:
+                low_id = middle_id + 1
+            else:
+                high_id = middle_id
+        return low_id
+
+    def _sealed_segments(self):
+        """
+        Return (first_id, last_id) of every segment that no longer receives appends.
+        """
+        with self.lock:
+            segment_ids = list(self._segment_ids)
+            active = self._data_file is not None
+            next_id = self.next_id
+        if active:
+            segment_ids = segment_ids[:-1]
+        bounds = []
+        for position, first_id in enumerate(segment_ids):
+            last_id = segment_ids[position + 1] - 1 if position + 1 < len(segment_ids) else next_id - 1
+            bounds.append((first_id, last_id))
+        return bounds
+
+    def _remove_segment(self, first_id):
+        reclaimed = 0
+        for suffix in SEGMENT_SUFFIXES:
+            path = self._segment_path(first_id, suffix)
+            if os.path.exists(path):
+                reclaimed += os.path.getsize(path)
+                os.remove(path)
+        return reclaimed
+
+    def size_bytes(self):
+        """
+        Return the bytes used on disk by every segment and index.
+        """
+        with self.lock:
+            segment_ids = list(self._segment_ids)
+        total = 0
+        for first_id in segment_ids:
+            for suffix in SEGMENT_SUFFIXES:
+                path = self._segment_path(first_id, suffix)
+                if os.path.exists(path):
+                    total += os.path.getsize(path)
+        return total
+
+    def compress_sealed(self):
+        """
+        Gzip every sealed segment that is not compressed yet.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        reclaimed = 0
+        for first_id, _ in self._sealed_segments():
+            source = self._segment_path(first_id, ".jsonl")
+            if not os.path.exists(source):
+                continue
+            target = self._segment_path(first_id, ".jsonl.gz")
+            with open(source, "rb") as data_file, gzip.open(target + ".tmp", "wb") as compressed_file:
+                compressed_file.write(data_file.read())
+            with open(target + ".tmp", "rb") as compressed_file:
+                os.fsync(compressed_file.fileno())
+            os.replace(target + ".tmp", target)
+            reclaimed += os.path.getsize(source) - os.path.getsize(target)
+            os.remove(source)
+        return reclaimed
+
+    def drop_through(self, record_id):
+        """
+        Delete every sealed segment whose records all have ids at or below record_id.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        reclaimed = 0
+        for first_id, last_id in self._sealed_segments():
+            if last_id > record_id:
+                break
+            with self.lock:
+                self._segment_ids.remove(first_id)
+                if self._cache_id == first_id:
+                    self._cache_id, self._cache_data = None, None
+            reclaimed += self._remove_segment(first_id)
+        return reclaimed
+
+    def trim_bytes(self, max_bytes):
+        """
+        Delete the oldest sealed segments until the log fits in max_bytes.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        reclaimed = 0
+        size = self.size_bytes()
+        for first_id, last_id in self._sealed_segments():
+            if size <= max_bytes:
+                break
+            freed = self.drop_through(last_id)
+            size -= freed
+            reclaimed += freed
+        return reclaimed
+
+    def clear(self):
+        """
+        Delete every segment. Ids keep increasing for the lifetime of this instance.
+        """
+        with self.lock:
+            self.close()
+            for first_id in self._segment_ids:
+                self._remove_segment(first_id)
+            self._segment_ids = []
+            self._cache_id, self._cache_data = None, None
@@ -4,12 +4,18 @@
 # stores truth in ./memory/truth as belief, truth and fact where fact is a not a tautology as reasoned from SocraticReasoning and logic
 # agency is the executable folder to be controlled by mastermind
 # episodic is the memory folder to be used for multi-modal input response memory storage
-# conversation input response is saved to short term memory folder stm as memory/stm{timestamp}memory.json
+# conversation input response is saved to short term memory through the MemoryStore backend from store.py
+# writes are handed to the write-behind queue from persistence.py and reads first wait for the queued writes of their kind
+# MEMORY_BACKEND=file keeps the ./memory folder layout as segmented logs, MEMORY_BACKEND=sqlite uses ./memory/memory.db
 import os
 import pathlib
 import time
-import ujson
+import atexit
+import threading
 import logging
+from memory.store import FileMemoryStore, SQLiteMemoryStore
+from memory.persistence import get_persistence, close_persistence
+from memory.recall import get_recall_index, flush_recall_index, memory_text
 
 # Define the constants for memory folders
 MEMORY_FOLDER = "./memory/"
@@ -21,6 +27,26 @@ LOGS_FOLDER = MEMORY_FOLDER + "logs/"
 MINDX_FOLDER = "./mindx/"
 AGENCY_FOLDER = MINDX_FOLDER + "agency/"
 
+# memory kinds and their folders for the file backend
+MEMORY_KINDS = {
+    "stm": STM_FOLDER,
+    "ltm": LTM_FOLDER,
+    "episodic": EPISODIC_FOLDER,
+    "truth": TRUTH_FOLDER,
+    "reasoning": MINDX_FOLDER,
+}
+
+# memory backend selected with MEMORY_BACKEND=file or MEMORY_BACKEND=sqlite
+MEMORY_BACKEND = os.environ.get("MEMORY_BACKEND", "file")
+MEMORY_DATABASE = MEMORY_FOLDER + "memory.db"
+NO_PREMISE_CONCLUSION = "No premises available for logic as conclusion."
+
+# memory kinds kept up to date in the recall index from recall.py
+RECALL_KINDS = ("stm", "ltm", "reasoning")
+
+_memory_store = None
+_memory_store_lock = threading.Lock()
+
 class DialogEntry:
     def __init__(self, instruction, response):
         self.instruction = instruction
@@ -47,80 +73,121 @@ def create_memory_folders():
     except Exception as e:
         logging.error(f"Error creating memory folders: {e}")
 
-def store_in_stm(dialog_entry):
-    filename = f"{int(time.time())}.json"
-    filepath = os.path.join(STM_FOLDER, filename)
-    with open(filepath, "w") as file:
-        ujson.dump(dialog_entry.__dict__, file)
-
-def store_in_ltm(dialog_entry):
-    filename = f"{int(time.time())}.json"
-    filepath = os.path.join(LTM_FOLDER, filename)
-    with open(filepath, "w") as file:
-        ujson.dump(dialog_entry.__dict__, file)
-
-def store_episodic_memory(episode):
-    filename = f"{int(time.time())}.json"
-    filepath = os.path.join(EPISODIC_FOLDER, filename)
-    with open(filepath, "w") as file:
-        ujson.dump(episode, file)
-
-def save_valid_truth(valid_truth):
-    filename = f"{int(time.time())}.json"
-    filepath = os.path.join(TRUTH_FOLDER, filename)
-    with open(filepath, "w") as file:
-        ujson.dump(valid_truth, file)
-
-# save conversation memory as input response in short term memory folder ./memory/stm{timestamp}memory.json
-def save_conversation_memory(memory):
-    create_memory_folders()
-
-    timestamp = str(int(time.time()))
-    stm_filename = f"{STM_FOLDER}{timestamp}memory.json"
-    with open(stm_filename, 'w') as f:
-        ujson.dump(memory, f)
-
-# save internal reasoning including nopremise as separate save in mindx folder as {timestamp}internalmemory.json and nopremise{timestamp}internalmemory.json
-def save_internal_reasoning(memory):
-    create_memory_folders()
-
-    timestamp = str(int(time.time()))
-    if memory['conclusion'] == "No premises available for logic as conclusion.":
-        filename = f"{MINDX_FOLDER}nopremise{timestamp}internalmemory.json"
-    else:
-        filename = f"{MINDX_FOLDER}{timestamp}internalmemory.json"
-    with open(filename, 'w') as f:
-        ujson.dump(memory, f)
-
-def load_conversation_memory():
+def create_memory_store(backend=MEMORY_BACKEND):
+    """
+    Create a MemoryStore for the named backend ('file' or 'sqlite').
+    """
     create_memory_folders()
-    memory_files = list(pathlib.Path(MEMORY_FOLDER).glob("*.json"))
-
-    all_memory = []
-    for file_path in memory_files:
-        with open(file_path, "r", encoding="utf-8") as file:
-            memory = ujson.load(file)
-            all_memory.extend(memory)
-
-    return all_memory
+    if backend == "sqlite":
+        return SQLiteMemoryStore(MEMORY_DATABASE)
+    if backend == "file":
+        return FileMemoryStore(MEMORY_KINDS)
+    raise ValueError(f"Unknown memory backend: {backend}")
+
+def get_memory_store():
+    """
+    Return the shared MemoryStore, creating it from MEMORY_BACKEND on first use.
+    """
+    global _memory_store
+    with _memory_store_lock:
+        if _memory_store is None:
+            _memory_store = create_memory_store()
+        return _memory_store
+
+def set_memory_store(store):
+    """
+    Replace the shared MemoryStore, closing the previous one after pending writes reach it.
+    """
+    global _memory_store
+    get_persistence().flush()
+    with _memory_store_lock:
+        previous, _memory_store = _memory_store, store
+    if previous is not None and previous is not store:
+        previous.close()
+
+def sync_memory_store():
+    close_persistence()
+    with _memory_store_lock:
+        store = _memory_store
+    if store is not None:
+        store.sync()
+    flush_recall_index()
+
+atexit.register(sync_memory_store)
+
+def _store(kind, data, session=None):
+    timestamp = time.time()
+    persistence = get_persistence()
+    persistence.store(get_memory_store(), kind, data, session=session, timestamp=timestamp)
+    if kind in RECALL_KINDS:
+        persistence.call(_index_memory, kind, data, timestamp)
+
+def _index_memory(kind, data, timestamp):
+    get_recall_index().add(memory_text(data), kind=kind, timestamp=timestamp)
+
+def recall_memory(query, k=3, kinds=None):
+    """
+    Return the k stored dialog entries and conclusions most relevant to query.
+
+    Returns:
+        list: [{"text", "kind", "timestamp", "score"}] best first.
+    """
+    return get_recall_index().search(query, k=k, kinds=kinds)
+
+def store_in_stm(dialog_entry, session=None):
+    _store("stm", dict(dialog_entry.__dict__), session)
+
+def store_in_ltm(dialog_entry, session=None):
+    _store("ltm", dict(dialog_entry.__dict__), session)
+
+def store_episodic_memory(episode, session=None):
+    _store("episodic", episode, session)
+
+def save_valid_truth(valid_truth, session=None):
+    _store("truth", valid_truth, session)
+
+# save conversation memory as input response in short term memory
+def save_conversation_memory(memory, session=None):
+    _store("stm", memory, session)
+
+# save internal reasoning including nopremise conclusions in the reasoning memory kind (./mindx for the file backend)
+def save_internal_reasoning(memory, session=None):
+    memory = dict(memory)
+    memory["nopremise"] = memory.get("conclusion") == NO_PREMISE_CONCLUSION
+    _store("reasoning", memory, session)
+
+def iter_conversation_memory(since=None, until=None, limit=None, reverse=True, cursor=None, session=None):
+    """
+    Stream conversation memory records lazily in timestamp order, newest first by default.
+
+    Args:
+        since: Only records at or after this unix timestamp.
+        until: Only records before this unix timestamp.
+        limit: Stop after this many records.
+        reverse: Newest first when True, oldest first when False.
+        cursor: Id of the last record of the previous page, iteration resumes after it.
+        session: Only records of this session.
+
+    Yields:
+        dict: {"id", "kind", "session", "timestamp", "data"} where record["id"] is the cursor for the next page.
+    """
+    get_persistence().flush(key="stm")
+    records = get_memory_store().iter_records("stm", session=session, since=since, until=until, reverse=reverse, cursor=cursor)
+    for count, record in enumerate(records):
+        if limit is not None and count >= limit:
+            return
+        yield record
+
+def load_conversation_memory(session=None):
+    return [record["data"] for record in iter_conversation_memory(reverse=False, session=session)]
 
 def delete_conversation_memory():
-    create_memory_folders()
-    memory_files = list(pathlib.Path(MEMORY_FOLDER).glob("*.json"))
+    get_persistence().flush(key="stm")
+    get_memory_store().clear("stm")
 
-    for file_path in memory_files:
-        file_path.unlink()
-
-def get_latest_memory():
-    create_memory_folders()
-    memory_files = sorted(pathlib.Path(MEMORY_FOLDER).glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-
-    if not memory_files:
+def get_latest_memory(session=None):
+    get_persistence().flush(key="stm")
+    record = get_memory_store().latest("stm", session=session)
+    if record is None:
         return []
-
-    latest_file = memory_files[0]
-    with open(latest_file, "r", encoding="utf-8") as file:
-        memory = ujson.load(file)
-
-    return memory
-
+    return record["data"]
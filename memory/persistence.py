@@ -0,0 +1,246 @@
+# persistence.py (c) 2024 Gregory L. Magnusson MIT licence
+# write-behind persistence queue for memory, SocraticReasoning, LogicTables and OpenMind side effects
+# callers enqueue records and return immediately, a dedicated thread batches and writes them
+# the queue is bounded so a slow disk applies backpressure to producers instead of growing memory
+# PERSIST_DURABILITY=buffered   write-behind, files are closed after every batch (default)
+# PERSIST_DURABILITY=fsync      write-behind, every batch is fsynced before it counts as written
+# PERSIST_DURABILITY=sync       no queue, records are written on the calling thread
+# PERSIST_FLUSH_INTERVAL        seconds the writer waits to gather a batch (default 0.05)
+# PERSIST_QUEUE_SIZE            maximum queued records before producers block (default 10000)
+# flush(key=kind) waits only for the queued records of one memory kind, so readers do not drain unrelated writes
+# the queue is drained and flushed at interpreter exit
+import os
+import time
+import queue
+import atexit
+import threading
+import ujson
+import logging
+
+DURABILITY_MODES = ("buffered", "fsync", "sync")
+PERSIST_DURABILITY = os.environ.get("PERSIST_DURABILITY", "buffered")
+PERSIST_FLUSH_INTERVAL = float(os.environ.get("PERSIST_FLUSH_INTERVAL", "0.05"))
+PERSIST_QUEUE_SIZE = int(os.environ.get("PERSIST_QUEUE_SIZE", "10000"))
+BATCH_SIZE = 512
+
+_STOP = object()
+
+class PersistenceQueue:
+    """
+    Bounded write-behind queue drained in batches by one writer thread.
+    """
+    def __init__(self, maxsize=PERSIST_QUEUE_SIZE, flush_interval=PERSIST_FLUSH_INTERVAL, durability=PERSIST_DURABILITY):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.condition = threading.Condition()
+        # held across the closed check and the put so close() cannot slip _STOP in between
+        self.submit_lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.last_submitted = {}  # key -> sequence number of its newest queued record
+        self.thread = None
+        self.closed = False
+
+    def start(self):
+        with self.condition:
+            if self.thread is None and self.durability != "sync":
+                self.thread = threading.Thread(target=self._run, name="PersistenceQueue", daemon=True)
+                self.thread.start()
+
+    def submit(self, record, timeout=None, key=None):
+        """
+        Queue one record, blocking while the queue is full.
+
+        Args:
+            record: Tuple whose first element is the operation, see _write_batch.
+            timeout: Seconds to wait for space before raising queue.Full, None waits forever.
+            key: Optional name, flush(key=key) waits for this record.
+        """
+        if self.durability == "sync":
+            self._write_batch([record])
+            return
+        self.start()
+        with self.submit_lock:
+            if not self.closed:
+                with self.condition:
+                    self.submitted += 1
+                    sequence = self.submitted
+                try:
+                    self.queue.put(record, timeout=timeout)
+                except queue.Full:
+                    with self.condition:
+                        self.submitted -= 1
+                        self.condition.notify_all()
+                    raise
+                if key is not None:
+                    with self.condition:
+                        # records are written in submission order, so the newest one of a key is the one to wait for
+                        self.last_submitted[key] = max(self.last_submitted.get(key, 0), sequence)
+                return
+        # the writer is gone or going, write on the calling thread
+        self._write_batch([record])
+
+    def append_text(self, path, text):
+        self.submit(("append_text", path, text))
+
+    def append_json(self, path, data, indent=0):
+        self.submit(("append_json", path, data, indent))
+
+    def write_json(self, path, data, indent=0):
+        self.submit(("write_json", path, data, indent))
+
+    def store(self, store, kind, data, session=None, timestamp=None):
+        self.submit(("store", store, kind, data, session, timestamp), key=kind)
+
+    def call(self, function, *args):
+        self.submit(("call", function, args))
+
+    def flush(self, timeout=None, key=None):
+        """
+        Block until every record submitted before this call has been written.
+
+        Args:
+            timeout: Seconds to wait, None waits until the records are written.
+            key: Only wait for the records submitted with this key, such as a memory kind.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self.condition:
+            target = self.submitted if key is None else self.last_submitted.get(key, 0)
+            return self.condition.wait_for(lambda: self.completed >= target, timeout=timeout)
+
+    def close(self, timeout=None):
+        """
+        Drain the queue, write everything still pending and stop the writer thread.
+        """
+        with self.submit_lock:
+            if self.closed:
+                return
+            self.closed = True
+            with self.condition:
+                thread = self.thread
+            if thread is not None:
+                self.queue.put(_STOP)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch = []
+            stop = record is _STOP
+            if not stop:
+                batch.append(record)
+                # gather whatever arrives within the flush interval into the same batch
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        record = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is _STOP:
+                        stop = True
+                        break
+                    batch.append(record)
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logging.error(f"Persistence batch of {len(batch)} records failed: {e}")
+                with self.condition:
+                    self.completed += len(batch)
+                    self.condition.notify_all()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        """
+        Write a batch in submission order, keeping one handle open per appended file.
+        """
+        handles = {}
+        stores = set()
+        try:
+            for record in batch:
+                operation = record[0]
+                try:
+                    if operation in ("append_text", "append_json"):
+                        path = record[1]
+                        handle = handles.get(path)
+                        if handle is None:
+                            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                            handle = open(path, "a")
+                            handles[path] = handle
+                        if operation == "append_text":
+                            handle.write(record[2])
+                        else:
+                            ujson.dump(record[2], handle, indent=record[3])
+                            handle.write("\n")
+                    elif operation == "write_json":
+                        path = record[1]
+                        handle = handles.pop(path, None)
+                        if handle is not None:
+                            handle.close()
+                        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                        with open(path, "w") as file:
+                            ujson.dump(record[2], file, indent=record[3])
+                            if self.durability == "fsync":
+                                file.flush()
+                                os.fsync(file.fileno())
+                    elif operation == "store":
+                        _, store, kind, data, session, timestamp = record
+                        store.append(kind, data, session=session, timestamp=timestamp)
+                        stores.add(store)
+                    elif operation == "call":
+                        for handle in handles.values():
+                            handle.flush()
+                        record[1](*record[2])
+                    else:
+                        logging.error(f"Unknown persistence operation: {operation}")
+                except Exception as e:
+                    logging.error(f"Persistence {operation} failed: {e}")
+            if self.durability == "fsync":
+                for handle in handles.values():
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                for store in stores:
+                    store.sync()
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+_persistence = None
+_persistence_lock = threading.Lock()
+
+def get_persistence():
+    """
+    Return the shared PersistenceQueue, starting its writer thread on first use.
+    """
+    global _persistence
+    with _persistence_lock:
+        if _persistence is None:
+            _persistence = PersistenceQueue()
+            _persistence.start()
+        return _persistence
+
+def set_persistence(persistence):
+    """
+    Replace the shared PersistenceQueue, draining the previous one.
+    """
+    global _persistence
+    with _persistence_lock:
+        previous, _persistence = _persistence, persistence
+    if previous is not None and previous is not persistence:
+        previous.close()
+
+def close_persistence():
+    with _persistence_lock:
+        persistence = _persistence
+    if persistence is not None:
+        persistence.close()
+
+atexit.register(close_persistence)
@@ -0,0 +1,243 @@
+# recall.py (c) 2024 Gregory L. Magnusson MIT licence
+# hybrid recall index over short and long term memory for context augmented prompts
+# BM25 over an incremental inverted index for exact terms
+# dense cosine similarity over vectors from a dependency free hashing embedder for fuzzy overlap
+# both rankings are fused with reciprocal rank fusion
+# ./memory/recall/documents.jsonl   append-only {"text", "kind", "timestamp"} per indexed document
+# ./memory/recall/vectors.f32       memory-mapped float32 matrix, one row per document
+# on restart the vectors are mapped back in and only documents missing a vector are embedded
+import os
+import re
+import math
+import zlib
+import hashlib
+import threading
+import time
+import ujson
+import logging
+import numpy as np
+
+RECALL_FOLDER = "./memory/recall/"
+EMBEDDING_DIM = 64
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def text_digest(text):
+    """
+    sha256 of text, identifies a document for deduplication without the collisions of a short checksum.
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+class HashingEmbedder:
+    """
+    Embeds text by hashing unigrams and bigrams into a fixed number of signed buckets.
+    """
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, text, tokens=None):
+        if tokens is None:
+            tokens = tokenize(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            bucket = zlib.crc32(feature.encode("utf-8"))
+            vector[bucket % self.dim] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+class RecallIndex:
+    """
+    Incremental BM25 + dense vector index persisted under folder.
+    """
+    def __init__(self, folder=RECALL_FOLDER, dim=EMBEDDING_DIM):
+        self.folder = folder
+        self.embedder = HashingEmbedder(dim)
+        self.lock = threading.RLock()
+        self.documents = []
+        self.postings = {}
+        self.lengths = []
+        self.total_length = 0
+        self.hashes = set()
+        self.capacity = 0
+        self.vectors = None
+        os.makedirs(self.folder, exist_ok=True)
+        self.documents_path = os.path.join(self.folder, "documents.jsonl")
+        self.vectors_path = os.path.join(self.folder, "vectors.f32")
+        self._load()
+
+    def _map_vectors(self, capacity):
+        """
+        Grow the memory-mapped vector file to hold capacity rows.
+        """
+        size = capacity * self.embedder.dim * 4
+        with open(self.vectors_path, "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+        if self.vectors is not None:
+            self.vectors.flush()
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.embedder.dim))
+        self.capacity = capacity
+
+    def _load(self):
+        if os.path.exists(self.vectors_path):
+            stored_rows = os.path.getsize(self.vectors_path) // (self.embedder.dim * 4)
+        else:
+            stored_rows = 0
+        if os.path.exists(self.documents_path):
+            with open(self.documents_path, "rb") as file:
+                for line in file:
+                    try:
+                        document = ujson.loads(line)
+                    except ValueError:
+                        break
+                    self._index_text(document)
+        self._map_vectors(max(1024, stored_rows, len(self.documents) * 2))
+        # documents whose vector never reached the file are embedded again
+        missing = np.flatnonzero(~self.vectors[:len(self.documents)].any(axis=1))
+        for row in missing:
+            self.vectors[row] = self.embedder.embed(self.documents[row]["text"])
+        if self.documents:
+            logging.debug(f"Recall index loaded {len(self.documents)} documents from {self.folder}")
+
+    def _index_text(self, document):
+        text = document["text"]
+        tokens = tokenize(text)
+        row = len(self.documents)
+        self.documents.append(document)
+        self.hashes.add(text_digest(text))
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            self.postings.setdefault(token, {})[row] = frequency
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        return tokens
+
+    def add(self, text, kind="stm", timestamp=None):
+        """
+        Index one text. Identical texts are indexed once.
+
+        Returns:
+            bool: True if the text was added.
+        """
+        if not isinstance(text, str) or not text.strip():
+            return False
+        with self.lock:
+            if text_digest(text) in self.hashes:
+                return False
+            document = {"text": text, "kind": kind, "timestamp": time.time() if timestamp is None else timestamp}
+            tokens = self._index_text(document)
+            row = len(self.documents) - 1
+            if row >= self.capacity:
+                self._map_vectors(self.capacity * 2)
+            self.vectors[row] = self.embedder.embed(text, tokens)
+            with open(self.documents_path, "a") as file:
+                file.write(ujson.dumps(document) + "\n")
+            return True
+
+    def _bm25(self, tokens, limit):
+        count = len(self.documents)
+        average_length = self.total_length / count if count else 0.0
+        scores = {}
+        for token in set(tokens):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, frequency in postings.items():
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.lengths[row] / average_length)
+                scores[row] = scores.get(row, 0.0) + idf * frequency * (BM25_K1 + 1.0) / (frequency + norm)
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    def _dense(self, tokens, limit):
+        count = len(self.documents)
+        query = self.embedder.embed("", tokens)
+        if not query.any():
+            return []
+        similarities = self.vectors[:count] @ query
+        if count > limit:
+            candidates = np.argpartition(-similarities, limit)[:limit]
+        else:
+            candidates = np.arange(count)
+        candidates = candidates[np.argsort(-similarities[candidates])]
+        return [int(row) for row in candidates if similarities[row] > 0]
+
+    def search(self, query, k=3, kinds=None):
+        """
+        Return the top k documents for query by fused BM25 and dense rank.
+
+        Args:
+            query: Text to search for.
+            k: Number of results.
+            kinds: Optional collection of memory kinds to keep.
+
+        Returns:
+            list: [{"text", "kind", "timestamp", "score"}] best first.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            if not self.documents:
+                return []
+            limit = max(k * 4, 20)
+            fused = {}
+            for ranking in (self._bm25(tokens, limit), self._dense(tokens, limit)):
+                for rank, row in enumerate(ranking):
+                    fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank + 1)
+            results = []
+            for row in sorted(fused, key=fused.get, reverse=True):
+                document = self.documents[row]
+                if kinds is not None and document["kind"] not in kinds:
+                    continue
+                results.append(dict(document, score=fused[row]))
+                if len(results) >= k:
+                    break
+            return results
+
+    def flush(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+
+_recall_index = None
+_recall_index_lock = threading.Lock()
+
+def get_recall_index():
+    """
+    Return the shared RecallIndex, loading it from ./memory/recall on first use.
+    """
+    global _recall_index
+    with _recall_index_lock:
+        if _recall_index is None:
+            _recall_index = RecallIndex()
+        return _recall_index
+
+def flush_recall_index():
+    with _recall_index_lock:
+        recall_index = _recall_index
+    if recall_index is not None:
+        recall_index.flush()
+
+def memory_text(data):
+    """
+    Extract indexable text from a dialog entry, conversation memory or reasoning record.
+    """
+    if isinstance(data, str):
+        return data
+    if not isinstance(data, dict):
+        return ""
+    if "dialog" in data:
+        data = data["dialog"]
+    parts = [data.get(field) for field in ("instruction", "response", "prompt", "conclusion")]
+    return "\n".join(part for part in parts if isinstance(part, str) and part)
@@ -0,0 +1,330 @@
+# store.py (c) 2024 Gregory L. Magnusson MIT licence
+# pluggable MemoryStore backends for the memory package
+# FileMemoryStore keeps the ./memory folder layout with one segmented log per memory kind
+# SQLiteMemoryStore keeps every kind in ./memory/memory.db in WAL mode with indexes on kind, session and timestamp
+# memory kinds are stm ltm episodic truth and reasoning
+# records are returned as {"id": id, "kind": kind, "session": session, "timestamp": timestamp, "data": data}
+# iter_records streams lazily in timestamp order, since is inclusive, until is exclusive
+# cursor is the id of the last record already seen and resumes the stream after it
+# truncate, trim_bytes and compress are used by consolidation.py for retention and return bytes reclaimed
+import os
+import sqlite3
+import threading
+import time
+import ujson
+from memory.logstore import SegmentedLog, READ_BATCH
+
+class MemoryStore:
+    """
+    Interface shared by every memory backend.
+    """
+    def append(self, kind, data, session=None, timestamp=None):
+        """
+        Store one record of the given kind and return its id.
+        """
+        raise NotImplementedError
+
+    def latest(self, kind, session=None):
+        """
+        Return the most recent record of the given kind or None.
+        """
+        raise NotImplementedError
+
+    def iter_records(self, kind, session=None, since=None, until=None, reverse=False, cursor=None):
+        """
+        Stream records of the given kind in timestamp order.
+
+        Args:
+            kind: Memory kind.
+            session: Only yield records of this session.
+            since: Only yield records at or after this timestamp.
+            until: Only yield records before this timestamp.
+            reverse: Yield newest first.
+            cursor: Id of the last record of the previous page, the stream resumes after it.
+        """
+        raise NotImplementedError
+
+    def clear(self, kind):
+        """
+        Delete every record of the given kind.
+        """
+        raise NotImplementedError
+
+    def truncate(self, kind, cursor):
+        """
+        Delete records of the given kind up to and including the record with id cursor.
+        A backend may keep some of those records if it can only delete in larger units.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        raise NotImplementedError
+
+    def trim_bytes(self, kind, max_bytes):
+        """
+        Delete the oldest records of the given kind until it uses at most max_bytes.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        raise NotImplementedError
+
+    def size_bytes(self, kind):
+        """
+        Return the bytes used by records of the given kind.
+        """
+        raise NotImplementedError
+
+    def compress(self, kind):
+        """
+        Compress records of the given kind that are no longer written to.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        return 0
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+class FileMemoryStore(MemoryStore):
+    """
+    Filesystem backend with one SegmentedLog folder per memory kind.
+    """
+    def __init__(self, folders):
+        self.folders = folders
+        self.logs = {}
+        self.lock = threading.Lock()
+
+    def log(self, kind):
+        with self.lock:
+            log = self.logs.get(kind)
+            if log is None:
+                log = SegmentedLog(self.folders[kind])
+                self.logs[kind] = log
+            return log
+
+    def _record(self, kind, record):
+        return {
+            "id": record["id"],
+            "kind": kind,
+            "session": record.get("session"),
+            "timestamp": record["timestamp"],
+            "data": record["data"],
+        }
+
+    def append(self, kind, data, session=None, timestamp=None):
+        return self.log(kind).append(data, timestamp=timestamp, session=session)
+
+    def latest(self, kind, session=None):
+        log = self.log(kind)
+        if session is None:
+            record = log.latest()
+            return None if record is None else self._record(kind, record)
+        return next(self.iter_records(kind, session=session, reverse=True), None)
+
+    def iter_records(self, kind, session=None, since=None, until=None, reverse=False, cursor=None):
+        log = self.log(kind)
+        if reverse:
+            start_id = None if until is None else log.search_timestamp(until) - 1
+            if cursor is not None:
+                start_id = cursor - 1 if start_id is None else min(start_id, cursor - 1)
+        else:
+            start_id = None if since is None else log.search_timestamp(since)
+            if cursor is not None:
+                start_id = cursor + 1 if start_id is None else max(start_id, cursor + 1)
+        if start_id is not None and start_id < 1:
+            return
+        for record in log.iter_records(start_id=start_id, reverse=reverse):
+            timestamp = record["timestamp"]
+            if reverse and since is not None and timestamp < since:
+                return
+            if not reverse and until is not None and timestamp >= until:
+                return
+            if session is None or record.get("session") == session:
+                yield self._record(kind, record)
+
+    def clear(self, kind):
+        self.log(kind).clear()
+
+    def truncate(self, kind, cursor):
+        # only whole sealed segments are dropped, records sharing a segment with newer ones stay
+        return self.log(kind).drop_through(cursor)
+
+    def trim_bytes(self, kind, max_bytes):
+        return self.log(kind).trim_bytes(max_bytes)
+
+    def size_bytes(self, kind):
+        return self.log(kind).size_bytes()
+
+    def compress(self, kind):
+        return self.log(kind).compress_sealed()
+
+    def sync(self):
+        with self.lock:
+            logs = list(self.logs.values())
+        for log in logs:
+            log.sync()
+
+    def close(self):
+        with self.lock:
+            logs = list(self.logs.values())
+            self.logs = {}
+        for log in logs:
+            log.close()
+
+class SQLiteMemoryStore(MemoryStore):
+    """
+    SQLite backend in WAL mode so readers never block the writer.
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS memory (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                session TEXT,
+                timestamp REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS memory_timestamp ON memory (timestamp);
+            CREATE INDEX IF NOT EXISTS memory_kind_timestamp ON memory (kind, timestamp);
+            CREATE INDEX IF NOT EXISTS memory_kind_session_timestamp ON memory (kind, session, timestamp);
+        """)
+
+    def _record(self, row):
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "session": row[2],
+            "timestamp": row[3],
+            "data": ujson.loads(row[4]),
+        }
+
+    def append(self, kind, data, session=None, timestamp=None):
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO memory (kind, session, timestamp, data) VALUES (?, ?, ?, ?)",
+                (kind, session, time.time() if timestamp is None else timestamp, ujson.dumps(data)),
+            )
+            return cursor.lastrowid
+
+    def latest(self, kind, session=None):
+        with self.lock:
+            if session is None:
+                row = self.connection.execute(
+                    "SELECT id, kind, session, timestamp, data FROM memory WHERE kind = ? "
+                    "ORDER BY timestamp DESC, id DESC LIMIT 1",
+                    (kind,),
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT id, kind, session, timestamp, data FROM memory WHERE kind = ? AND session = ? "
+                    "ORDER BY timestamp DESC, id DESC LIMIT 1",
+                    (kind, session),
+                ).fetchone()
+        return None if row is None else self._record(row)
+
+    def iter_records(self, kind, session=None, since=None, until=None, reverse=False, cursor=None):
+        clauses = ["kind = ?"]
+        params = [kind]
+        if session is not None:
+            clauses.append("session = ?")
+            params.append(session)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        order = "DESC" if reverse else "ASC"
+        comparison = "<" if reverse else ">"
+        position = None
+        if cursor is not None:
+            with self.lock:
+                row = self.connection.execute("SELECT timestamp, id FROM memory WHERE id = ?", (cursor,)).fetchone()
+            if row is not None:
+                position = tuple(row)
+        # keyset pagination so each page is one index range scan and only one page is held in memory
+        while True:
+            page_clauses = list(clauses)
+            page_params = list(params)
+            if position is not None:
+                page_clauses.append(f"(timestamp, id) {comparison} (?, ?)")
+                page_params.extend(position)
+            query = (
+                "SELECT id, kind, session, timestamp, data FROM memory WHERE " + " AND ".join(page_clauses) +
+                f" ORDER BY timestamp {order}, id {order} LIMIT ?"
+            )
+            with self.lock:
+                rows = self.connection.execute(query, page_params + [READ_BATCH]).fetchall()
+            for row in rows:
+                yield self._record(row)
+            if len(rows) < READ_BATCH:
+                return
+            position = (rows[-1][3], rows[-1][0])
+
+    def clear(self, kind):
+        with self.lock:
+            self.connection.execute("DELETE FROM memory WHERE kind = ?", (kind,))
+
+    def _delete_through(self, kind, timestamp, record_id):
+        with self.lock:
+            reclaimed = self.connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM memory WHERE kind = ? AND (timestamp, id) <= (?, ?)",
+                (kind, timestamp, record_id),
+            ).fetchone()[0]
+            self.connection.execute(
+                "DELETE FROM memory WHERE kind = ? AND (timestamp, id) <= (?, ?)",
+                (kind, timestamp, record_id),
+            )
+            self.connection.execute("PRAGMA incremental_vacuum")
+        return reclaimed
+
+    def truncate(self, kind, cursor):
+        with self.lock:
+            row = self.connection.execute("SELECT timestamp, id FROM memory WHERE id = ?", (cursor,)).fetchone()
+        if row is None:
+            return 0
+        return self._delete_through(kind, row[0], row[1])
+
+    def trim_bytes(self, kind, max_bytes):
+        excess = self.size_bytes(kind) - max_bytes
+        if excess <= 0:
+            return 0
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT timestamp, id, LENGTH(data) FROM memory WHERE kind = ? ORDER BY timestamp, id",
+                (kind,),
+            )
+            freed = 0
+            last = None
+            for timestamp, record_id, length in rows:
+                freed += length
+                last = (timestamp, record_id)
+                if freed >= excess:
+                    break
+        if last is None:
+            return 0
+        return self._delete_through(kind, last[0], last[1])
+
+    def size_bytes(self, kind):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM memory WHERE kind = ?", (kind,)
+            ).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,86 @@
+# test_consolidation.py (c) 2024 Gregory L. Magnusson MIT licence
+# stm to ltm consolidation, duplicate skipping and retention rules on both memory backends
+# run with python -m unittest discover tests
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from memory.store import FileMemoryStore, SQLiteMemoryStore
+from memory.consolidation import consolidate_stm, apply_retention
+
+DAY = 24 * 60 * 60
+
+def dialog(n):
+    return {"instruction": f"question {n}", "response": f"answer {n}"}
+
+class ConsolidationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def sqlite_store(self):
+        store = SQLiteMemoryStore(os.path.join(self.directory, "memory.db"))
+        self.addCleanup(store.close)
+        return store
+
+    def file_store(self):
+        store = FileMemoryStore({kind: os.path.join(self.directory, kind) for kind in ("stm", "ltm")})
+        self.addCleanup(store.close)
+        return store
+
+    def test_old_stm_moves_to_ltm_and_duplicates_are_skipped(self):
+        store = self.sqlite_store()
+        store.append("ltm", dialog(0), timestamp=self.now - 10 * DAY)
+        store.append("stm", dialog(0), timestamp=self.now - 3 * DAY)  # already in ltm
+        store.append("stm", dialog(1), timestamp=self.now - 3 * DAY)
+        store.append("stm", dialog(1), timestamp=self.now - 2 * DAY)  # repeated in stm
+        store.append("stm", dialog(2), timestamp=self.now - 60)  # too recent to move
+        report = consolidate_stm(store, max_age=DAY, now=self.now)
+        self.assertEqual(report["moved"], 1)
+        self.assertEqual(report["duplicates"], 2)
+        self.assertEqual([record["data"] for record in store.iter_records("stm")], [dialog(2)])
+        ltm = list(store.iter_records("ltm"))
+        self.assertEqual([record["data"] for record in ltm], [dialog(0), dialog(1)])
+        # appended records are stamped when they reach ltm so timestamps follow ids
+        self.assertEqual([record["timestamp"] for record in ltm], sorted(record["timestamp"] for record in ltm))
+
+    def test_second_run_does_not_count_merged_records_again(self):
+        store = self.file_store()  # a file store keeps merged stm records until their segment is sealed
+        for n in range(3):
+            store.append("stm", dialog(n), timestamp=self.now - 2 * DAY)
+        first = consolidate_stm(store, max_age=DAY, now=self.now)
+        self.assertEqual((first["moved"], first["duplicates"]), (3, 0))
+        store.append("stm", dialog(3), timestamp=self.now - 2 * DAY)
+        store.append("ltm", dialog(4))
+        store.append("stm", dialog(4), timestamp=self.now - 2 * DAY)
+        second = consolidate_stm(store, max_age=DAY, now=self.now)
+        self.assertEqual((second["moved"], second["duplicates"]), (1, 1))
+        self.assertEqual(len(list(store.iter_records("ltm"))), 5)
+
+    def test_retention_max_age_and_keep_last(self):
+        store = self.sqlite_store()
+        for n in range(10):
+            store.append("reasoning", {"n": n}, timestamp=self.now - (10 - n) * DAY)
+        apply_retention(store, "reasoning", max_age=5 * DAY + 1, now=self.now)
+        self.assertEqual([record["data"]["n"] for record in store.iter_records("reasoning")], [5, 6, 7, 8, 9])
+        apply_retention(store, "reasoning", keep_last=2, now=self.now)
+        self.assertEqual([record["data"]["n"] for record in store.iter_records("reasoning")], [8, 9])
+
+    def test_retention_max_bytes(self):
+        store = self.sqlite_store()
+        for n in range(50):
+            store.append("episodic", {"text": "x" * 100, "n": n})
+        apply_retention(store, "episodic", max_bytes=1000, now=self.now)
+        remaining = [record["data"]["n"] for record in store.iter_records("episodic")]
+        self.assertLessEqual(store.size_bytes("episodic"), 1000)
+        self.assertTrue(remaining)
+        self.assertEqual(remaining[-1], 49)  # the oldest records go first
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+# test_decision.py (c) 2024 Gregory L. Magnusson MIT licence
+# the enumeration, BDD and DPLL procedures of decision.py must agree with each other and with plain evaluation
+# run with python -m unittest discover tests
+
+import itertools
+import random
+import unittest
+
+from automind import decision
+from automind.expression import compile_expression
+
+VARIABLES = ["A", "B", "C", "D", "E"]
+BINARY = ["and", "or", "xor", "nand", "nor", "implication"]
+
+def random_expression(rng, depth):
+    if depth == 0 or rng.random() < 0.25:
+        name = rng.choice(VARIABLES)
+        return f"not {name}" if rng.random() < 0.3 else name
+    left = random_expression(rng, depth - 1)
+    right = random_expression(rng, depth - 1)
+    if rng.random() < 0.3:
+        return f"{rng.choice(BINARY)}({left}, {right})"
+    return f"({left}) {rng.choice(BINARY)} ({right})"
+
+def brute_force(expression, value):
+    compiled = compile_expression(expression)
+    for values in itertools.product([True, False], repeat=len(VARIABLES)):
+        assignment = dict(zip(VARIABLES, values))
+        if compiled.evaluate(assignment) == value:
+            return True
+    return False
+
+class DecisionTest(unittest.TestCase):
+    def check(self, expression, value, assignment):
+        exists = brute_force(expression, value)
+        if not exists:
+            self.assertIsNone(assignment, expression)
+        else:
+            self.assertIsNotNone(assignment, expression)
+            self.assertEqual(compile_expression(expression).evaluate(assignment), value, expression)
+
+    def test_procedures_agree_on_random_expressions(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            expression = random_expression(rng, 4)
+            for value in (True, False):
+                enumerated = decision.find_assignment(expression, value, VARIABLES)
+                bdd = decision.BDD(VARIABLES)
+                diagram = bdd.find(bdd.expression(expression), value)
+                self.check(expression, value, enumerated)
+                self.check(expression, value, diagram)
+
+    def test_dpll_path_is_used_past_the_enumeration_limit(self):
+        original = decision.ENUMERATION_VARIABLES
+        decision.ENUMERATION_VARIABLES = 0
+        try:
+            rng = random.Random(11)
+            for _ in range(100):
+                expression = random_expression(rng, 4)
+                # a BDD that cannot grow forces the DPLL search over the Tseitin encoding
+                searched = decision.counterexample(expression, VARIABLES, bdd=decision.BDD(VARIABLES, node_limit=2))
+                self.check(expression, False, searched)
+                self.assertEqual(decision.is_tautology(expression, VARIABLES), not brute_force(expression, False))
+        finally:
+            decision.ENUMERATION_VARIABLES = original
+
+    def test_known_results(self):
+        self.assertTrue(decision.is_tautology("A or not A"))
+        self.assertTrue(decision.is_tautology("(A implication B) implication ((not B) implication (not A))"))
+        self.assertFalse(decision.is_satisfiable("A and not A"))
+        self.assertTrue(decision.equivalent("not (A and B)", "(not A) or (not B)"))
+        self.assertEqual(decision.counterexample("A implication B"), {"A": True, "B": False})
+
+    def test_unknown_variable_raises(self):
+        with self.assertRaises(KeyError):
+            decision.counterexample("A and Z", ["A", "B"])
+
+    def test_many_variables_use_the_bdd(self):
+        names = [f"X{n}" for n in range(20)]
+        chain = " and ".join(names)
+        self.assertTrue(decision.is_tautology(f"({chain}) implication X19", names))
+        self.assertEqual(decision.satisfying_assignment(chain, names), {name: True for name in names})
+        self.assertFalse(decision.is_satisfiable(f"({chain}) and not X7", names))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+# test_logic.py (c) 2024 Gregory L. Magnusson MIT licence
+# LogicTables keeps its truth table, BDD and decision results in step with the variables and expressions
+# run with python -m unittest discover tests
+
+import os
+import shutil
+import tempfile
+import unittest
+
+class LogicTablesTest(unittest.TestCase):
+    def setUp(self):
+        # LogicTables and SocraticReasoning write their logs and truths below the working directory
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        from memory.persistence import get_persistence
+        get_persistence().flush(timeout=5)
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_added_variables_extend_the_table(self):
+        from automind.logic import LogicTables
+        tables = LogicTables()
+        tables.add_variable("A")
+        tables.add_expression("A and B")  # B is unknown until the next variable
+        self.assertEqual(len(tables.generate_truth_table()), 2)
+        self.assertFalse(tables.tautology("B or not B"))
+        tables.add_variable("B")
+        self.assertEqual(len(tables.generate_truth_table()), 4)
+        self.assertTrue(tables.tautology("B or not B"))
+        counterexample = tables.counterexample("A and B")
+        self.assertFalse(counterexample["A"] and counterexample["B"])
+
+    def test_update_logic_tables_resets_the_caches(self):
+        from automind.SocraticReasoning import SocraticReasoning
+        reasoning = SocraticReasoning(None)
+        tables = reasoning.logic_tables
+        reasoning.update_logic_tables(["A"], ["A or not A"], [])
+        self.assertEqual(len(tables.generate_truth_table()), 2)
+        self.assertTrue(tables.validate_truth("A or not A"))
+        reasoning.update_logic_tables(["A", "B"], ["A or not A", "A and B", "B or not B"], [])
+        self.assertEqual(len(tables.generate_truth_table()), 4)
+        self.assertTrue(tables.tautology("B or not B"))
+        self.assertFalse(tables.validate_truth("A and B"))
+        self.assertTrue(tables.validate_truth("B or not B"))
+        self.assertLessEqual({"A and B", "B or not B"}, set(tables.truth_table.columns))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# test_logstore.py (c) 2024 Gregory L. Magnusson MIT licence
+# SegmentedLog appends, segment rolling, crash recovery and the .idx rebuild
+# run with python -m unittest discover tests
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from memory.logstore import SegmentedLog, INDEX_ENTRY
+
+class SegmentedLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open_log(self, **kwargs):
+        log = SegmentedLog(self.directory, **kwargs)
+        self.addCleanup(log.close)
+        return log
+
+    def segment_files(self, suffix):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(suffix))
+
+    def test_append_read_and_iterate_across_segments(self):
+        log = self.open_log(segment_bytes=200)
+        ids = [log.append({"n": n}, timestamp=1000 + n) for n in range(20)]
+        self.assertEqual(ids, list(range(1, 21)))
+        self.assertGreater(len(self.segment_files(".jsonl")), 1)
+        self.assertEqual(log.read(7)["data"], {"n": 6})
+        self.assertIsNone(log.read(21))
+        self.assertEqual([record["data"]["n"] for record in log.iter_records()], list(range(20)))
+        self.assertEqual([record["data"]["n"] for record in log.iter_records(reverse=True)], list(reversed(range(20))))
+        self.assertEqual([record["id"] for record in log.iter_records(start_id=15)], list(range(15, 21)))
+        self.assertEqual(log.latest()["data"], {"n": 19})
+
+    def test_reopen_continues_ids(self):
+        log = self.open_log()
+        log.append("a")
+        log.append("b")
+        log.close()
+        log = self.open_log()
+        self.assertEqual(log.append("c"), 3)
+        self.assertEqual([record["data"] for record in log.iter_records()], ["a", "b", "c"])
+
+    def test_torn_write_is_truncated_on_recovery(self):
+        log = self.open_log()
+        for n in range(3):
+            log.append(n)
+        log.close()
+        data_path = os.path.join(self.directory, self.segment_files(".jsonl")[-1])
+        with open(data_path, "ab") as data_file:
+            data_file.write(b'{"id": 4, "timestamp": 1, "da')  # the process died in the middle of a line
+        log = self.open_log()
+        self.assertEqual(log.next_id, 4)
+        self.assertIsNone(log.read(4))
+        self.assertEqual(log.append("after"), 4)
+        self.assertEqual([record["data"] for record in log.iter_records()], [0, 1, 2, "after"])
+
+    def test_index_is_rebuilt_from_the_data(self):
+        log = self.open_log()
+        for n in range(5):
+            log.append({"n": n})
+        log.close()
+        index_path = os.path.join(self.directory, self.segment_files(".idx")[-1])
+        with open(index_path, "r+b") as index_file:
+            index_file.truncate(INDEX_ENTRY.size * 2)  # the index lost its last entries
+        log = self.open_log()
+        self.assertEqual(os.path.getsize(index_path), INDEX_ENTRY.size * 5)
+        self.assertEqual(log.read(5)["data"], {"n": 4})
+        os.remove(index_path)
+        log.close()
+        log = self.open_log()
+        self.assertEqual(log.read(3)["data"], {"n": 2})
+        self.assertEqual(log.append({"n": 5}), 6)
+
+    def test_compressed_segments_stay_readable_and_drop_oldest_first(self):
+        log = self.open_log(segment_bytes=200)
+        for n in range(20):
+            log.append({"n": n}, timestamp=1000 + n)
+        self.assertGreater(log.compress_sealed(), 0)
+        self.assertTrue(self.segment_files(".jsonl.gz"))
+        self.assertEqual([record["data"]["n"] for record in log.iter_records()], list(range(20)))
+        self.assertEqual(log.read(2)["data"], {"n": 1})
+        first_sealed_last_id = log._sealed_segments()[0][1]
+        log.drop_through(first_sealed_last_id)
+        remaining = [record["id"] for record in log.iter_records()]
+        self.assertEqual(remaining[0], first_sealed_last_id + 1)
+        self.assertEqual(remaining[-1], 20)
+
+    def test_search_timestamp(self):
+        log = self.open_log(segment_bytes=200)
+        for n in range(20):
+            log.append(n, timestamp=1000 + n)
+        self.assertEqual(log.search_timestamp(1005), 6)
+        self.assertEqual(log.search_timestamp(0), 1)
+        self.assertEqual(log.search_timestamp(5000), 21)
+
+if __name__ == "__main__":
+    unittest.main()
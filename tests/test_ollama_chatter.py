@@ -0,0 +1,143 @@
+# test_ollama_chatter.py (c) 2024 Gregory L. Magnusson MIT licence
+# OllamaModel against a stub ollama server on localhost
+# the stub answers /api/generate and returns the context it was sent with one token appended,
+# so every request shows which chain of calls its context came from
+# run with python -m unittest discover tests
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from webmind.chatter import OllamaModel, ChatSession
+from webmind.cache import CachedChatter, ResponseCache
+
+class StubOllama(BaseHTTPRequestHandler):
+    """
+    Minimal /api/generate, the response names the topic of the prompt and the context grows by one token per call.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append(data)
+            number = len(server.requests)
+        topic = "beta" if "beta" in data["prompt"] else "alpha"
+        context = (data.get("context") or []) + [TOPICS[topic]]
+        body = json.dumps({"response": f"{topic} fact {number}", "context": context, "done": True,
+                           "prompt_eval_count": 1, "eval_count": 1}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+TOPICS = {"alpha": 1, "beta": 2}
+
+class OllamaChatterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+        cls.server.lock = threading.Lock()
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_port}/api"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+
+    def test_sessions_keep_their_own_context(self):
+        chatter = OllamaModel(self.api_url)
+        first, second = ChatSession(), ChatSession()
+        chatter.generate_response("alpha one", session=first)
+        chatter.generate_response("beta one", session=second)
+        chatter.generate_response("alpha two", session=first)
+        chatter.generate_response("beta two", session=second)
+        sent = [request.get("context") for request in self.server.requests]
+        self.assertEqual(sent, [None, None, [1], [2]])
+        self.assertEqual(first.context, [1, 1])
+        self.assertEqual(second.context, [2, 2])
+
+    def test_call_without_session_sends_no_context(self):
+        chatter = OllamaModel(self.api_url)
+        chatter.generate_response("alpha one")
+        chatter.generate_response("alpha two")
+        self.assertEqual([request.get("context") for request in self.server.requests], [None, None])
+
+    def test_fork_branches_off_the_chain(self):
+        chatter = OllamaModel(self.api_url)
+        chain = ChatSession()
+        chatter.generate_response("alpha one", session=chain)
+        branch = chain.fork()
+        chatter.generate_response("alpha draft", session=branch)
+        chatter.generate_response("alpha two", session=chain)
+        self.assertEqual(self.server.requests[1]["context"], [1])
+        self.assertEqual(self.server.requests[2]["context"], [1])
+        self.assertEqual(branch.context, [1, 1])
+        self.assertEqual(chain.context, [1, 1])
+
+    def test_context_is_not_sent_to_another_model(self):
+        chatter = OllamaModel(self.api_url)
+        session = ChatSession()
+        chatter.generate_response("alpha one", session=session)
+        chatter.set_model("phi3")
+        chatter.generate_response("alpha two", session=session)
+        self.assertIsNone(self.server.requests[1].get("context"))
+
+    def test_cache_does_not_answer_a_call_with_context(self):
+        chatter = CachedChatter(OllamaModel(self.api_url), cache=ResponseCache(path=None))
+        chatter.generate_response("alpha one")
+        chatter.generate_response("alpha one")
+        self.assertEqual(len(self.server.requests), 1)
+        session = ChatSession([1], chatter.get_current_model())
+        chatter.generate_response("alpha one", session=session)
+        chatter.generate_response("alpha one", session=ChatSession([1], chatter.get_current_model()))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.requests[1]["context"], [1])
+        self.assertEqual(session.context, [1, 1])
+
+    def test_concurrent_reasoning_requests_do_not_share_context(self):
+        from automind.SocraticReasoning import SocraticReasoning
+        from memory.persistence import get_persistence
+        directory = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            reasoning = SocraticReasoning(OllamaModel(self.api_url))
+            reasoning.recall_k = 0  # recalled memory could carry the other topic into a prompt
+
+            async def both():
+                return await asyncio.gather(
+                    reasoning.draw_conclusion_async(premises=["alpha is the first topic"]),
+                    reasoning.draw_conclusion_async(premises=["beta is the second topic"]),
+                )
+
+            alpha, beta = asyncio.run(both())
+            get_persistence().flush()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory, ignore_errors=True)
+        self.assertIn("alpha", alpha)
+        self.assertIn("beta", beta)
+        continued = [request for request in self.server.requests if request.get("context")]
+        self.assertTrue(continued, "later rounds should continue the context of their chain")
+        for request in continued:
+            topic = "beta" if "beta" in request["prompt"] else "alpha"
+            self.assertEqual(set(request["context"]), {TOPICS[topic]})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+# test_persistence.py (c) 2024 Gregory L. Magnusson MIT licence
+# PersistenceQueue ordering, flush per key and writes after close
+# run with python -m unittest discover tests
+
+import threading
+import unittest
+
+from memory.persistence import PersistenceQueue
+
+class ListStore:
+    """
+    Minimal MemoryStore recording what the writer appended.
+    """
+    def __init__(self):
+        self.records = []
+
+    def append(self, kind, data, session=None, timestamp=None):
+        self.records.append((kind, data))
+
+    def sync(self):
+        pass
+
+class PersistenceQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.persistence = PersistenceQueue(flush_interval=0.0)
+        self.addCleanup(self.persistence.close, 5)
+
+    def test_records_are_written_in_order(self):
+        store = ListStore()
+        for n in range(50):
+            self.persistence.store(store, "stm", n)
+        self.assertTrue(self.persistence.flush(timeout=5))
+        self.assertEqual([data for _, data in store.records], list(range(50)))
+
+    def test_flush_key_waits_only_for_its_kind(self):
+        store = ListStore()
+        release = threading.Event()
+        self.persistence.call(release.wait, 5)  # the writer is busy with an unrelated record
+        self.assertTrue(self.persistence.flush(timeout=1, key="stm"))
+        self.assertFalse(self.persistence.flush(timeout=0.1))
+        self.persistence.store(store, "stm", "queued behind the busy writer")
+        self.assertFalse(self.persistence.flush(timeout=0.1, key="stm"))
+        release.set()
+        self.assertTrue(self.persistence.flush(timeout=5, key="stm"))
+        self.assertEqual(store.records, [("stm", "queued behind the busy writer")])
+
+    def test_submit_after_close_writes_on_the_caller(self):
+        store = ListStore()
+        self.persistence.store(store, "stm", "before")
+        self.persistence.close(5)
+        self.persistence.store(store, "stm", "after")
+        self.assertEqual([data for _, data in store.records], ["before", "after"])
+
+if __name__ == "__main__":
+    unittest.main()
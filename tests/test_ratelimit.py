@@ -0,0 +1,134 @@
+# test_ratelimit.py (c) 2024 Gregory L. Magnusson MIT licence
+# TokenBucket refill and limits, ProviderScheduler concurrency, FIFO order, pauses and token accounting
+# run with python -m unittest discover tests
+
+import asyncio
+import unittest
+from unittest import mock
+
+from webmind.ratelimit import TokenBucket, ProviderScheduler, parse_duration, provider_limits
+
+class TokenBucketTest(unittest.TestCase):
+    def test_refill_and_delay(self):
+        bucket = TokenBucket(60)  # one token per second
+        bucket.updated = 0.0
+        self.assertEqual(bucket.delay(60, 0.0), 0.0)
+        bucket.take(60, 0.0)
+        self.assertAlmostEqual(bucket.delay(1, 0.0), 1.0)
+        self.assertAlmostEqual(bucket.delay(1, 0.5), 0.5)
+        self.assertEqual(bucket.delay(1, 1.0), 0.0)
+        bucket.take(1, 1.0)
+        self.assertAlmostEqual(bucket.tokens, 0.0)
+
+    def test_capacity_is_one_minute_of_tokens(self):
+        bucket = TokenBucket(60)
+        bucket.updated = 0.0
+        bucket.delay(1, 600.0)
+        self.assertEqual(bucket.tokens, 60)
+        # a request larger than the bucket waits for a full bucket instead of forever
+        bucket.take(60, 600.0)
+        self.assertAlmostEqual(bucket.delay(1000, 600.0), 60.0)
+
+    def test_adjust_and_limit(self):
+        bucket = TokenBucket(100)
+        bucket.updated = 0.0
+        bucket.take(80, 0.0)
+        bucket.adjust(30)  # the call used fewer tokens than reserved
+        self.assertAlmostEqual(bucket.tokens, 50)
+        bucket.adjust(500)
+        self.assertEqual(bucket.tokens, 100)
+        bucket.limit(10, 0.0)  # the provider reported only ten remaining
+        self.assertEqual(bucket.tokens, 10)
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("20"), 20.0)
+        self.assertEqual(parse_duration("1.5s"), 1.5)
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("250ms"), 0.25)
+        self.assertIsNone(parse_duration("soon"))
+        self.assertIsNone(parse_duration(None))
+
+class ProviderSchedulerTest(unittest.TestCase):
+    def test_concurrency_cap_and_arrival_order(self):
+        async def run():
+            scheduler = ProviderScheduler("test", concurrency=2)
+            order = []
+            active = []
+            peak = []
+
+            async def call(n):
+                async with scheduler.slot(1):
+                    order.append(n)
+                    active.append(n)
+                    peak.append(len(active))
+                    await asyncio.sleep(0.01)
+                    active.remove(n)
+
+            await asyncio.gather(*(call(n) for n in range(6)))
+            return order, max(peak), scheduler.stats()
+
+        order, peak, stats = asyncio.run(run())
+        self.assertEqual(order, list(range(6)))
+        self.assertEqual(peak, 2)
+        self.assertEqual((stats["granted"], stats["queued"], stats["in_flight"], stats["queue_depth"]), (6, 4, 0, 0))
+
+    def test_requests_per_minute_delays_the_next_call(self):
+        async def run():
+            scheduler = ProviderScheduler("test", rpm=600)  # one request every 0.1 seconds once the bucket is empty
+            scheduler.requests.tokens = 1
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for _ in range(3):
+                scheduler.release(await scheduler.acquire(1))
+            return loop.time() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.15)
+
+    def test_cancelled_waiter_does_not_hold_the_queue(self):
+        async def run():
+            scheduler = ProviderScheduler("test", concurrency=1)
+            lease = await scheduler.acquire(1)
+            leaving = asyncio.ensure_future(scheduler.acquire(1))
+            staying = asyncio.ensure_future(scheduler.acquire(1))
+            await asyncio.sleep(0)
+            leaving.cancel()
+            await asyncio.sleep(0)
+            scheduler.release(lease)
+            scheduler.release(await asyncio.wait_for(staying, 1))
+            return scheduler.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual((stats["granted"], stats["in_flight"], stats["queue_depth"]), (2, 0, 0))
+
+    def test_reported_usage_returns_unused_tokens(self):
+        async def run():
+            scheduler = ProviderScheduler("test", tpm=1000)
+            async with scheduler.slot(300) as lease:
+                lease.report(tokens=100)
+            return scheduler
+
+        scheduler = asyncio.run(run())
+        self.assertAlmostEqual(scheduler.tokens.tokens, 900, delta=1)  # 1000 - 300 reserved + 200 unused
+        self.assertEqual(scheduler.stats()["tokens_used"], 100)
+
+    def test_throttle_pauses_the_provider(self):
+        async def run():
+            scheduler = ProviderScheduler("test", rpm=600, tpm=6000)
+            scheduler.throttle({"retry-after": "0.2", "x-ratelimit-remaining-tokens": "50"})
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            scheduler.release(await scheduler.acquire(10))
+            return loop.time() - started, scheduler
+
+        waited, scheduler = asyncio.run(run())
+        self.assertGreaterEqual(waited, 0.15)
+        self.assertLess(scheduler.tokens.tokens, 100)  # 50 reported, refilled during the pause, 10 taken
+        self.assertEqual(scheduler.stats()["throttled"], 1)
+
+    def test_limits_come_from_the_environment(self):
+        with mock.patch.dict("os.environ", {"GROQ_RPM": "5", "GROQ_CONCURRENCY": "1"}):
+            self.assertEqual(provider_limits("groq"), (5, 6000, 1))
+        self.assertEqual(provider_limits("unknown"), (60, 0, 4))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# test_resilience.py (c) 2024 Gregory L. Magnusson MIT licence
+# CircuitBreaker states, error classification and one breaker failure per chatter call after its retries
+# run with python -m unittest discover tests
+
+import unittest
+
+from webmind.resilience import CircuitBreaker, CircuitOpenError, ChatterError, classify, get_breaker
+from webmind.chatter import Chatter
+
+class CircuitBreakerTest(unittest.TestCase):
+    def open_breaker(self, breaker):
+        for _ in range(breaker.failure_threshold):
+            breaker.allow()
+            breaker.record_failure()
+
+    def test_trips_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", failures=3, cooldown=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()  # a success resets the run of failures
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.allow()
+        self.assertFalse(raised.exception.transient)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(breaker.stats()["trips"], 1)
+        self.assertEqual(breaker.stats()["rejected"], 1)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker("test", failures=2, cooldown=60)
+        self.open_breaker(breaker)
+        breaker.opened_at -= 60  # the cooldown is over
+        self.assertEqual(breaker.state, "half_open")
+        breaker.allow()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()  # a second call waits for the trial
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        breaker.allow()
+
+    def test_failed_trial_opens_the_circuit_again(self):
+        breaker = CircuitBreaker("test", failures=2, cooldown=60)
+        self.open_breaker(breaker)
+        breaker.opened_at -= 60
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.stats()["trips"], 2)
+
+    def test_abandoned_trial_lets_the_next_call_try(self):
+        breaker = CircuitBreaker("test", failures=2, cooldown=60)
+        self.open_breaker(breaker)
+        breaker.opened_at -= 60
+        breaker.allow()
+        breaker.record_abandoned()  # the trial was cancelled before the provider answered
+        self.assertEqual(breaker.state, "half_open")
+        breaker.allow()
+
+    def test_classify(self):
+        class Response:
+            status_code = 503
+            headers = {"retry-after": "2"}
+
+        class APIStatusError(Exception):
+            response = Response()
+
+        error = classify(APIStatusError("unavailable"), "test")
+        self.assertTrue(error.transient)
+        self.assertEqual((error.status, error.retry_after), (503, 2.0))
+        self.assertTrue(classify(TimeoutError(), "test").transient)
+        self.assertFalse(classify(ValueError("bad request"), "test").transient)
+
+class Flaky(Chatter):
+    """
+    Chatter failing its first failures calls with a transient error.
+    """
+    def __init__(self, provider, failures):
+        super().__init__()
+        self.provider = provider
+        self.failures = failures
+        self.attempts = 0
+
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ChatterError(self.provider, "503", transient=True, status=503, retry_after=0.001)
+        return "ok"
+
+class RetryAccountingTest(unittest.TestCase):
+    def test_retried_call_that_succeeds_is_one_success(self):
+        chatter = Flaky("test-retry-success", failures=2)
+        self.assertEqual(chatter.generate_response("question"), "ok")
+        self.assertEqual(chatter.attempts, 3)
+        stats = get_breaker(chatter.provider).stats()
+        self.assertEqual((stats["successes"], stats["failures"]), (1, 0))
+
+    def test_call_failing_all_its_retries_is_one_failure(self):
+        chatter = Flaky("test-retry-failure", failures=100)
+        breaker = get_breaker(chatter.provider)
+        for call in range(breaker.failure_threshold - 1):
+            with self.assertRaises(ChatterError):
+                chatter.generate_response("question")
+        self.assertEqual(breaker.stats()["failures"], breaker.failure_threshold - 1)
+        self.assertEqual(breaker.state, "closed")  # retries did not trip the breaker early
+        self.assertGreater(chatter.attempts, breaker.failure_threshold)
+        with self.assertRaises(ChatterError):
+            chatter.generate_response("question")
+        self.assertEqual(breaker.state, "open")
+        attempts = chatter.attempts
+        with self.assertRaises(CircuitOpenError):
+            chatter.generate_response("question")
+        self.assertEqual(chatter.attempts, attempts)  # an open circuit fails fast without calling the provider
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# test_router.py (c) 2024 Gregory L. Magnusson MIT licence
+# ChatterRouter hedged requests, failover, open circuits and the latency statistics it ranks providers by
+# every test uses its own provider names because circuit breakers and schedulers are shared per provider
+# run with python -m unittest discover tests
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from webmind import router
+from webmind.router import ChatterRouter, ProviderStats
+from webmind.chatter import Chatter
+from webmind.resilience import ChatterError, get_breaker
+
+class Fake(Chatter):
+    """
+    Chatter answering after delay seconds, or failing with a transient error.
+    """
+    def __init__(self, provider, delay, fail=False, tokens=("a", "b")):
+        super().__init__()
+        self.provider = provider
+        self.delay = delay
+        self.fail = fail
+        self.tokens = tokens
+        self.attempts = 0
+
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
+        self.attempts += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ChatterError(self.provider, "503", transient=True, status=503, retry_after=0.001)
+        return f"{self.provider}:{knowledge}"
+
+    async def stream_complete(self, knowledge, timeout=None, lease=None, session=None):
+        self.attempts += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ChatterError(self.provider, "503", transient=True, status=503, retry_after=0.001)
+        for token in self.tokens:
+            yield token
+
+def route(chatter_router, knowledge):
+    async def run():
+        response = await chatter_router.scheduled(knowledge)
+        await asyncio.sleep(0.01)  # let the cancelled calls record themselves
+        return response
+    return asyncio.run(run())
+
+class ChatterRouterTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(router, "ROUTER_HEDGE_DELAY", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hedged_request_wins_over_a_slow_provider(self):
+        slow, fast = Fake("hedge-slow", 1.0), Fake("hedge-fast", 0.01)
+        chatter_router = ChatterRouter([slow, fast])
+        started = time.monotonic()
+        self.assertEqual(route(chatter_router, "q"), "hedge-fast:q")
+        self.assertLess(time.monotonic() - started, 0.5)
+        stats = chatter_router.stats()
+        self.assertEqual((stats["hedges"], stats["hedge_wins"]), (1, 1))
+        # the cancelled call is not a latency sample but still ranks the slow provider last
+        self.assertEqual(stats["providers"]["hedge-slow"]["cancelled"], 1)
+        self.assertIsNone(stats["providers"]["hedge-slow"]["p50"])
+        self.assertEqual(chatter_router.ranked(), [fast, slow])
+
+    def test_hedging_off_waits_for_the_first_provider(self):
+        first, second = Fake("nohedge-first", 0.15), Fake("nohedge-second", 0.01)
+        chatter_router = ChatterRouter([first, second], hedge=False)
+        self.assertEqual(route(chatter_router, "q"), "nohedge-first:q")
+        self.assertEqual(second.attempts, 0)
+
+    def test_failure_fails_over_without_retrying(self):
+        failing, healthy = Fake("failover-bad", 0.0, fail=True), Fake("failover-good", 0.0)
+        chatter_router = ChatterRouter([failing, healthy], hedge=False)
+        self.assertEqual(route(chatter_router, "q"), "failover-good:q")
+        self.assertEqual(failing.attempts, 1)  # the next provider is faster than a backoff
+        self.assertEqual(chatter_router.stats()["failovers"], 1)
+        self.assertEqual(chatter_router.ranked(), [healthy, failing])
+
+    def test_last_provider_retries_and_its_error_is_raised(self):
+        first, last = Fake("allfail-first", 0.0, fail=True), Fake("allfail-last", 0.0, fail=True)
+        chatter_router = ChatterRouter([first, last], hedge=False)
+        with self.assertRaises(ChatterError) as raised:
+            route(chatter_router, "q")
+        self.assertEqual(raised.exception.provider, "allfail-last")
+        self.assertEqual(first.attempts, 1)
+        self.assertGreater(last.attempts, 1)
+
+    def test_open_circuit_is_skipped(self):
+        tripped, healthy = Fake("circuit-open", 0.0), Fake("circuit-closed", 0.0)
+        get_breaker(tripped.provider).opened_at = time.monotonic()
+        chatter_router = ChatterRouter([tripped, healthy])
+        self.assertEqual(route(chatter_router, "q"), "circuit-closed:q")
+        self.assertEqual(tripped.attempts, 0)
+        self.assertGreaterEqual(chatter_router.stats()["skipped"], 1)
+        get_breaker(healthy.provider).opened_at = time.monotonic()
+        with self.assertRaises(ChatterError):
+            route(chatter_router, "q")
+
+    def test_stream_fails_over_before_the_first_token(self):
+        failing, healthy = Fake("stream-bad", 0.0, fail=True), Fake("stream-good", 0.0, tokens=("x", "y"))
+        chatter_router = ChatterRouter([failing, healthy])
+
+        async def run():
+            return [token async for token in chatter_router.scheduled_stream("q")]
+
+        self.assertEqual(asyncio.run(run()), ["x", "y"])
+        self.assertEqual(failing.attempts, 1)
+
+class ProviderStatsTest(unittest.TestCase):
+    def test_cancelled_calls_stay_out_of_the_percentiles(self):
+        stats = ProviderStats()
+        for latency in (0.1, 0.2, 0.3):
+            stats.record(latency, True)
+        for _ in range(4):
+            stats.record_cancelled(2.0)
+        self.assertEqual(stats.percentile(95), 0.3)
+        self.assertEqual(stats.rank_latency(), 2.0)
+        stats.record(5.0, False)
+        self.assertAlmostEqual(stats.error_rate, router.ERROR_DECAY)
+        self.assertEqual(stats.stats()["errors"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
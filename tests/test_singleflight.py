@@ -0,0 +1,120 @@
+# test_singleflight.py (c) 2024 Gregory L. Magnusson MIT licence
+# SingleFlight sharing one upstream call between concurrent callers, its errors and its cancellation
+# run with python -m unittest discover tests
+
+import asyncio
+import threading
+import time
+import unittest
+
+from webmind.singleflight import SingleFlight
+
+class SingleFlightTest(unittest.TestCase):
+    def test_threads_share_one_call_and_own_their_result(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        upstream = []
+
+        def fetch():
+            upstream.append(1)
+            started.set()
+            release.wait(5)
+            return {"answer": [1, 2]}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.call("key", fetch)))
+        leader.start()
+        self.assertTrue(started.wait(5))
+        followers = [threading.Thread(target=lambda: results.append(flights.call("key", fetch))) for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        while flights.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(len(upstream), 1)
+        self.assertEqual(results, [{"answer": [1, 2]}] * 4)
+        results[0]["answer"].append(3)  # every caller holds its own copy
+        self.assertEqual(results[1], {"answer": [1, 2]})
+        self.assertEqual(flights.stats(), {"calls": 1, "coalesced": 3, "in_flight": 0})
+
+    def test_error_reaches_every_caller_and_is_not_remembered(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise ValueError("upstream failed")
+
+        with self.assertRaises(ValueError):
+            flights.call("key", fail)
+        self.assertEqual(flights.call("key", lambda: "recovered"), "recovered")
+        self.assertEqual(flights.stats()["calls"], 2)
+
+    def test_async_callers_share_one_call(self):
+        flights = SingleFlight()
+        upstream = []
+
+        async def fetch():
+            upstream.append(1)
+            await asyncio.sleep(0.05)
+            return "shared"
+
+        async def run():
+            first = await asyncio.gather(*(flights.call_async("key", fetch) for _ in range(5)))
+            second = await flights.call_async("key", fetch)  # the landed call is not reused
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, ["shared"] * 5)
+        self.assertEqual(second, "shared")
+        self.assertEqual(len(upstream), 2)
+        self.assertEqual(flights.stats(), {"calls": 2, "coalesced": 4, "in_flight": 0})
+
+    def test_cancelled_caller_leaves_the_call_running_for_the_others(self):
+        flights = SingleFlight()
+        cancelled = []
+
+        async def fetch():
+            try:
+                await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "done"
+
+        async def run():
+            leaving = asyncio.ensure_future(flights.call_async("key", fetch))
+            staying = asyncio.ensure_future(flights.call_async("key", fetch))
+            await asyncio.sleep(0.01)
+            leaving.cancel()
+            return await staying, leaving.cancelled()
+
+        self.assertEqual(asyncio.run(run()), ("done", True))
+        self.assertEqual(cancelled, [])
+
+    def test_call_is_cancelled_when_every_caller_has_gone(self):
+        flights = SingleFlight()
+        cancelled = []
+
+        async def fetch():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def run():
+            callers = [asyncio.ensure_future(flights.call_async("key", fetch)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            await asyncio.sleep(0.01)
+            return flights.stats()["in_flight"]
+
+        self.assertEqual(asyncio.run(run()), 0)
+        self.assertEqual(cancelled, [1])
+
+if __name__ == "__main__":
+    unittest.main()
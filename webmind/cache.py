@@ -0,0 +1,402 @@
+# cache.py (c) 2024 Gregory L. Magnusson MIT licence
+# response cache wrapped around every chatter used for reasoning
+# a response is keyed by provider, model, prompt and generation parameters
+# the memory tier is an LRU of recent responses, the disk tier is ./memory/cache/llm.db in SQLite WAL mode
+# disk writes go through the write-behind persistence queue so a cache store never waits on disk
+# entries expire after LLM_CACHE_TTL seconds and the least recently used are evicted past LLM_CACHE_MAX_BYTES
+# error responses and empty responses are never cached
+# on a miss identical concurrent requests share one upstream call through singleflight.py
+# streamed requests are cached too, a hit arrives as one token and a coalesced follower receives the leader's full response
+# a call continuing the ollama context of its ChatSession is never cached or coalesced
+# LLM_CACHE=off                 disable the cache
+# LLM_COALESCE=off              disable coalescing of identical in-flight requests
+# LLM_CACHE_PATH                SQLite file of the disk tier (default ./memory/cache/llm.db)
+# LLM_CACHE_TTL                 seconds a response stays valid (default 604800, one week)
+# LLM_CACHE_MAX_BYTES           size of the disk tier before eviction (default 64 MB)
+# LLM_CACHE_MEMORY_ENTRIES      responses kept in the memory tier (default 1024)
+# calls that must be non-deterministic pass cache=False or use a chatter with cache_enabled = False
+import os
+import time
+import asyncio
+import hashlib
+import inspect
+import sqlite3
+import threading
+import collections
+import ujson
+import logging
+from memory.persistence import get_persistence
+from webmind.singleflight import get_single_flight
+
+LLM_CACHE = os.environ.get("LLM_CACHE", "on").lower() not in ("off", "0", "false", "no")
+LLM_COALESCE = os.environ.get("LLM_COALESCE", "on").lower() not in ("off", "0", "false", "no")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "./memory/cache/llm.db")
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+# eviction trims the disk tier to this fraction of max_bytes so it does not run on every store
+EVICTION_TARGET = 0.9
+
+def cache_key(provider, model, prompt, params=None):
+    """
+    Stable key of one request, parameters are compared by value whatever their order.
+    """
+    payload = ujson.dumps([provider, model, prompt, params or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_cacheable(response):
+    return isinstance(response, str) and bool(response.strip()) and not response.startswith("error:")
+
+class ResponseCache:
+    """
+    Two tier response cache with an in-memory LRU in front of a SQLite table.
+
+    Args:
+        path: SQLite file of the disk tier, None keeps the cache in memory only.
+        ttl: Seconds a response stays valid, 0 keeps responses until they are evicted.
+        max_bytes: Size of the disk tier before the least recently used responses are evicted.
+        memory_entries: Responses kept in the memory tier.
+    """
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES, memory_entries=LLM_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0}
+        self.connection = None
+        self.disk_bytes = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+            """)
+            self.disk_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def _remember(self, key, response, created):
+        self.memory[key] = (response, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get_memory(self, key):
+        """
+        Look key up in the memory tier only, never touching disk.
+
+        Returns:
+            str: The cached response, or None.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[1], now):
+                del self.memory[key]
+                self.counters["expired"] += 1
+                return None
+            self.memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return entry[0]
+
+    def get(self, key):
+        """
+        Look key up in the memory tier and then on disk, counting a miss when neither has it.
+
+        Returns:
+            str: The cached response, or None.
+        """
+        response = self.get_memory(key)
+        if response is not None:
+            return response
+        now = time.time()
+        with self.lock:
+            row = None
+            if self.connection is not None:
+                row = self.connection.execute("SELECT response, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            response, created, size = row
+            if self._expired(created, now):
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.disk_bytes -= size
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._remember(key, response, created)
+            self.counters["disk_hits"] += 1
+            return response
+
+    def put(self, key, response, provider="", model=None):
+        """
+        Store a response in the memory tier now and on disk through the persistence queue.
+        """
+        created = time.time()
+        with self.lock:
+            self._remember(key, response, created)
+            self.counters["stores"] += 1
+        if self.connection is not None:
+            get_persistence().call(self._write, key, provider, model, response, created)
+
+    def _write(self, key, provider, model, response, created):
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, size, created, created),
+            )
+            self.disk_bytes += size - (previous[0] if previous else 0)
+            if self.max_bytes and self.disk_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Drop expired responses, then the least recently used until the disk tier is under EVICTION_TARGET of max_bytes.
+        """
+        if self.ttl > 0:
+            expired = self.connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            self.counters["expired"] += max(expired, 0)
+            self.disk_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = self.max_bytes * EVICTION_TARGET
+        removed = []
+        freed = 0
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if self.disk_bytes - freed <= target:
+                break
+            removed.append((key,))
+            freed += size
+        if removed:
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", removed)
+            self.disk_bytes -= freed
+            self.counters["evictions"] += len(removed)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.connection is not None:
+                self.connection.execute("DELETE FROM responses")
+            self.disk_bytes = 0
+
+    def stats(self):
+        """
+        Hit and miss counters with the hit rate and the size of each tier.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+            stats["disk_bytes"] = self.disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+class CachedChatter:
+    """
+    Chatter wrapper answering repeated requests from a ResponseCache and coalescing identical requests in flight.
+    generate_response_async is only offered when the wrapped chatter has it, so callers can keep choosing between the two.
+
+    Args:
+        chatter: The chatter to wrap.
+        cache: ResponseCache to use, defaults to the shared cache unless LLM_CACHE=off.
+        flights: SingleFlight to coalesce through, defaults to the shared one unless LLM_COALESCE=off.
+    """
+    def __init__(self, chatter, cache=None, flights=None):
+        self.chatter = chatter
+        self.cache = cache if cache is not None else (get_response_cache() if LLM_CACHE else None)
+        self.flights = flights if flights is not None else (get_single_flight() if LLM_COALESCE else None)
+        self.cache_enabled = True
+        self.provider = getattr(chatter, "provider", type(chatter).__name__)
+        parameters = _parameters(getattr(chatter, "generate_response", None))
+        self.accepts_timeout = "timeout" in parameters
+        self.accepts_session = "session" in parameters
+        if hasattr(chatter, "generate_response_async"):
+            parameters = _parameters(chatter.generate_response_async)
+            self.async_accepts_timeout = "timeout" in parameters
+            self.async_accepts_session = "session" in parameters
+            self.generate_response_async = self._generate_response_async
+        if hasattr(chatter, "stream_response"):
+            self.stream_accepts_session = "session" in _parameters(chatter.stream_response)
+            self.stream_response = self._stream_response
+
+    def __getattr__(self, name):
+        # set_model, get_current_model and anything else belong to the wrapped chatter
+        return getattr(self.__dict__["chatter"], name)
+
+    def key(self, knowledge, args=(), kwargs=None):
+        get_model = getattr(self.chatter, "get_current_model", None)
+        model = get_model() if get_model else getattr(self.chatter, "current_model", None)
+        params = dict(getattr(self.chatter, "generation_params", None) or {})
+        if args:
+            params["args"] = list(args)
+        if kwargs:
+            params.update(kwargs)
+        return cache_key(self.provider, model, f"{knowledge}", params), model
+
+    def generate_response(self, knowledge, *args, timeout=None, cache=True, session=None, **kwargs):
+        """
+        Cached and coalesced generate_response of the wrapped chatter, cache=False always makes its own provider call.
+        A call continuing the context of its session is never cached or coalesced, the key does not cover the context.
+        """
+        kwargs_call = dict(kwargs)
+        if timeout is not None and self.accepts_timeout:
+            kwargs_call["timeout"] = timeout
+        if session is not None and self.accepts_session:
+            kwargs_call["session"] = session
+        if not (cache and self.cache_enabled) or _continues(session):
+            return self.chatter.generate_response(knowledge, *args, **kwargs_call)
+        key, model = self.key(knowledge, args, kwargs)
+        if self.cache is not None:
+            response = self.cache.get(key)
+            if response is not None:
+                return response
+        if self.flights is None:
+            return self._fetch(key, model, knowledge, args, kwargs_call)
+        return self.flights.call(key, self._fetch, key, model, knowledge, args, kwargs_call)
+
+    def _fetch(self, key, model, knowledge, args, kwargs):
+        response = self.chatter.generate_response(knowledge, *args, **kwargs)
+        if self.cache is not None and is_cacheable(response):
+            self.cache.put(key, response, self.provider, model)
+        return response
+
+    async def _generate_response_async(self, knowledge, *args, timeout=None, cache=True, session=None, **kwargs):
+        """
+        Cached and coalesced generate_response_async of the wrapped chatter, the disk tier is read in a worker thread.
+        """
+        kwargs_call = dict(kwargs)
+        if timeout is not None and self.async_accepts_timeout:
+            kwargs_call["timeout"] = timeout
+        if session is not None and self.async_accepts_session:
+            kwargs_call["session"] = session
+        if not (cache and self.cache_enabled) or _continues(session):
+            return await self.chatter.generate_response_async(knowledge, *args, **kwargs_call)
+        key, model = self.key(knowledge, args, kwargs)
+        if self.cache is not None:
+            response = self.cache.get_memory(key)
+            if response is None:
+                response = await asyncio.to_thread(self.cache.get, key)
+            if response is not None:
+                return response
+        if self.flights is None:
+            return await self._fetch_async(key, model, knowledge, args, kwargs_call)
+        return await self.flights.call_async(key, lambda: self._fetch_async(key, model, knowledge, args, kwargs_call))
+
+    async def _fetch_async(self, key, model, knowledge, args, kwargs):
+        response = await self.chatter.generate_response_async(knowledge, *args, **kwargs)
+        if self.cache is not None and is_cacheable(response):
+            self.cache.put(key, response, self.provider, model)
+        return response
+
+    async def _stream_response(self, knowledge, timeout=None, cache=True, session=None):
+        """
+        Cached and coalesced stream_response of the wrapped chatter.
+        Only the caller making the upstream call receives tokens as they arrive, the others get the whole response as one token.
+        """
+        kwargs = {"session": session} if session is not None and self.stream_accepts_session else {}
+        if not (cache and self.cache_enabled) or _continues(session):
+            async for token in self.chatter.stream_response(knowledge, timeout=timeout, **kwargs):
+                yield token
+            return
+        key, model = self.key(knowledge)
+        if self.cache is not None:
+            response = self.cache.get_memory(key)
+            if response is None:
+                response = await asyncio.to_thread(self.cache.get, key)
+            if response is not None:
+                yield response
+                return
+        tokens = asyncio.Queue()
+        fetch = lambda: self._fetch_stream(key, model, knowledge, timeout, tokens, kwargs)
+        if self.flights is None:
+            flight = asyncio.ensure_future(fetch())
+        else:
+            flight = asyncio.ensure_future(self.flights.call_async(key, fetch))
+        streamed = False
+        try:
+            while not flight.done():
+                getter = asyncio.ensure_future(tokens.get())
+                await asyncio.wait({getter, flight}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    streamed = True
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            while not tokens.empty():
+                streamed = True
+                yield tokens.get_nowait()
+            response = flight.result()
+            if not streamed and response:
+                yield response
+        finally:
+            flight.cancel()
+
+    async def _fetch_stream(self, key, model, knowledge, timeout, tokens, kwargs):
+        parts = []
+        async for token in self.chatter.stream_response(knowledge, timeout=timeout, **kwargs):
+            parts.append(token)
+            tokens.put_nowait(token)
+        response = "".join(parts)
+        if self.cache is not None and is_cacheable(response):
+            self.cache.put(key, response, self.provider, model)
+        return response
+
+def _continues(session):
+    # the response depends on the session's context, which the cache key does not cover
+    return session is not None and bool(getattr(session, "context", None))
+
+def _parameters(function):
+    try:
+        return inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return {}
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Return the shared ResponseCache, opening its disk tier on first use.
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            try:
+                _response_cache = ResponseCache()
+            except sqlite3.Error as e:
+                logging.error(f"LLM response cache disk tier unavailable, using memory only: {e}")
+                _response_cache = ResponseCache(path=None)
+        return _response_cache
+
+def cached_chatter(chatter, cache=None):
+    """
+    Wrap chatter in a CachedChatter unless caching and coalescing are both disabled or chatter is already wrapped.
+    """
+    if chatter is None or not (LLM_CACHE or LLM_COALESCE) or isinstance(chatter, CachedChatter):
+        return chatter
+    return CachedChatter(chatter, cache)
@@ -2,53 +2,222 @@
 # modular file to include input response mechanisms for multi-model environment
 # API name must be openai groq or together from API
 # ollama integration is from URL
+# every chatter implements the async Chatter interface, generate_response_async is native and generate_response is a sync adapter
+# provider calls run on one background event loop so each provider keeps one pooled keep-alive client for the whole process
+# clients are shared per provider and API key, connection limits are set with
+# together has no httpx client option, its SDK uses aiohttp and shares the pooled aiohttp session set in together.aiosession
+# CHATTER_MAX_CONNECTIONS     connections per provider client (default 20)
+# CHATTER_MAX_KEEPALIVE       idle keep-alive connections kept per provider client (default 10)
+# CHATTER_KEEPALIVE_EXPIRY    seconds an idle connection is kept open (default 30)
+# CHATTER_TIMEOUT             default seconds per provider call (default 60)
+# calls are scheduled per provider by ratelimit.py, waiting in a fair queue for request, token and concurrency budget
+# failed calls raise ChatterError from resilience.py after transient failures are retried, a tripped provider fails fast
+# OLLAMA_API_URL              ollama server (default http://localhost:11434/api)
+# OLLAMA_MODEL                default ollama model (default llama3)
+# OLLAMA_KEEP_ALIVE           how long ollama keeps the model loaded after a call (default 30m)
+# OLLAMA_CONTEXT=off          do not send the context of the previous ollama call of a ChatSession with the next one
+# OLLAMA_CONTEXT_TOKENS       longest context that is sent again (default 4096 tokens)
+# stream_response is an async iterator of response tokens, openai groq and together stream with stream=True and ollama streams NDJSON
 
 import openai
-from groq import Groq
+from groq import AsyncGroq
+import together
 from together import AsyncTogether
+import aiohttp
+import httpx
 import subprocess
 import asyncio
+import threading
+import time
+import atexit
 import logging
 import os
+import ujson
+from webmind.ratelimit import get_scheduler, estimate_tokens
+from webmind.resilience import ChatterError, classify, backoff, get_breaker, CHATTER_RETRIES
 
-class GPT4o:
-    def __init__(self, openai_api_key):
-        self.openai_api_key = openai_api_key
-        openai.api_key = self.openai_api_key
-        self.current_model = "gpt-4o"  # Default model
+CHATTER_MAX_CONNECTIONS = int(os.environ.get("CHATTER_MAX_CONNECTIONS", "20"))
+CHATTER_MAX_KEEPALIVE = int(os.environ.get("CHATTER_MAX_KEEPALIVE", "10"))
+CHATTER_KEEPALIVE_EXPIRY = float(os.environ.get("CHATTER_KEEPALIVE_EXPIRY", "30"))
+CHATTER_TIMEOUT = float(os.environ.get("CHATTER_TIMEOUT", "60"))
+OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_CONTEXT = os.environ.get("OLLAMA_CONTEXT", "on").lower() not in ("off", "0", "false", "no")
+OLLAMA_CONTEXT_TOKENS = int(os.environ.get("OLLAMA_CONTEXT_TOKENS", "4096"))
 
-    def set_model(self, model_name):
+class ChatterLoop:
+    """
+    Background event loop owning every pooled provider client.
+    Pooled async clients belong to the loop they first ran on, so provider calls from any
+    other loop or thread are handed to this one instead of opening clients of their own.
+    """
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="ChatterLoop", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    async def run_async(self, coroutine):
         """
-        Set the current model to the specified model_name.
+        Await coroutine on the chatter loop from any event loop, cancelling it if the caller is cancelled.
         """
-        self.current_model = model_name
+        loop = self.start()
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
 
-    def get_current_model(self):
+    async def stream(self, tokens):
         """
-        Get the name of the current model.
+        Iterate the async iterator tokens on the chatter loop from any event loop, tokens are handed over as they arrive.
         """
-        return self.current_model
+        loop = self.start()
+        caller = asyncio.get_running_loop()
+        if caller is loop:
+            async for token in tokens:
+                yield token
+            return
+        queue = asyncio.Queue()
 
-    def generate_response(self, knowledge):
-        prompt = f"{knowledge}"
+        async def pump():
+            try:
+                async for token in tokens:
+                    caller.call_soon_threadsafe(queue.put_nowait, (token, None))
+            except Exception as e:
+                caller.call_soon_threadsafe(queue.put_nowait, (None, e))
+            else:
+                caller.call_soon_threadsafe(queue.put_nowait, (None, StopAsyncIteration()))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
         try:
-            response = openai.chat.completions.create(
-                model=self.current_model,
-                messages=[
-                    {"role": "system", "content": ""},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            decision = response.choices[0].message.content
-            return decision.lower()
-        except openai.APIError as e:
-            logging.error(f"openai api error: {e}")
-            return "error: unable to generate a response due to an issue with the openai api."
+            while True:
+                token, error = await queue.get()
+                if isinstance(error, StopAsyncIteration):
+                    return
+                if error is not None:
+                    raise error
+                yield token
+        finally:
+            future.cancel()  # the caller stopped reading or was cancelled
 
-class GroqModel:
-    def __init__(self, groq_api_key):
-        self.client = Groq(api_key=groq_api_key)
-        self.current_model = "mixtral-8x7b-32768"  # Default model
+    def run(self, coroutine):
+        """
+        Run coroutine on the chatter loop and block until it finishes, for sync callers.
+
+        Raises:
+            RuntimeError: If called on the chatter loop itself, which would wait on itself forever.
+        """
+        loop = self.start()
+        if threading.current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError("ChatterLoop.run called on the chatter loop, await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    def stop(self):
+        with self.lock:
+            loop, self.loop = self.loop, None
+            thread, self.thread = self.thread, None
+        if loop is not None:
+            if _clients:
+                asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+
+_chatter_loop = ChatterLoop()
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_chatter_loop():
+    return _chatter_loop
+
+def http_client():
+    """
+    Keep-alive httpx client with the configured connection limits.
+    """
+    limits = httpx.Limits(
+        max_connections=CHATTER_MAX_CONNECTIONS,
+        max_keepalive_connections=CHATTER_MAX_KEEPALIVE,
+        keepalive_expiry=CHATTER_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=CHATTER_TIMEOUT)
+
+def aiohttp_session():
+    """
+    Keep-alive aiohttp session with the configured connection limits, must be created on the loop that uses it.
+    """
+    connector = aiohttp.TCPConnector(limit=CHATTER_MAX_CONNECTIONS, keepalive_timeout=CHATTER_KEEPALIVE_EXPIRY)
+    return aiohttp.ClientSession(connector=connector)
+
+def get_async_client(provider, api_key, factory):
+    """
+    Return the client shared by every chatter of provider using api_key, creating it with factory() on first use.
+    """
+    key = (provider, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+        return client
+
+async def _close_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, "close", None) or getattr(client, "aclose", None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            logging.debug(f"closing chatter client failed: {e}")
+
+def close_chatters():
+    _chatter_loop.stop()
+
+atexit.register(close_chatters)
+
+class ChatSession:
+    """
+    Conversation state of one chain of calls, passed along with each call of the chain.
+    OllamaModel keeps the context array of the last call here, so the next call of the same chain continues
+    from the prefix the server has already evaluated. Chains that run at the same time each need their own session.
+
+    Args:
+        context: Context to continue from, None starts fresh.
+        model: Model that produced context, a context is only sent again to the same model.
+    """
+    def __init__(self, context=None, model=None):
+        self.context = context
+        self.model = model
+
+    def fork(self):
+        """
+        New session continuing from this one's context, for a call that branches off the chain.
+        """
+        return ChatSession(self.context, self.model)
+
+class Chatter:
+    """
+    Common interface of every chatter.
+    Subclasses implement complete(), which runs on the chatter loop with the pooled provider client
+    once the provider scheduler grants the call a lease.
+    """
+    provider = "chatter"
+    default_model = None
+
+    def __init__(self):
+        self.current_model = self.default_model
 
     def set_model(self, model_name):
         """
@@ -62,42 +231,321 @@ class GroqModel:
         """
         return self.current_model
 
-    def generate_response(self, knowledge):
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
+        """
+        One provider call. Report token usage and rate limit headers through lease when the provider returns them.
+        session is the ChatSession of the calling chain, providers that keep no conversation state ignore it.
+        Provider failures are raised, scheduled() turns them into ChatterError.
+        """
+        raise NotImplementedError
+
+    async def stream_complete(self, knowledge, timeout=None, lease=None, session=None):
+        """
+        One streamed provider call yielding response tokens, providers without streaming yield complete() in one piece.
+        """
+        yield await self.complete(knowledge, timeout, lease, session)
+
+    def _retry_wait(self, breaker, error, attempt, deadline, retryable=True, retries=None):
+        """
+        Return the seconds to wait before retrying a failed attempt, raise error when it is final.
+        The circuit breaker only hears about the call once its retries are over, so one call counts as one failure.
+        """
+        retries = CHATTER_RETRIES if retries is None else retries
+        wait = error.retry_after if error.retry_after is not None else backoff(attempt)
+        if not (retryable and error.transient) or attempt >= retries or (deadline is not None and time.monotonic() + wait >= deadline):
+            if error.transient:
+                breaker.record_failure()
+            else:
+                breaker.record_abandoned()
+            logging.error(f"{self.provider} api error: {error}")
+            raise error
+        return wait
+
+    async def scheduled(self, knowledge, timeout=None, session=None, retries=None):
+        """
+        Make the call through the circuit breaker and the provider scheduler, retrying transient failures
+        up to retries times (default CHATTER_RETRIES) with jittered backoff. Time spent queued or backing off counts against timeout.
+
+        Raises:
+            ChatterError: When the call failed for good, CircuitOpenError when the provider is tripped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        breaker = get_breaker(self.provider)
+        scheduler = get_scheduler(self.provider)
+        attempt = 0
+        breaker.allow()  # once per call, its retries belong to the same call
+        while True:
+            try:
+                async with scheduler.slot(estimate_tokens(knowledge)) as lease:
+                    remaining = None if deadline is None else max(deadline - time.monotonic(), 0.001)
+                    try:
+                        response = await self.complete(knowledge, remaining, lease, session)
+                    except (asyncio.CancelledError, KeyboardInterrupt):
+                        raise
+                    except Exception as e:
+                        error = classify(e, self.provider)
+                        if error.status == 429:
+                            lease.throttled(error.headers, error.retry_after)
+                        raise error from e
+            except asyncio.CancelledError:
+                breaker.record_abandoned()
+                raise
+            except ChatterError as error:
+                wait = self._retry_wait(breaker, error, attempt, deadline, retries=retries)
+                attempt += 1
+                try:
+                    await asyncio.sleep(wait)
+                except asyncio.CancelledError:
+                    breaker.record_abandoned()
+                    raise
+                continue
+            breaker.record_success()
+            return response
+
+    async def scheduled_stream(self, knowledge, timeout=None, session=None, retries=None):
+        """
+        Streamed form of scheduled(), a failed call is only retried while none of its tokens were delivered.
+
+        Raises:
+            ChatterError: When the call failed for good, CircuitOpenError when the provider is tripped.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        breaker = get_breaker(self.provider)
+        scheduler = get_scheduler(self.provider)
+        attempt = 0
+        breaker.allow()  # once per call, its retries belong to the same call
+        while True:
+            delivered = False
+            try:
+                async with scheduler.slot(estimate_tokens(knowledge)) as lease:
+                    remaining = None if deadline is None else max(deadline - time.monotonic(), 0.001)
+                    tokens = self.stream_complete(knowledge, remaining, lease, session)
+                    try:
+                        while True:
+                            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.001)
+                            try:
+                                token = await asyncio.wait_for(tokens.__anext__(), remaining)
+                            except StopAsyncIteration:
+                                break
+                            delivered = True
+                            yield token
+                    except (asyncio.CancelledError, GeneratorExit, KeyboardInterrupt):
+                        raise
+                    except Exception as e:
+                        error = classify(e, self.provider)
+                        if error.status == 429:
+                            lease.throttled(error.headers, error.retry_after)
+                        raise error from e
+                    finally:
+                        await tokens.aclose()
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.record_abandoned()
+                raise
+            except ChatterError as error:
+                wait = self._retry_wait(breaker, error, attempt, deadline, retryable=not delivered, retries=retries)
+                attempt += 1
+                try:
+                    await asyncio.sleep(wait)
+                except asyncio.CancelledError:
+                    breaker.record_abandoned()
+                    raise
+                continue
+            breaker.record_success()
+            return
+
+    async def stream_response(self, knowledge, timeout=None, session=None):
+        """
+        Async iterator of response tokens, usable from any event loop.
+        """
+        async for token in _chatter_loop.stream(self.scheduled_stream(knowledge, timeout, session)):
+            yield token
+
+    async def generate_response_async(self, knowledge, timeout=None, session=None):
+        """
+        Generate a response on the chatter loop, awaitable from any event loop.
+        """
+        return await _chatter_loop.run_async(self.scheduled(knowledge, timeout, session))
+
+    def generate_response(self, knowledge, timeout=None, session=None):
+        """
+        Sync adapter for the CLI entry points, blocks the calling thread until the response arrives.
+        """
+        return _chatter_loop.run(self.scheduled(knowledge, timeout, session))
+
+class GPT4o(Chatter):
+    provider = "openai"
+    default_model = "gpt-4o"  # Default model
+
+    def __init__(self, openai_api_key):
+        super().__init__()
+        self.openai_api_key = openai_api_key
+        # SDK retries are off, Chatter.scheduled retries with backoff through the scheduler and circuit breaker
+        self.client = get_async_client(self.provider, openai_api_key, lambda: openai.AsyncOpenAI(api_key=openai_api_key, http_client=http_client(), max_retries=0))
+
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
         prompt = f"{knowledge}"
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": ""},
-                    {"role": "user", "content": prompt}
-                ],
-                model=self.current_model,
-            )
-            decision = chat_completion.choices[0].message.content
-            return decision.lower()
-        except Exception as e:
-            logging.error(f"groq api error: {e}")
-            return "error: unable to generate a response due to an issue with the groq api."
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.current_model,
+            messages=[
+                {"role": "system", "content": ""},
+                {"role": "user", "content": prompt}
+            ],
+            timeout=timeout
+        )
+        response = raw.parse()
+        if lease is not None:
+            lease.report(getattr(response.usage, "total_tokens", None), raw.headers)
+        decision = response.choices[0].message.content
+        return decision.lower()
+
+    async def stream_complete(self, knowledge, timeout=None, lease=None, session=None):
+        stream = await self.client.chat.completions.create(
+            model=self.current_model,
+            messages=[
+                {"role": "system", "content": ""},
+                {"role": "user", "content": f"{knowledge}"}
+            ],
+            timeout=timeout,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None and lease is not None:
+                lease.report(getattr(usage, "total_tokens", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content.lower()
 
-class OllamaModel:
+class GroqModel(Chatter):
+    provider = "groq"
+    default_model = "mixtral-8x7b-32768"  # Default model
+
+    def __init__(self, groq_api_key):
+        super().__init__()
+        self.client = get_async_client(self.provider, groq_api_key, lambda: AsyncGroq(api_key=groq_api_key, http_client=http_client(), max_retries=0))
+
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
+        prompt = f"{knowledge}"
+        raw = await self.client.chat.completions.with_raw_response.create(
+            messages=[
+                {"role": "system", "content": ""},
+                {"role": "user", "content": prompt}
+            ],
+            model=self.current_model,
+            timeout=timeout,
+        )
+        chat_completion = raw.parse()
+        if lease is not None:
+            lease.report(getattr(chat_completion.usage, "total_tokens", None), raw.headers)
+        decision = chat_completion.choices[0].message.content
+        return decision.lower()
+
+    async def stream_complete(self, knowledge, timeout=None, lease=None, session=None):
+        stream = await self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": ""},
+                {"role": "user", "content": f"{knowledge}"}
+            ],
+            model=self.current_model,
+            timeout=timeout,
+            stream=True,
+        )
+        async for chunk in stream:
+            # groq reports usage on the last chunk under x_groq
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None and lease is not None:
+                lease.report(getattr(usage, "total_tokens", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content.lower()
+
+class OllamaModel(Chatter):
     """
-    Class to interact with Llama3 model via the Ollama service.
+    Chatter for models served by a local Ollama server, one pooled keep-alive client per server.
+    Every call asks the server to keep the model loaded for keep_alive. The context returned by a call is kept
+    in the call's ChatSession and sent with the next call of that session, so the server continues from the
+    prefix it has already evaluated. Calls without a session never send a context.
+    Calls in flight are capped by OLLAMA_CONCURRENCY, which defaults to the server's OLLAMA_NUM_PARALLEL.
+
+    Args:
+        api_url: Ollama API url, defaults to OLLAMA_API_URL.
+        keep_alive: Duration the model stays loaded, defaults to OLLAMA_KEEP_ALIVE.
+        reuse_context: Send the context of the session's previous call, defaults to OLLAMA_CONTEXT.
     """
-    def __init__(self):
-        self.api_url = "http://localhost:11434/api"
+    provider = "ollama"
+    default_model = OLLAMA_MODEL
+
+    def __init__(self, api_url=None, keep_alive=None, reuse_context=None):
+        super().__init__()
+        self.api_url = (api_url or OLLAMA_API_URL).rstrip("/")
+        self.keep_alive = OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive
+        self.reuse_context = OLLAMA_CONTEXT if reuse_context is None else reuse_context
+        self.client = get_async_client(self.provider, self.api_url, http_client)
 
-    async def generate_response_async(self, knowledge, model="llama3"):
+    def payload(self, knowledge, stream, session=None):
+        payload = {"model": self.current_model, "prompt": f"{knowledge}", "stream": stream, "keep_alive": self.keep_alive}
+        # a context only means something to the model that produced it
+        if self.reuse_context and session is not None and session.context and session.model == self.current_model:
+            payload["context"] = session.context
+        return payload
+
+    def keep_context(self, data, lease=None, session=None):
         """
-        Generate a response from the Llama3 model based on the given knowledge prompt using streaming.
+        Keep the context of a finished call in its session and report its token usage.
         """
-        try:
-            response_content = ""
-            stream = ollama.chat(model=model, messages=[{'role': 'user', 'content': knowledge}], stream=True)
-            async for chunk in stream:
-                response_content += chunk['message']['content']
-            return response_content
-        except Exception as e:
-            logging.error(f"ollama api error: {e}")
-            return "error: unable to generate a response due to an issue with the ollama api."
+        context = data.get("context")
+        if self.reuse_context and session is not None and context:
+            # a context past OLLAMA_CONTEXT_TOKENS would only be truncated by the server, start over instead
+            session.context = context if len(context) <= OLLAMA_CONTEXT_TOKENS else None
+            session.model = self.current_model
+        if lease is not None:
+            lease.report(data.get("prompt_eval_count", 0) + data.get("eval_count", 0))
+
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
+        """
+        Generate a response from the Ollama model based on the given knowledge prompt.
+        """
+        response = await self.client.post(
+            f"{self.api_url}/generate",
+            json=self.payload(knowledge, False, session),
+            timeout=timeout or CHATTER_TIMEOUT,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get("error"):
+            raise ChatterError(self.provider, data["error"])
+        self.keep_context(data, lease, session)
+        return data.get("response", "")
+
+    async def stream_complete(self, knowledge, timeout=None, lease=None, session=None):
+        """
+        Stream the response of the Ollama model, ollama sends one JSON object per line.
+        """
+        async with self.client.stream(
+            "POST",
+            f"{self.api_url}/generate",
+            json=self.payload(knowledge, True, session),
+            timeout=timeout or CHATTER_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                data = ujson.loads(line)
+                if data.get("error"):
+                    raise ChatterError(self.provider, data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    self.keep_context(data, lease, session)
+                    break
+
+    async def model_names(self, timeout=None):
+        """
+        Names of the models the server has pulled.
+        """
+        response = await self.client.get(f"{self.api_url}/tags", timeout=timeout or CHATTER_TIMEOUT)
+        response.raise_for_status()
+        return [model["name"] for model in response.json().get("models", [])]
 
 def check_ollama_installation():
     command = "ollama list"
@@ -113,41 +561,46 @@ def check_ollama_installation():
         logging.error(f"Failed to check Ollama installation: {e}")
         return False
 
-class TogetherModel:
+class TogetherModel(Chatter):
+    provider = "together"
+    default_model = "mistralai/Mixtral-8x7B-Instruct-v0.1"  # Default model
+
     def __init__(self, api_key):
+        super().__init__()
         self.api_key = api_key
-        self.async_client = AsyncTogether(api_key=api_key)  # Use the provided api_key directly
-        self.current_model = "mistralai/Mixtral-8x7B-Instruct-v0.1"  # Default model
-
-    def set_model(self, model_name):
-        """
-        Set the current model to the specified model_name.
-        """
-        self.current_model = model_name
+        self.async_client = get_async_client(self.provider, api_key, lambda: AsyncTogether(api_key=api_key))
 
-    def get_current_model(self):
+    async def create(self, messages, timeout, **kwargs):
         """
-        Get the name of the current model.
+        chat.completions.create over the pooled aiohttp session, the SDK would otherwise open a session per request.
         """
-        return self.current_model
+        # the session is shared by every together API key, the key is sent per request
+        token = together.aiosession.set(get_async_client(self.provider, None, aiohttp_session))
+        try:
+            return await asyncio.wait_for(
+                self.async_client.chat.completions.create(model=self.current_model, messages=messages, **kwargs),
+                timeout or CHATTER_TIMEOUT,
+            )
+        finally:
+            together.aiosession.reset(token)
 
-    async def generate_response_async(self, knowledge):
+    async def complete(self, knowledge, timeout=None, lease=None, session=None):
         """
         Generate a response from the Together AI model based on the given knowledge prompt.
         """
         messages = [{"role": "user", "content": knowledge}]
-        try:
-            response = await self.async_client.chat.completions.create(
-                model=self.current_model,
-                messages=messages
-            )
-            return response.choices[0].message.content.lower()
-        except Exception as e:
-            logging.error(f"together.ai api error: {e}")
-            return "error: unable to generate a response due to an issue with the together.ai api."
+        response = await self.create(messages, timeout)
+        if lease is not None:
+            lease.report(getattr(getattr(response, "usage", None), "total_tokens", None))
+        return response.choices[0].message.content.lower()
 
-    def generate_response(self, knowledge):
-        """
-        Synchronous wrapper for the asynchronous generate_response_async method.
-        """
-        return asyncio.run(self.generate_response_async(knowledge))
+    async def stream_complete(self, knowledge, timeout=None, lease=None, session=None):
+        messages = [{"role": "user", "content": knowledge}]
+        # the token deadline is enforced per token by scheduled_stream
+        stream = await self.create(messages, timeout, stream=True)
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None and lease is not None:
+                lease.report(getattr(usage, "total_tokens", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content.lower()
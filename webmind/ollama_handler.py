@@ -1,20 +1,21 @@
 # ollama_handler.py
 # code extrapolated from ollama-python for interaction with an ollama installation
 # ollama_handler (c) 2024 codephreak MIT licence
+# requests go through OllamaModel from chatter.py so they share its pooled keep-alive client
 
 import logging
 import subprocess
 import asyncio
-import aiohttp
-import ujson as json
 from nicegui import ui
+from webmind.chatter import OllamaModel, OLLAMA_API_URL, get_chatter_loop
+from webmind.resilience import ChatterError
 
 class OllamaHandler:
     """
     Class to interact with Llama3 model via the Ollama service.
     """
     def __init__(self):
-        self.api_url = "http://localhost:11434/api"
+        self.api_url = OLLAMA_API_URL
         self.models = []
         self.selected_model = None
 
@@ -52,29 +53,33 @@ class OllamaHandler:
             logging.error(f"Ollama API error: {e}")
             return []
 
+    def model_names(self):
+        """
+        Names of the models pulled on the Ollama server, empty if it cannot be reached.
+        """
+        try:
+            return get_chatter_loop().run(OllamaModel(self.api_url).model_names(timeout=5))
+        except Exception as e:
+            logging.error(f"Ollama API error: {e}")
+            return []
+
+    def chatter(self, model=None):
+        """
+        OllamaModel chatter for model, the selected model or the default one.
+        """
+        chatter = OllamaModel(self.api_url)
+        if model or self.selected_model:
+            chatter.set_model(model or self.selected_model)
+        return chatter
+
     async def generate_response_async(self, knowledge, model="llama3"):
         """
         Generate a response from the Llama3 model based on the given knowledge prompt using streaming.
         """
         try:
-            response_content = ""
-            async with aiohttp.ClientSession() as session:
-                payload = {
-                    "model": model,
-                    "prompt": knowledge,
-                    "stream": True
-                }
-                async with session.post(f"{self.api_url}/generate", json=payload) as response:
-                    async for line in response.content:
-                        if line:
-                            data = json.loads(line.decode('utf-8'))
-                            if "response" in data:
-                                response_content += data["response"]
-                            elif "error" in data:
-                                logging.error(f"Error in response: {data['error']}")
-                                return f"Error: {data['error']}"
-            return response_content
-        except Exception as e:
+            chatter = self.chatter(model)
+            return "".join([token async for token in chatter.stream_response(knowledge)])
+        except ChatterError as e:
             logging.error(f"Ollama API error: {e}")
             return "Error: Unable to generate a response due to an issue with the Ollama API."
 
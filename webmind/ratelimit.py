@@ -0,0 +1,299 @@
+# ratelimit.py (c) 2024 Gregory L. Magnusson MIT licence
+# per provider scheduling of chatter calls so user queries, main_loop and reasoning_loop stay under provider limits
+# every provider has a requests per minute and a tokens per minute token bucket and a cap on concurrent calls
+# calls that cannot start at once wait in one first in first out queue per provider so no caller is starved
+# x-ratelimit-remaining-* headers shrink the buckets to what the provider reports and retry-after pauses the provider
+# schedulers run on the chatter loop from chatter.py so they need no locks
+# limits are set per provider as {PROVIDER}_RPM, {PROVIDER}_TPM and {PROVIDER}_CONCURRENCY, 0 means unlimited
+# GROQ_RPM=30 GROQ_TPM=6000 GROQ_CONCURRENCY=4
+# OLLAMA_CONCURRENCY defaults to OLLAMA_NUM_PARALLEL, the parallelism of the ollama server
+# RATE_LIMIT_OUTPUT_TOKENS   tokens reserved for the response of a call before its usage is known (default 256)
+import os
+import re
+import time
+import asyncio
+import collections
+import logging
+
+# requests per minute, tokens per minute, concurrent calls
+DEFAULT_LIMITS = {
+    "openai": (500, 30000, 8),
+    "groq": (30, 6000, 4),
+    "together": (60, 60000, 4),
+    "ollama": (0, 0, int(os.environ.get("OLLAMA_NUM_PARALLEL", "2"))),  # as many calls as the server runs in parallel
+}
+FALLBACK_LIMITS = (60, 0, 4)
+RATE_LIMIT_OUTPUT_TOKENS = int(os.environ.get("RATE_LIMIT_OUTPUT_TOKENS", "256"))
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+def estimate_tokens(text, output_tokens=RATE_LIMIT_OUTPUT_TOKENS):
+    """
+    Rough token count of a prompt, about four characters per token, plus the tokens reserved for the response.
+    """
+    return len(f"{text}") // 4 + 1 + output_tokens
+
+def parse_duration(value):
+    """
+    Seconds in a rate limit header value such as "20", "1.5s", "6m0s" or "250ms", None if it cannot be read.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+class TokenBucket:
+    """
+    Bucket refilled at rate per minute holding at most one minute of tokens.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60.0)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """
+        Seconds until amount tokens are available, a request larger than the bucket waits for a full bucket.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """
+        Return unused tokens or charge extra ones once the real cost of a call is known.
+        """
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def limit(self, remaining, now):
+        """
+        Never hold more tokens than the provider says remain.
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, float(remaining))
+
+class Lease:
+    """
+    Permission for one provider call, report the real token usage and response headers through it.
+    """
+    def __init__(self, scheduler, tokens):
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self.used = None
+
+    def report(self, tokens=None, headers=None):
+        if tokens is not None:
+            self.used = tokens
+        if headers is not None:
+            self.scheduler.update(headers)
+
+    def throttled(self, headers=None, retry_after=None):
+        """
+        Record a 429 answer, the provider is paused for its retry-after or one second.
+        """
+        self.scheduler.throttle(headers, retry_after)
+
+class ProviderScheduler:
+    """
+    Token bucket scheduler for the calls of one provider.
+
+    Args:
+        provider: Provider name.
+        rpm: Requests per minute, 0 for unlimited.
+        tpm: Tokens per minute, 0 for unlimited.
+        concurrency: Calls in flight at once, 0 for unlimited.
+    """
+    def __init__(self, provider, rpm=0, tpm=0, concurrency=0):
+        self.provider = provider
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        self.paused_until = 0.0
+        self.timer = None
+        self.counters = {"granted": 0, "queued": 0, "throttled": 0, "tokens_used": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def _delay(self, tokens, now):
+        delay = max(self.paused_until - now, 0.0)
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def _grant(self, tokens, now, enqueued):
+        if self.requests is not None:
+            self.requests.take(1, now)
+        if self.tokens is not None:
+            self.tokens.take(tokens, now)
+        self.in_flight += 1
+        waited = now - enqueued
+        self.counters["granted"] += 1
+        self.counters["wait_seconds"] += waited
+        self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+
+    async def acquire(self, tokens):
+        """
+        Wait for a concurrency slot and enough request and token budget, in arrival order.
+
+        Returns:
+            Lease: Pass it to release when the call is done.
+        """
+        now = time.monotonic()
+        if not self.waiters and (not self.concurrency or self.in_flight < self.concurrency) and self._delay(tokens, now) <= 0:
+            self._grant(tokens, now, now)
+            return Lease(self, tokens)
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, tokens, now)
+        self.waiters.append(waiter)
+        self.counters["queued"] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted as the caller was cancelled, hand it on
+                self.release(Lease(self, tokens))
+            else:
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+                self._dispatch()
+            raise
+        return Lease(self, tokens)
+
+    def release(self, lease):
+        self.in_flight -= 1
+        if lease.used is not None:
+            self.counters["tokens_used"] += lease.used
+            if self.tokens is not None:
+                self.tokens.adjust(lease.tokens - lease.used)
+        self._dispatch()
+
+    def _dispatch(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.waiters:
+            future, tokens, enqueued = self.waiters[0]
+            if future.done():
+                self.waiters.popleft()
+                continue
+            if self.concurrency and self.in_flight >= self.concurrency:
+                return  # release dispatches again
+            now = time.monotonic()
+            delay = self._delay(tokens, now)
+            if delay > 0:
+                self.timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            self.waiters.popleft()
+            self._grant(tokens, now, enqueued)
+            future.set_result(None)
+
+    def update(self, headers):
+        """
+        Shrink the buckets to the x-ratelimit-remaining-requests and -tokens the provider reported.
+        """
+        now = time.monotonic()
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None and self.requests is not None:
+            try:
+                self.requests.limit(float(remaining), now)
+            except ValueError:
+                pass
+        remaining = headers.get("x-ratelimit-remaining-tokens")
+        if remaining is not None and self.tokens is not None:
+            try:
+                self.tokens.limit(float(remaining), now)
+            except ValueError:
+                pass
+
+    def throttle(self, headers=None, retry_after=None):
+        """
+        Pause the provider after a 429 for retry-after seconds, or the reset time in the headers, or one second.
+        """
+        self.counters["throttled"] += 1
+        if retry_after is None and headers is not None:
+            retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after is None:
+                retry_after = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        pause = retry_after if retry_after is not None else 1.0
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        logging.warning(f"{self.provider} rate limited, pausing {pause:.1f}s")
+        if headers is not None:
+            self.update(headers)
+
+    def slot(self, tokens):
+        return _Slot(self, tokens)
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["queue_depth"] = len(self.waiters)
+        stats["in_flight"] = self.in_flight
+        stats["paused_seconds"] = max(self.paused_until - time.monotonic(), 0.0)
+        stats["average_wait_seconds"] = stats["wait_seconds"] / stats["granted"] if stats["granted"] else 0.0
+        return stats
+
+class _Slot:
+    def __init__(self, scheduler, tokens):
+        self.scheduler = scheduler
+        self.tokens = tokens
+        self.lease = None
+
+    async def __aenter__(self):
+        self.lease = await self.scheduler.acquire(self.tokens)
+        return self.lease
+
+    async def __aexit__(self, *exc):
+        self.scheduler.release(self.lease)
+        return False
+
+_schedulers = {}
+
+def provider_limits(provider):
+    """
+    Requests per minute, tokens per minute and concurrency of provider from the environment or the defaults.
+    """
+    rpm, tpm, concurrency = DEFAULT_LIMITS.get(provider, FALLBACK_LIMITS)
+    prefix = provider.upper()
+    return (
+        int(os.environ.get(f"{prefix}_RPM", rpm)),
+        int(os.environ.get(f"{prefix}_TPM", tpm)),
+        int(os.environ.get(f"{prefix}_CONCURRENCY", concurrency)),
+    )
+
+def get_scheduler(provider):
+    """
+    Return the scheduler of provider, call it on the chatter loop.
+    """
+    scheduler = _schedulers.get(provider)
+    if scheduler is None:
+        scheduler = ProviderScheduler(provider, *provider_limits(provider))
+        _schedulers[provider] = scheduler
+    return scheduler
+
+def rate_limit_stats():
+    """
+    Queue depth, wait times, throttling and token usage per provider.
+    """
+    return {provider: scheduler.stats() for provider, scheduler in list(_schedulers.items())}
@@ -0,0 +1,161 @@
+# resilience.py (c) 2024 Gregory L. Magnusson MIT licence
+# typed chatter errors, retries and circuit breakers for the providers in chatter.py
+# a failed provider call raises a ChatterError instead of returning an error string that could become a premise or a truth
+# transient errors (timeouts, connection failures, 408, 409, 429, 5xx) are retried with full jitter exponential backoff
+# permanent errors (bad request, authentication, unknown model) are raised at once
+# a provider failing CIRCUIT_FAILURES calls in a row is tripped for CIRCUIT_COOLDOWN seconds and calls fail fast
+# a call counts once, as a failure only when its retries are exhausted
+# after the cooldown one trial call is let through, its success closes the circuit and its failure opens it again
+# CHATTER_RETRIES        retries of a transient failure per call (default 2)
+# CHATTER_BACKOFF        base backoff in seconds (default 0.5)
+# CHATTER_BACKOFF_MAX    longest backoff in seconds (default 8)
+# CIRCUIT_FAILURES       consecutive calls failing with transient errors that trip a provider (default 5)
+# CIRCUIT_COOLDOWN       seconds a tripped provider is skipped (default 30)
+import os
+import time
+import random
+import asyncio
+import logging
+
+CHATTER_RETRIES = int(os.environ.get("CHATTER_RETRIES", "2"))
+CHATTER_BACKOFF = float(os.environ.get("CHATTER_BACKOFF", "0.5"))
+CHATTER_BACKOFF_MAX = float(os.environ.get("CHATTER_BACKOFF_MAX", "8"))
+CIRCUIT_FAILURES = int(os.environ.get("CIRCUIT_FAILURES", "5"))
+CIRCUIT_COOLDOWN = float(os.environ.get("CIRCUIT_COOLDOWN", "30"))
+
+TRANSIENT_STATUS = {408, 409, 425, 429}
+# exception class names of the provider SDKs and httpx that mean the request never got an answer
+TRANSIENT_NAMES = {"APIConnectionError", "APITimeoutError", "TimeoutException", "ConnectError", "ReadTimeout",
+                   "WriteTimeout", "ConnectTimeout", "PoolTimeout", "RemoteProtocolError", "ReadError",
+                   "ServiceUnavailableError", "InternalServerError", "RateLimitError"}
+
+class ChatterError(Exception):
+    """
+    A provider call that produced no response.
+
+    Args:
+        provider: Provider name.
+        message: What went wrong.
+        transient: True if the same call may succeed when retried.
+        status: HTTP status of the provider answer, if there was one.
+        retry_after: Seconds the provider asked to wait, if it said.
+        headers: Response headers, if there were any.
+    """
+    def __init__(self, provider, message, transient=False, status=None, retry_after=None, headers=None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.transient = transient
+        self.status = status
+        self.retry_after = retry_after
+        self.headers = headers
+
+class CircuitOpenError(ChatterError):
+    """
+    Raised without calling a provider whose circuit is open.
+    """
+    def __init__(self, provider, retry_after):
+        super().__init__(provider, f"circuit open for {retry_after:.1f}s", transient=False, retry_after=retry_after)
+
+def classify(error, provider):
+    """
+    Wrap any exception from a provider call in a ChatterError that says whether it is worth retrying.
+    """
+    if isinstance(error, ChatterError):
+        return error
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    headers = getattr(response, "headers", None)
+    retry_after = None
+    if headers is not None:
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            retry_after = None
+    if status is not None:
+        transient = status in TRANSIENT_STATUS or status >= 500
+    else:
+        transient = isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)) or type(error).__name__ in TRANSIENT_NAMES
+    return ChatterError(provider, f"{type(error).__name__}: {error}", transient, status, retry_after, headers)
+
+def backoff(attempt, base=CHATTER_BACKOFF, cap=CHATTER_BACKOFF_MAX):
+    """
+    Full jitter exponential backoff, a random wait up to base * 2 ** attempt seconds.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """
+    Consecutive failure circuit breaker of one provider.
+    """
+    def __init__(self, provider, failures=CIRCUIT_FAILURES, cooldown=CIRCUIT_COOLDOWN):
+        self.provider = provider
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.counters = {"successes": 0, "failures": 0, "trips": 0, "rejected": 0}
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """
+        Raise CircuitOpenError unless a call may go to the provider now.
+        """
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self.trial:
+            self.trial = True  # one trial call at a time
+            return
+        self.counters["rejected"] += 1
+        raise CircuitOpenError(self.provider, max(self.opened_at + self.cooldown - time.monotonic(), 0.0))
+
+    def record_success(self):
+        self.counters["successes"] += 1
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        self.failures += 1
+        if self.trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.trial:
+                self.counters["trips"] += 1
+                logging.warning(f"{self.provider} circuit open for {self.cooldown:.0f}s after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self.trial = False
+
+    def record_abandoned(self):
+        """
+        A trial call that was cancelled says nothing about the provider, let the next call try.
+        """
+        self.trial = False
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["state"] = self.state
+        stats["consecutive_failures"] = self.failures
+        return stats
+
+_breakers = {}
+
+def get_breaker(provider):
+    """
+    Return the circuit breaker of provider, call it on the chatter loop.
+    """
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = CircuitBreaker(provider)
+        _breakers[provider] = breaker
+    return breaker
+
+def circuit_stats():
+    return {provider: breaker.stats() for provider, breaker in list(_breakers.items())}
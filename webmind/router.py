@@ -0,0 +1,243 @@
+# router.py (c) 2024 Gregory L. Magnusson MIT licence
+# multi-provider routing of chatter calls with hedged requests and automatic failover
+# OpenMind routes across every provider with an API key instead of stalling on the one it picked
+# providers are ranked by live error rate and median latency, providers with an open circuit are skipped
+# when the first provider has not answered by its ROUTER_HEDGE_PERCENTILE latency a hedged duplicate goes to the next one,
+# the first answer wins and the other call is cancelled
+# a provider that fails hands the request to the next provider at once, only the last provider left retries on its own
+# streamed requests fail over while no token has been delivered but are never hedged
+# ROUTER_HEDGE_PERCENTILE     latency percentile after which a hedged request is sent (default 95)
+# ROUTER_HEDGE_DELAY          seconds to wait before hedging while a provider has too few samples (default 2)
+# ROUTER_HEDGE=off            fail over only, never send hedged duplicates
+import os
+import time
+import asyncio
+import collections
+import logging
+from webmind.chatter import Chatter
+from webmind.resilience import ChatterError, get_breaker
+
+ROUTER_HEDGE = os.environ.get("ROUTER_HEDGE", "on").lower() not in ("off", "0", "false", "no")
+ROUTER_HEDGE_PERCENTILE = float(os.environ.get("ROUTER_HEDGE_PERCENTILE", "95"))
+ROUTER_HEDGE_DELAY = float(os.environ.get("ROUTER_HEDGE_DELAY", "2"))
+LATENCY_WINDOW = 100
+MIN_SAMPLES = 10
+# weight of the newest outcome in the moving error rate
+ERROR_DECAY = 0.1
+
+class ProviderStats:
+    """
+    Latencies of the last LATENCY_WINDOW successful calls and a moving error rate of one provider.
+    Calls cancelled because another provider answered first are kept apart, they only tell how long a call took at least.
+    """
+    def __init__(self):
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.cancelled = collections.deque(maxlen=LATENCY_WINDOW)
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency, ok):
+        self.calls += 1
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+        self.error_rate += ERROR_DECAY * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def record_cancelled(self, latency):
+        """
+        A call cancelled because another provider answered first took at least latency.
+        It is kept out of the percentiles, which would otherwise shrink toward the hedge delay.
+        """
+        self.cancelled.append(latency)
+
+    def rank_latency(self):
+        """
+        Median latency used for ranking, cancelled calls count as lower bounds so a provider that keeps losing hedges drops back.
+        None without samples.
+        """
+        samples = sorted(list(self.latencies) + list(self.cancelled))
+        if not samples:
+            return None
+        return samples[len(samples) // 2]
+
+    def percentile(self, percent):
+        """
+        Latency below which percent of the recorded calls finished, None without samples.
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "cancelled": len(self.cancelled),
+        }
+
+class ChatterRouter(Chatter):
+    """
+    Chatter sending each request to the best of several chatters, hedging slow calls and failing over on errors.
+    Routing runs on the chatter loop so its statistics are only touched from one thread.
+
+    Args:
+        chatters: Chatters of different providers, earlier ones are preferred while statistics are equal.
+        hedge: Send hedged duplicates, defaults to ROUTER_HEDGE.
+    """
+    provider = "router"
+
+    def __init__(self, chatters, hedge=None):
+        super().__init__()
+        if not chatters:
+            raise ValueError("ChatterRouter needs at least one chatter")
+        self.chatters = list(chatters)
+        self.hedge = ROUTER_HEDGE if hedge is None else hedge
+        self.provider_stats = {chatter.provider: ProviderStats() for chatter in self.chatters}
+        self.counters = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "skipped": 0}
+
+    def get_current_model(self):
+        return ",".join(f"{chatter.provider}:{chatter.get_current_model()}" for chatter in self.chatters)
+
+    def ranked(self):
+        """
+        Chatters in the order they should be tried, those with an open circuit are left out.
+        """
+        available = []
+        for position, chatter in enumerate(self.chatters):
+            if get_breaker(chatter.provider).state == "open":
+                self.counters["skipped"] += 1
+                continue
+            stats = self.provider_stats[chatter.provider]
+            median = stats.rank_latency()
+            # an untried provider ranks as fast so it gets measured
+            available.append((round(stats.error_rate, 1), median or 0.0, position, chatter))
+        return [chatter for *_, chatter in sorted(available, key=lambda item: item[:3])]
+
+    def hedge_delay(self, chatter):
+        stats = self.provider_stats[chatter.provider]
+        if len(stats.latencies) < MIN_SAMPLES:
+            return ROUTER_HEDGE_DELAY
+        return stats.percentile(ROUTER_HEDGE_PERCENTILE)
+
+    async def _timed(self, chatter, knowledge, deadline, session=None, retries=None):
+        started = time.monotonic()
+        timeout = None if deadline is None else max(deadline - started, 0.001)
+        try:
+            response = await chatter.scheduled(knowledge, timeout, session, retries)
+        except ChatterError:
+            self.provider_stats[chatter.provider].record(time.monotonic() - started, False)
+            raise
+        except asyncio.CancelledError:
+            self.provider_stats[chatter.provider].record_cancelled(time.monotonic() - started)
+            raise
+        self.provider_stats[chatter.provider].record(time.monotonic() - started, True)
+        return response
+
+    async def scheduled(self, knowledge, timeout=None, session=None):
+        """
+        Route one request, returning the first successful response.
+
+        Raises:
+            ChatterError: The last provider error when every provider failed or none was available.
+        """
+        self.counters["requests"] += 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        candidates = collections.deque(self.ranked())
+        running = {}
+        errors = []
+
+        def launch():
+            if not candidates:
+                return None
+            chatter = candidates.popleft()
+            # failing over is faster than backing off, only the last provider left retries on its own
+            retries = 0 if candidates else None
+            running[asyncio.ensure_future(self._timed(chatter, knowledge, deadline, session, retries))] = chatter
+            return chatter
+
+        current = launch()
+        if current is None:
+            raise ChatterError(self.provider, "no provider available, every circuit is open")
+        hedges = set()
+        hedged = not self.hedge
+        try:
+            while running:
+                # one hedge per request, timed by the provider currently answering
+                wait = self.hedge_delay(current) if not hedged else None
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    hedge = launch()
+                    if hedge is not None:
+                        hedges.add(hedge)
+                        self.counters["hedges"] += 1
+                    continue
+                for task in done:
+                    chatter = running.pop(task)
+                    try:
+                        response = task.result()
+                    except ChatterError as e:
+                        logging.warning(f"router: {e}")
+                        errors.append(e)
+                        continue
+                    if chatter in hedges:
+                        self.counters["hedge_wins"] += 1
+                    return response
+                if not running:
+                    current = launch()
+                    if current is not None:
+                        self.counters["failovers"] += 1
+        finally:
+            for task in running:
+                task.cancel()
+        raise errors[-1]
+
+    async def scheduled_stream(self, knowledge, timeout=None, session=None):
+        """
+        Stream from the best provider, failing over to the next one while no token has been delivered.
+        Streams are not hedged, two providers writing into one message would interleave.
+
+        Raises:
+            ChatterError: The last provider error when every provider failed or none was available.
+        """
+        self.counters["requests"] += 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        error = ChatterError(self.provider, "no provider available, every circuit is open")
+        candidates = self.ranked()
+        for position, chatter in enumerate(candidates):
+            if position:
+                self.counters["failovers"] += 1
+            stats = self.provider_stats[chatter.provider]
+            started = time.monotonic()
+            remaining = None if deadline is None else max(deadline - started, 0.001)
+            delivered = False
+            try:
+                # failing over is faster than backing off, only the last provider retries on its own
+                retries = 0 if position < len(candidates) - 1 else None
+                async for token in chatter.scheduled_stream(knowledge, remaining, session, retries):
+                    delivered = True
+                    yield token
+            except ChatterError as e:
+                stats.record(time.monotonic() - started, False)
+                if delivered:
+                    raise
+                logging.warning(f"router: {e}")
+                error = e
+                continue
+            stats.record(time.monotonic() - started, True)
+            return
+        raise error
+
+    def stats(self):
+        """
+        Router counters with latency percentiles and error rates per provider.
+        """
+        stats = dict(self.counters)
+        stats["providers"] = {provider: provider_stats.stats() for provider, provider_stats in self.provider_stats.items()}
+        return stats
@@ -0,0 +1,125 @@
+# singleflight.py (c) 2024 Gregory L. Magnusson MIT licence
+# coalescing of identical in-flight requests for the chatter path
+# ezAGI send(), main_loop and reasoning_loop often ask the same prompt two or three times at once
+# concurrent calls with the same key share one upstream call and its result or exception
+# every caller gets its own copy of the result so one caller cannot change what another sees
+# async callers are cancellation safe: a cancelled caller stops waiting while the shared call keeps
+# running for the others, and the shared call is cancelled only when every caller has gone
+import copy
+import asyncio
+import threading
+
+def _own(result):
+    # strings and numbers are immutable and already safe to share
+    if isinstance(result, (str, bytes, int, float, bool, type(None))):
+        return result
+    return copy.deepcopy(result)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = 1
+
+class SingleFlight:
+    """
+    Runs one call per key at a time, callers arriving while it runs wait for its outcome.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.flights = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    def call(self, key, function, *args, **kwargs):
+        """
+        Blocking form for chatters run in worker threads.
+
+        Returns:
+            The result of function(*args, **kwargs), run once for all concurrent callers with key.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = _Call()
+                self.calls[key] = call
+                leader = True
+                self.counters["calls"] += 1
+            else:
+                call.callers += 1
+                leader = False
+                self.counters["coalesced"] += 1
+        if leader:
+            try:
+                call.result = function(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return _own(call.result)
+
+    async def call_async(self, key, factory):
+        """
+        Awaitable form, factory() returns the coroutine of the upstream call and is only used by the first caller.
+        Flights are kept per event loop because a task belongs to the loop that created it.
+
+        Returns:
+            The result of the shared upstream call.
+        """
+        flight_key = (asyncio.get_running_loop(), key)
+        with self.lock:
+            flight = self.flights.get(flight_key)
+            if flight is None:
+                task = asyncio.ensure_future(factory())
+                flight = self.flights[flight_key] = [task, 0]
+                task.add_done_callback(lambda _, flight=flight: self._land(flight_key, flight))
+                self.counters["calls"] += 1
+            else:
+                self.counters["coalesced"] += 1
+            flight[1] += 1
+        task = flight[0]
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self.lock:
+                flight[1] -= 1
+                abandoned = flight[1] == 0 and not task.done()
+                if abandoned and self.flights.get(flight_key) is flight:
+                    # later callers start a fresh call instead of joining one being cancelled
+                    del self.flights[flight_key]
+            if abandoned:
+                task.cancel()
+            raise
+        except BaseException:
+            with self.lock:
+                flight[1] -= 1
+            raise
+        with self.lock:
+            flight[1] -= 1
+        return _own(result)
+
+    def _land(self, flight_key, flight):
+        with self.lock:
+            if self.flights.get(flight_key) is flight:
+                del self.flights[flight_key]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self.calls) + len(self.flights)
+        return stats
+
+_single_flight = SingleFlight()
+
+def get_single_flight():
+    """
+    Return the SingleFlight shared by every chatter.
+    """
+    return _single_flight